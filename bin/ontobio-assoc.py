@@ -346,10 +346,10 @@ def create_intersection_matrix(ont, aset, args):
     if yterms is None or len(yterms) == 0:
         yterms = xterms
     logging.info("X={} Y={}".format(xterms,yterms))
-    ilist = aset.query_intersections(x_terms=xterms, y_terms=yterms)
-    z, xaxis, yaxis = aset.intersectionlist_to_matrix(ilist, xterms, yterms)
-    xaxis = mk_axis(xaxis, aset, args)
-    yaxis = mk_axis(yaxis, aset, args)
+    (_, jaccard) = aset.intersection_matrix(xterms, yterms)
+    z = jaccard.values.T.tolist()
+    xaxis = mk_axis(xterms, aset, args)
+    yaxis = mk_axis(yterms, aset, args)
     return (z, xaxis, yaxis)
 
 def plot_intersections(ont, aset, args):
@@ -6,6 +6,7 @@ import os
 import yaml
 import requests
 import gzip
+import io
 import urllib
 import shutil
 import re
@@ -184,6 +185,104 @@ def unzip(path, target):
                 tf.write(chunk)
 
 
+def progress_lines(path):
+    """
+    Yields the lines of the file at `path`, showing a progress bar of bytes read.
+
+    Files ending in .gz are decompressed as they are read, and progress is over the compressed bytes.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as raw:
+        stream = gzip.GzipFile(fileobj=raw) if path.endswith(".gz") else raw
+        with click.progressbar(length=size) as bar:
+            done = 0
+            for (i, line) in enumerate(io.TextIOWrapper(stream, encoding="utf-8")):
+                yield line
+                if i % 1000 == 0:
+                    position = raw.tell()
+                    bar.update(position - done)
+                    done = position
+            bar.update(size - done)
+
+
+class ProductWriter(object):
+    """
+    Writes each association it is given to the GPI, GPAD and TTL products of a dataset.
+
+    Passed to `produce_gaf`, this makes the products while the source is validated,
+    rather than by parsing the valid GAF again for each product.
+    """
+
+    def __init__(self, dataset, target_dir, gpi=True, gpad=False, ttl=False):
+        self.gpi_path = None
+        self.gpiwriter = None
+        if gpi:
+            self.gpi_path = os.path.join(target_dir, "{}.gpi".format(dataset))
+            self.bridge = gafgpibridge.GafGpiBridge()
+            self.gpiwriter = entitywriter.GpiWriter(file=open(self.gpi_path, "w"))
+            self.gpi_cache = set()
+
+        self.gpad_path = None
+        self.gpadwriter = None
+        if gpad:
+            self.gpad_path = os.path.join(target_dir, "{}.gpad".format(dataset))
+            click.echo("Setting up {}".format(self.gpad_path))
+            self.gpadwriter = GpadWriter(file=open(self.gpad_path, "w"))
+
+        self.ttl_path = None
+        self.transformer = None
+        if ttl:
+            self.ttl_path = os.path.join(target_dir, "{}_cam.ttl".format(dataset))
+            click.echo("Setting up {}".format(self.ttl_path))
+            self.rdf_writer = assoc_rdfgen.TurtleRdfWriter(label=os.path.split(self.ttl_path)[1])
+            self.transformer = assoc_rdfgen.CamRdfTransform(writer=self.rdf_writer)
+
+    def write_assoc(self, association):
+        if self.gpiwriter is not None:
+            entity = self.bridge.convert_association(association)
+            if entity not in self.gpi_cache and entity is not None:
+                # If the entity is not in the cache, add it and write it out
+                self.gpi_cache.add(entity)
+                self.gpiwriter.write_entity(entity)
+
+        if self.gpadwriter is not None:
+            self.gpadwriter.write_assoc(association)
+
+        if self.transformer is not None:
+            if "header" not in association or not association["header"]:
+                self.transformer.provenance()
+                self.transformer.translate(association)
+
+    def finish_gpi(self):
+        """
+        Closes and zips the GPI, returning its path. Later associations are not added to the GPI
+        """
+        if self.gpiwriter is not None:
+            self.gpiwriter.file.close()
+            self.gpiwriter = None
+            tools.zipup(self.gpi_path)
+        return self.gpi_path
+
+    def finish(self):
+        """
+        Closes and zips all products, returning the paths of the GPAD and TTL products made
+        """
+        self.finish_gpi()
+        if self.gpadwriter is not None:
+            self.gpadwriter.file.close()
+            self.gpadwriter = None
+            tools.zipup(self.gpad_path)
+
+        if self.transformer is not None:
+            click.echo("Writing ttl to disk")
+            with open(self.ttl_path, "wb") as ttl:
+                self.rdf_writer.serialize(destination=ttl)
+            self.transformer = None
+            tools.zipup(self.ttl_path)
+
+        return [path for path in [self.gpad_path, self.ttl_path] if path is not None]
+
+
 def create_parser(config, group, dataset, format="gaf"):
     if format == "gpad":
         return GpadParser(config=config, group=group, dataset=dataset)
@@ -196,7 +295,7 @@ def create_parser(config, group, dataset, format="gaf"):
 Produce validated gaf using the gaf parser/
 """
 @tools.gzips
-def produce_gaf(dataset, source_gaf, ontology_graph, gpipath=None, paint=False, group="unknown", rule_metadata=None, goref_metadata=None, db_entities=None, group_idspace=None, format="gaf", suppress_rule_reporting_tags=[], annotation_inferences=None, group_metadata=None, extensions_constraints=None, rule_contexts=[]):
+def produce_gaf(dataset, source_gaf, ontology_graph, gpipath=None, paint=False, group="unknown", rule_metadata=None, goref_metadata=None, db_entities=None, group_idspace=None, format="gaf", suppress_rule_reporting_tags=[], annotation_inferences=None, group_metadata=None, extensions_constraints=None, rule_contexts=[], processes=1, report_sample_size=None, product_writer=None):
     filtered_associations = open(os.path.join(os.path.split(source_gaf)[0], "{}_noiea.gaf".format(dataset)), "w")
     config = assocparser.AssocParserConfig(
         ontology=ontology_graph,
@@ -212,7 +311,8 @@ def produce_gaf(dataset, source_gaf, ontology_graph, gpipath=None, paint=False,
         annotation_inferences=annotation_inferences,
         group_metadata=group_metadata,
         extensions_constraints=extensions_constraints,
-        rule_contexts=rule_contexts
+        rule_contexts=rule_contexts,
+        report_sample_size=report_sample_size
     )
     logger.info("Producing {}".format(source_gaf))
     logger.info("AssocParserConfig used: {}".format(config))
@@ -223,13 +323,15 @@ def produce_gaf(dataset, source_gaf, ontology_graph, gpipath=None, paint=False,
 
     click.echo("Validating source {}: {}".format(format, source_gaf))
     parser = create_parser(config, group, dataset, format)
-    with open(source_gaf) as sg:
-        lines = sum(1 for line in sg)
-
-    with open(source_gaf) as gaf:
-        with click.progressbar(iterable=parser.association_generator(file=gaf), length=lines) as associations:
-            for assoc in associations:
-                gafwriter.write_assoc(assoc)
+    if processes > 1:
+        # Output and report are identical to the serial run below
+        for n in parser.parallel_write(progress_lines(source_gaf), gafwriter, processes=processes, sink=product_writer):
+            pass
+    else:
+        for assoc in parser.association_generator(file=progress_lines(source_gaf)):
+            gafwriter.write_assoc(assoc)
+            if product_writer is not None:
+                product_writer.write_assoc(assoc)
 
     outfile.close()
     filtered_associations.close()
@@ -260,117 +362,55 @@ def produce_gaf(dataset, source_gaf, ontology_graph, gpipath=None, paint=False,
     return [validated_gaf_path, filtered_associations.name]
 
 
-@tools.gzips
 def make_products(dataset, target_dir, gaf_path, products, ontology_graph):
+    """
+    Makes the GPAD and TTL products from an existing GAF. `produce` makes these with a
+    ProductWriter while validating instead, so the GAF is not parsed again
+    """
+    if not products["gpad"] and not products["ttl"]:
+        # Bail if we have no products
+        return []
+
     gafparser = GafParser()
     gafparser.config = assocparser.AssocParserConfig(
         ontology=ontology_graph,
         paint=True
     )
 
-    with open(gaf_path) as sg:
-        lines = sum(1 for line in sg)
+    click.echo("Using {} as the gaf to build data products with".format(gaf_path))
+    product_writer = ProductWriter(dataset, os.path.split(gaf_path)[0], gpi=False, gpad=products["gpad"], ttl=products["ttl"])
+    click.echo("Making products...")
+    for association in gafparser.association_generator(file=progress_lines(gaf_path)):
+        product_writer.write_assoc(association)
 
-    product_files = {
-        "gpad": open(os.path.join(os.path.split(gaf_path)[0], "{}.gpad".format(dataset)), "w"),
-        "ttl": open(os.path.join(os.path.split(gaf_path)[0], "{}_cam.ttl".format(dataset)), "wb")
-    }
-
-    if not products["gpad"] and not products["ttl"]:
-        # Bail if we have no products
-        return []
-
-    # def write_gpi_entity(association, bridge, gpiwriter):
-    with open(gaf_path) as gf:
-        # gpi info:
-        click.echo("Using {} as the gaf to build data products with".format(gaf_path))
-        if products["ttl"]:
-            click.echo("Setting up {}".format(product_files["ttl"].name))
-            rdf_writer = assoc_rdfgen.TurtleRdfWriter(label=os.path.split(product_files["ttl"].name)[1] )
-            transformer = assoc_rdfgen.CamRdfTransform(writer=rdf_writer)
-            parser_config = assocparser.AssocParserConfig(ontology=ontology_graph)
-
-        if products["gpad"]:
-            click.echo("Setting up {}".format(product_files["gpad"].name))
-            gpadwriter = GpadWriter(file=product_files["gpad"])
-
-        click.echo("Making products...")
-        with click.progressbar(iterable=gafparser.association_generator(file=gf), length=lines) as associations:
-            for association in associations:
-                if products["ttl"]:
-                    if "header" not in association or not association["header"]:
-                        transformer.provenance()
-                        transformer.translate(association)
-
-                if products["gpad"]:
-                    gpadwriter.write_assoc(association)
-
-        # post ttl steps
-        if products["ttl"]:
-            click.echo("Writing ttl to disk")
-            rdf_writer.serialize(destination=product_files["ttl"])
+    return product_writer.finish()
 
-        # After we run through associations
-        for f in product_files.values():
-            f.close()
-
-    return [product_files[prod].name for prod in sorted(product_files.keys()) if products[prod]]
-
-@tools.gzips
 def produce_gpi(dataset, target_dir, gaf_path, ontology_graph):
     gafparser = GafParser()
     gafparser.config = assocparser.AssocParserConfig(
         ontology=ontology_graph
     )
-    with open(gaf_path) as sg:
-        lines = sum(1 for line in sg)
-
-    gpi_path = os.path.join(os.path.split(gaf_path)[0], "{}.gpi".format(dataset))
-    with open(gaf_path) as gf, open(gpi_path, "w") as gpi:
-        click.echo("Using {} as the gaf to build gpi with".format(gaf_path))
-        bridge = gafgpibridge.GafGpiBridge()
-        gpiwriter = entitywriter.GpiWriter(file=gpi)
-        gpi_cache = set()
 
-        with click.progressbar(iterable=gafparser.association_generator(file=gf), length=lines) as associations:
-            for association in associations:
-                entity = bridge.convert_association(association)
-                if entity not in gpi_cache and entity is not None:
-                    # If the entity is not in the cache, add it and write it out
-                    gpi_cache.add(entity)
-                    gpiwriter.write_entity(entity)
+    click.echo("Using {} as the gaf to build gpi with".format(gaf_path))
+    product_writer = ProductWriter(dataset, os.path.split(gaf_path)[0])
+    for association in gafparser.association_generator(file=progress_lines(gaf_path)):
+        product_writer.write_assoc(association)
 
-    return gpi_path
+    return product_writer.finish_gpi()
 
 
-@tools.gzips
 def produce_ttl(dataset, target_dir, gaf_path, ontology_graph):
     gafparser = GafParser()
     gafparser.config = assocparser.AssocParserConfig(
         ontology=ontology_graph
     )
 
-    with open(gaf_path) as sg:
-        lines = sum(1 for line in sg)
-
-    ttl_path = os.path.join(os.path.split(gaf_path)[0], "{}_cam.ttl".format(dataset))
-    click.echo("Producing ttl: {}".format(ttl_path))
-    rdf_writer = assoc_rdfgen.TurtleRdfWriter()
-    transformer = assoc_rdfgen.CamRdfTransform(writer=rdf_writer)
-    parser_config = assocparser.AssocParserConfig(ontology=ontology_graph)
-
-    with open(gaf_path) as gf:
-        with click.progressbar(iterable=gafparser.association_generator(file=gf), length=lines) as associations:
-            for association in associations:
-                if "header" not in association or not association["header"]:
-                    transformer.provenance()
-                    transformer.translate(association)
-
-    with open(ttl_path, "wb") as ttl:
-        click.echo("Writing ttl to disk")
-        rdf_writer.serialize(destination=ttl)
+    product_writer = ProductWriter(dataset, os.path.split(gaf_path)[0], gpi=False, ttl=True)
+    click.echo("Producing ttl: {}".format(product_writer.ttl_path))
+    for association in gafparser.association_generator(file=progress_lines(gaf_path)):
+        product_writer.write_assoc(association)
 
-    return ttl_path
+    return product_writer.finish()[0]
 
 
 @tools.gzips
@@ -430,7 +470,7 @@ def merge_all_mixin_gaf_into_mod_gaf(valid_gaf_path, mixin_gaf_paths):
 
     return merged_path
 
-def mixin_a_dataset(valid_gaf, mixin_metadata_list, group_id, dataset, target, ontology, gpipath=None, base_download_url=None, rule_metadata={}, replace_existing_files=True, rule_contexts=[]):
+def mixin_a_dataset(valid_gaf, mixin_metadata_list, group_id, dataset, target, ontology, gpipath=None, base_download_url=None, rule_metadata={}, replace_existing_files=True, rule_contexts=[], product_writer=None):
 
     end_gaf = valid_gaf
     mixin_gaf_paths = []
@@ -442,7 +482,7 @@ def mixin_a_dataset(valid_gaf, mixin_metadata_list, group_id, dataset, target, o
             mixin_dataset_id = mixin_dataset_metadata["dataset"]
             format = mixin_dataset_metadata["type"]
             context = ["import"] if mixin_metadata.get("import", False) else []
-            mixin_gaf = produce_gaf(mixin_dataset_id, mixin_src, ontology, gpipath=gpipath, paint=True, group=mixin_metadata["id"], rule_metadata=rule_metadata, format=format, rule_contexts=context)[0]
+            mixin_gaf = produce_gaf(mixin_dataset_id, mixin_src, ontology, gpipath=gpipath, paint=True, group=mixin_metadata["id"], rule_metadata=rule_metadata, format=format, rule_contexts=context, product_writer=product_writer)[0]
             mixin_gaf_paths.append(mixin_gaf)
 
     if mixin_gaf_paths:
@@ -476,7 +516,9 @@ def cli(ctx, verbose):
 @click.option("--skip-existing-files", "-K", is_flag=True, default=False, help="When downloading files, if a file already exists it won't downloaded over")
 @click.option("--gaferencer-file", "-I", type=click.Path(exists=True), default=None, required=False, help="Path to Gaferencer output to be used for inferences")
 @click.option("--only-dataset", default=None)
-def produce(ctx, group, metadata_dir, gpad, ttl, target, ontology, exclude, base_download_url, suppress_rule_reporting_tag, skip_existing_files, gaferencer_file, only_dataset):
+@click.option("--processes", "-p", type=int, default=1, help="Number of processes used to validate each source GAF")
+@click.option("--report-sample-size", type=int, default=None, help="Count all report messages, but only keep a random sample of this many per rule")
+def produce(ctx, group, metadata_dir, gpad, ttl, target, ontology, exclude, base_download_url, suppress_rule_reporting_tag, skip_existing_files, gaferencer_file, only_dataset, processes, report_sample_size):
 
     logger.info("Logging is verbose")
     products = {
@@ -520,6 +562,8 @@ def produce(ctx, group, metadata_dir, gpad, ttl, target, ontology, exclude, base
         dataset = dataset_metadata["dataset"]
         # Set paint to True when the group is "paint".
         # This will prevent filtering of IBA (GO_RULE:26) when paint is being treated as a top level group, like for paint_other.
+        # GPI, GPAD and TTL products are written as the source (and then the mixins) are validated
+        product_writer = ProductWriter(dataset, os.path.split(source_gaf)[0], gpad=products["gpad"], ttl=products["ttl"])
         valid_gaf = produce_gaf(dataset, source_gaf, ontology_graph,
             paint=(group=="paint"),
             group=group,
@@ -531,13 +575,17 @@ def produce(ctx, group, metadata_dir, gpad, ttl, target, ontology, exclude, base
             annotation_inferences=gaferences,
             group_metadata=group_metadata,
             extensions_constraints=extensions_constraints,
-            rule_contexts=["import"] if dataset_metadata.get("import", False) else []
+            rule_contexts=["import"] if dataset_metadata.get("import", False) else [],
+            processes=processes,
+            report_sample_size=report_sample_size,
+            product_writer=product_writer
             )[0]
 
-        gpi = produce_gpi(dataset, absolute_target, valid_gaf, ontology_graph)
+        # The GPI only covers the dataset itself; mixins are validated against it
+        gpi = product_writer.finish_gpi()
 
-        end_gaf = mixin_a_dataset(valid_gaf, mixin_metadata_list, group_metadata["id"], dataset, absolute_target, ontology_graph, gpipath=gpi, base_download_url=base_download_url, rule_metadata=rule_metadata, replace_existing_files=not skip_existing_files)
-        make_products(dataset, absolute_target, end_gaf, products, ontology_graph)
+        end_gaf = mixin_a_dataset(valid_gaf, mixin_metadata_list, group_metadata["id"], dataset, absolute_target, ontology_graph, gpipath=gpi, base_download_url=base_download_url, rule_metadata=rule_metadata, replace_existing_files=not skip_existing_files, product_writer=product_writer)
+        product_writer.finish()
 
 
 
@@ -162,8 +162,8 @@ class AssociationSetFactory():
         logger.info("Parsing {} with {}/{}".format(file, fmt, parser))
 
         if skim:
-            results = parser.skim(file)
-            return self.create_from_tuples(results, **args)
+            (amap, subject_label_map) = parser.skim_association_map(file)
+            return AssociationSet(subject_label_map=subject_label_map, association_map=amap, **args)
         else:
             assocs = parser.parse(file, skipheader=True)
             return self.create_from_assocs(assocs, **args)
@@ -13,7 +13,11 @@ taxa of interest or evidence criteria.
 
 """
 import logging
+import multiprocessing
+import numpy as np
 import scipy.stats # TODO - move
+import scipy.sparse
+import scipy.special
 import scipy as sp # TODO - move
 import pandas as pd
 
@@ -23,6 +27,143 @@ logger = logging.getLogger(__name__)
 class UnknownSubjectException(Exception):
     pass
 
+
+_indexing_ontology = None
+
+def _init_indexing_worker(ontology):
+    # runs in each forked worker; the ontology is inherited, not pickled
+    global _indexing_ontology
+    _indexing_ontology = ontology
+
+def _ancestors_chunk(terms):
+    return [_indexing_ontology.ancestors(t) for t in terms]
+
+def _parallel_ancestors(ontology, terms, processes, chunk_size=1000):
+    """
+    Returns a dict of term -> ancestors, computed in a pool of forked processes
+    """
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        return {}
+    chunks = [terms[i:i + chunk_size] for i in range(0, len(terms), chunk_size)]
+    closures = {}
+    with context.Pool(processes, initializer=_init_indexing_worker, initargs=(ontology,)) as pool:
+        for (chunk, ancs_list) in zip(chunks, pool.map(_ancestors_chunk, chunks)):
+            closures.update(zip(chunk, ancs_list))
+    return closures
+
+def _log_binom(n, k):
+    return sp.special.gammaln(n + 1) - sp.special.gammaln(k + 1) - sp.special.gammaln(n - k + 1)
+
+def hypergeom_pvalues(a, M, N, n, direction='greater', block_size=1 << 22):
+    """
+    Vectorized one-sided or two-sided hypergeometric test
+
+    For each i, equivalent to the p-value of scipy.stats.fisher_exact for the table
+    [[a[i], N-a[i]], [n[i]-a[i], M-N-n[i]+a[i]]], but computed for all
+    tables at once by summing the hypergeometric pmf over the tail.
+
+    Arguments
+    ---------
+    a : array
+        number of sample members in each class
+    M : int
+        background size
+    N : int
+        sample size
+    n : array
+        number of background members in each class
+    direction : 'greater', 'less' or 'two-sided'
+    block_size : int
+        maximum number of pmf terms evaluated at once
+
+    Returns: array of p-values
+    """
+    a = np.asarray(a, dtype=np.int64)
+    n = np.asarray(n, dtype=np.int64)
+    support_lo = np.maximum(0, N - (M - n))
+    support_hi = np.minimum(n, N)
+    if direction == 'greater':
+        (k_lo, k_hi) = (a, support_hi)
+    elif direction == 'less':
+        (k_lo, k_hi) = (support_lo, a)
+    elif direction == 'two-sided':
+        (k_lo, k_hi) = (support_lo, support_hi)
+    else:
+        raise ValueError("direction must be 'greater', 'less' or 'two-sided': {}".format(direction))
+    log_total = _log_binom(M, N)
+    p = np.zeros(len(a))
+    width = int((k_hi - k_lo).max()) + 1 if len(a) > 0 else 1
+    step = max(1, block_size // width)
+    for start in range(0, len(a), step):
+        block = slice(start, start + step)
+        lo = k_lo[block, None]
+        hi = k_hi[block, None]
+        nb = n[block, None]
+        k = np.minimum(lo + np.arange(int((hi - lo).max()) + 1), hi)
+        pmf = np.exp(_log_binom(nb, k) + _log_binom(M - nb, N - k) - log_total)
+        pmf[lo + np.arange(k.shape[1]) > hi] = 0.0
+        if direction == 'two-sided':
+            ab = a[block, None]
+            p_observed = np.exp(_log_binom(nb, ab) + _log_binom(M - nb, N - ab) - log_total)
+            # tables no more likely than the observed one, allowing for rounding
+            pmf[pmf > p_observed * (1 + 1e-7)] = 0.0
+        p[block] = pmf.sum(axis=1)
+    return np.minimum(p, 1.0)
+
+
+def intersection_blocks(X, Y=None, block_size=1 << 22):
+    """
+    Sizes of the pairwise intersections of two collections of sets, in blocks
+
+    Intersections are computed as sparse matrix products, and Jaccard
+    indexes from the sizes of the sets.
+
+    Arguments
+    ---------
+    X : sparse matrix
+        one row per set, with a nonzero in column j if the set has member j
+    Y : sparse matrix
+        as X, with the same columns. If None, X is compared with itself, and
+        only the upper triangle (including the diagonal) is computed
+    block_size : int
+        maximum number of pairs computed at once
+
+    Yields
+    ------
+    (start, counts, jaccard)
+        for rows start, start+1, ... of X, dense arrays of the intersection
+        sizes and Jaccard indexes with each row of Y. If Y is None, entries
+        below the diagonal are 0
+    """
+    def binary(m):
+        m = sp.sparse.csr_matrix(m, copy=True)
+        m.eliminate_zeros()
+        m.data = np.ones(len(m.data), dtype=np.int64)
+        return m
+
+    symmetric = Y is None
+    X = binary(X)
+    Y = X if symmetric else binary(Y)
+    x_sizes = np.diff(X.indptr)
+    y_sizes = np.diff(Y.indptr)
+    YT = Y.T.tocsc()
+    step = max(1, block_size // max(Y.shape[0], 1))
+    for start in range(0, X.shape[0], step):
+        end = min(start + step, X.shape[0])
+        counts = np.zeros((end - start, Y.shape[0]), dtype=np.int64)
+        # in the upper triangle, columns before start are below the diagonal
+        c0 = start if symmetric else 0
+        counts[:, c0:] = (X[start:end] @ YT[:, c0:]).toarray()
+        if symmetric:
+            upper = counts[:, c0:]
+            upper[np.tril_indices(end - start, -1, m=upper.shape[1])] = 0
+        union = x_sizes[start:end, None] + y_sizes[None, :] - counts
+        jaccard = np.divide(counts, union, out=np.zeros(counts.shape), where=union > 0)
+        yield (start, counts, jaccard)
+
+
 class AssociationSet():
     """An object that represents a collection of associations
 
@@ -32,7 +173,13 @@ class AssociationSet():
 
     """
 
-    def __init__(self, ontology=None, association_map=None, subject_label_map=None, meta=None):
+    # (matrix, subject_index, class_ids, class_index, class_counts); see incidence_matrix
+    _incidence = None
+
+    # term -> ancestors; see termset_ancestors
+    _closure_cache = None
+
+    def __init__(self, ontology=None, association_map=None, subject_label_map=None, meta=None, index_processes=1):
         """
         NOTE: in general you do not need to call this yourself. See assoc_factory
 
@@ -41,6 +188,7 @@ class AssociationSet():
          - an ontology (e.g. GO, HP)
          - a map between subjects (e.g genes) and sets/lists of term IDs
 
+        index_processes is passed to `index`
         """
         self.ontology = ontology
         self.association_map = association_map
@@ -50,7 +198,7 @@ class AssociationSet():
         self.associations_by_subj = None
         self.associations_by_subj_obj = None
         self.strict = False
-        self.index()
+        self.index(processes=index_processes)
 
         if self.association_map is None:
             self.association_map = {}
@@ -61,18 +209,35 @@ class AssociationSet():
         imap = self.subject_to_inferred_map
         return "AssocSet |S|={} |S->I|={}".format(len(imap.keys()), len(imap.items()))
 
-    def index(self):
+    def index(self, processes=1):
         """
         Creates indexes based on inferred terms.
 
         You do not need to call this yourself; called on initialization
+
+        The ancestors of each distinct annotated term are computed once,
+        and kept for `termset_ancestors`. If the ontology has a closure
+        index (see `Ontology.build_closure_index`) it is used.
+
+        Arguments
+        ---------
+        processes : int
+            if greater than 1, ancestors of the annotated terms are computed in this many processes
         """
+        self._incidence = None
+        self._closure_cache = {}
         self.subjects = list(self.association_map.keys())
 
         # ensure annotations unique
         for (subj,terms) in self.association_map.items():
             self.association_map[subj] = list(set(self.association_map[subj]))
-            
+
+        if processes > 1 and self.ontology is not None:
+            terms = set()
+            for ts in self.association_map.values():
+                terms.update(ts)
+            self._closure_cache = _parallel_ancestors(self.ontology, list(terms), processes)
+
         logger.info("Indexing {} items".format(len(self.subjects)))
         n = 0
         all_objs = set()
@@ -87,6 +252,54 @@ class AssociationSet():
                 logger.info("[TRUNCATING>5]....")
         self.objects = all_objs
 
+    def incidence_matrix(self):
+        """
+        Returns a sparse subject by class matrix of inferred types
+
+        Computed once, and recomputed if the association set is re-indexed.
+
+        Returns
+        -------
+        (matrix, subject_index, class_ids, class_index)
+
+        matrix is a scipy.sparse CSR matrix, with a 1 in row i, column j if
+        subject i has class j as an inferred type. Rows are in the order of
+        self.subjects; subject_index maps subject ids to rows. Columns are
+        sorted class ids; class_index maps class ids to columns.
+        """
+        if self._incidence is None:
+            class_ids = sorted(self.objects)
+            class_index = {c: j for (j, c) in enumerate(class_ids)}
+            subject_index = {s: i for (i, s) in enumerate(self.subjects)}
+            indptr = np.zeros(len(self.subjects) + 1, dtype=np.int64)
+            indices = []
+            for (i, s) in enumerate(self.subjects):
+                cols = sorted(class_index[c] for c in self.inferred_types(s))
+                indices += cols
+                indptr[i+1] = indptr[i] + len(cols)
+            indices = np.array(indices, dtype=np.int32)
+            matrix = sp.sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr),
+                                          shape=(len(self.subjects), len(class_ids)))
+            # number of subjects per class, for the default background
+            class_counts = np.bincount(indices, minlength=len(class_ids))
+            self._incidence = (matrix, subject_index, class_ids, class_index, class_counts)
+        (matrix, subject_index, class_ids, class_index, _) = self._incidence
+        return (matrix, subject_index, class_ids, class_index)
+
+    def _class_counts(self, subjects):
+        """
+        Returns (number of subjects with each class as inferred type, as an array indexed by column of incidence_matrix; number of subjects)
+        """
+        (matrix, subject_index, _, _) = self.incidence_matrix()
+        rows = []
+        for s in subjects:
+            if s in subject_index:
+                rows.append(subject_index[s])
+            elif self.strict:
+                raise UnknownSubjectException(s)
+        counts = np.bincount(matrix[rows].indices, minlength=matrix.shape[1])
+        return (counts, len(subjects))
+
     def inferred_types(self, subj):
         """
         Returns: set of reflexive inferred types for a subject.
@@ -120,10 +333,17 @@ class AssociationSet():
 
         Returns: set of class IDs
         """
-        ancs = set()
+        if self._closure_cache is None:
+            self._closure_cache = {}
+        cache = self._closure_cache
+        ancs = set(terms)
         for term in terms:
-            ancs = ancs.union(self.ontology.ancestors(term))
-        return ancs.union(set(terms))
+            term_ancs = cache.get(term)
+            if term_ancs is None:
+                term_ancs = self.ontology.ancestors(term)
+                cache[term] = term_ancs
+            ancs.update(term_ancs)
+        return ancs
 
     def query_associations(self, subjects=None, infer_subjects=True, include_xrefs=True):
         """
@@ -226,7 +446,7 @@ class AssociationSet():
                     matches.append(subj)
         return matches
 
-    def query_intersections(self, x_terms=None, y_terms=None, symmetric=False):
+    def query_intersections(self, x_terms=None, y_terms=None, symmetric=False, shared=False):
         """
         Query for intersections of terms in two lists
 
@@ -235,39 +455,79 @@ class AssociationSet():
          - y : term from y
          - c : count of intersection
          - j : jaccard score
+         - shared : set of subjects in the intersection; only if shared is True
+
+        See `intersection_matrix` to get counts and scores as matrices
         """
         if x_terms is None:
             x_terms = []
         if y_terms is None:
             y_terms = []
-        xset = set(x_terms)
-        yset = set(y_terms)
-        zset = xset.union(yset)
-
-        # first built map of gene->termClosure.
-        # this could be calculated ahead of time for all g,
-        # but this may be space-expensive. TODO: benchmark
-        gmap={}
-        for z in zset:
-            gmap[z] = []
-        for subj in self.subjects:
-            ancs = self.inferred_types(subj)
-            for a in ancs.intersection(zset):
-                gmap[a].append(subj)
-        for z in zset:
-            gmap[z] = set(gmap[z])
+        (counts, jaccard) = self.intersection_matrix(x_terms, y_terms)
+        (counts, jaccard) = (counts.values, jaccard.values)
+        if shared:
+            xrows = self._term_rows(x_terms)
+            yrows = self._term_rows(y_terms)
         ilist = []
-        for x in x_terms:
-            for y in y_terms:
+        for (i, x) in enumerate(x_terms):
+            for (k, y) in enumerate(y_terms):
                 if not symmetric or x<y:
-                    shared = gmap[x].intersection(gmap[y])
-                    union = gmap[x].union(gmap[y])
-                    j = 0
-                    if len(union)>0:
-                        j = len(shared) / len(union)
-                    ilist.append({'x':x,'y':y,'shared':shared, 'c':len(shared), 'j':j})
+                    r = {'x':x, 'y':y, 'c':int(counts[i, k]), 'j':float(jaccard[i, k])}
+                    if shared:
+                        common = np.intersect1d(xrows[i].indices, yrows[k].indices)
+                        r['shared'] = set(self.subjects[n] for n in common)
+                    ilist.append(r)
         return ilist
 
+    def intersection_matrix(self, x_terms, y_terms=None, chunked=False, block_size=1 << 22):
+        """
+        Number of subjects shared by each pair of terms, and their Jaccard similarity
+
+        A subject has a term if the term is one of its inferred types
+
+        Arguments
+        ---------
+        x_terms : list
+            class ids
+        y_terms : list
+            class ids. If None, x_terms are compared with each other; as the
+            matrix is symmetric, only its upper triangle is computed
+        chunked : bool
+            if True, return a generator of (counts, jaccard) for consecutive
+            blocks of x_terms, rather than the whole matrix. If y_terms is
+            None, blocks only have values in the upper triangle
+        block_size : int
+            maximum number of pairs computed at once
+
+        Returns
+        -------
+        (counts, jaccard)
+            DataFrames indexed by x_terms, with y_terms as columns
+        """
+        return self._pairwise_matrix(self._term_rows(x_terms),
+                                     None if y_terms is None else self._term_rows(y_terms),
+                                     x_terms, y_terms, chunked, block_size)
+
+    def _pairwise_matrix(self, X, Y, x_ids, y_ids, chunked, block_size):
+        x_ids = list(x_ids)
+        y_ids = x_ids if Y is None else list(y_ids)
+        blocks = intersection_blocks(X, Y, block_size=block_size)
+        if chunked:
+            return ((pd.DataFrame(c, index=x_ids[i:i + len(c)], columns=y_ids),
+                     pd.DataFrame(j, index=x_ids[i:i + len(c)], columns=y_ids))
+                    for (i, c, j) in blocks)
+        counts = np.zeros((len(x_ids), len(y_ids)), dtype=np.int64)
+        jaccard = np.zeros((len(x_ids), len(y_ids)))
+        for (i, c, j) in blocks:
+            counts[i:i + len(c)] = c
+            jaccard[i:i + len(c)] = j
+        if Y is None:
+            # mirror the upper triangle
+            counts = counts + np.triu(counts, 1).T
+            jaccard = jaccard + np.triu(jaccard, 1).T
+        return (pd.DataFrame(counts, index=x_ids, columns=y_ids),
+                pd.DataFrame(jaccard, index=x_ids, columns=y_ids))
+
     @staticmethod
     def intersectionlist_to_matrix(ilist, xterms, yterms):
         """
@@ -295,28 +555,90 @@ class AssociationSet():
         logger.debug("Z={}".format(z))
         return (z,xterms,yterms)
     
-    def as_dataframe(self, fillna=True, subjects=None):
+    def as_sparse_matrix(self, subjects=None):
+        """
+        Return association set as a sparse subject by class matrix
+
+        Arguments
+        ---------
+        subjects : list
+            subject ids, one per row; defaults to all subjects
+
+        Returns
+        -------
+        (matrix, subjects, class_ids)
+
+        matrix is a scipy.sparse CSR matrix, with a 1 in row i, column j if
+        subject i has class j as an inferred type. Columns are the sorted ids
+        of the classes that are inferred types of any of the subjects. For all
+        subjects, this is the matrix and column order of `incidence_matrix`
+        """
+        (matrix, _, class_ids, _) = self.incidence_matrix()
+        if subjects is None:
+            return (matrix, list(self.subjects), class_ids)
+        subjects = list(subjects)
+        m = self._subject_rows(subjects).tocsc()
+        used = np.flatnonzero(np.diff(m.indptr))
+        return (m[:, used].tocsr(), subjects, [class_ids[j] for j in used])
+
+    def _subject_rows(self, subjects):
+        """
+        Rows of incidence_matrix for a list of subjects; unknown subjects have empty rows
+        """
+        (matrix, subject_index, _, _) = self.incidence_matrix()
+        rows = []
+        cols = []
+        for (i, s) in enumerate(subjects):
+            if s in subject_index:
+                rows.append(i)
+                cols.append(subject_index[s])
+            elif self.strict:
+                raise UnknownSubjectException(s)
+        select = sp.sparse.csr_matrix((np.ones(len(rows), dtype=matrix.dtype), (rows, cols)),
+                                      shape=(len(subjects), matrix.shape[0]))
+        return select @ matrix
+
+    def _term_rows(self, terms):
+        """
+        Sparse terms by subjects matrix, with the subjects that have each term as an
+        inferred type; terms that are not inferred types of any subject have empty rows
+        """
+        (matrix, _, _, class_index) = self.incidence_matrix()
+        rows = []
+        cols = []
+        for (i, t) in enumerate(terms):
+            if t in class_index:
+                rows.append(class_index[t])
+                cols.append(i)
+        select = sp.sparse.csr_matrix((np.ones(len(rows), dtype=matrix.dtype), (rows, cols)),
+                                      shape=(matrix.shape[1], len(terms)))
+        return (matrix @ select).T.tocsr()
+
+    def as_dataframe(self, fillna=True, subjects=None, sparse=False):
         """
         Return association set as pandas DataFrame
 
         Each row is a subject (e.g. gene)
         Each column is the inferred class used to describe the subject
-        """
-        entries = []
-        selected_subjects = self.subjects
-        if subjects is not None:
-            selected_subjects = subjects
-            
-        for s in selected_subjects:
-            vmap = {}
-            for c in self.inferred_types(s):
-                vmap[c] = 1
-            entries.append(vmap)
+
+        Arguments
+        ---------
+        fillna : bool
+            if False, absent values in a dense frame are NaN rather than 0
+        subjects : list
+            subject ids; defaults to all subjects
+        sparse : bool
+            if True, the frame is backed by sparse columns, with a fill value
+            of 0; see `as_sparse_matrix` to use the matrix directly
+        """
+        (matrix, selected_subjects, class_ids) = self.as_sparse_matrix(subjects)
         logger.debug("Creating DataFrame")
-        df = pd.DataFrame(entries, index=selected_subjects)
-        if fillna:
-            logger.debug("Performing fillna...")
-            df = df.fillna(0)
+        if sparse:
+            return pd.DataFrame.sparse.from_spmatrix(matrix.astype(np.float64),
+                                                     index=selected_subjects, columns=class_ids)
+        df = pd.DataFrame(matrix.toarray().astype(np.float64), index=selected_subjects, columns=class_ids)
+        if not fillna:
+            df = df.where(df > 0)
         return df
 
     def label(self, id):
@@ -389,74 +711,55 @@ class AssociationSet():
             subjects = []
 
         subjects=set(subjects)
-        bg_count = {}
-        sample_count = {}
-        potential_hypotheses = set()
-        sample_size = len(subjects)
-        for s in subjects:
-            potential_hypotheses.update(self.inferred_types(s))
-        if hypotheses is None:
-            hypotheses = potential_hypotheses
-        else:
-            hypotheses = potential_hypotheses.intersection(hypotheses)
-        logger.info("Hypotheses: {}".format(hypotheses))
-        
+        (matrix, subject_index, class_ids, class_index) = self.incidence_matrix()
+        (sample_count, sample_size) = self._class_counts(subjects)
+        potential_hypotheses = sample_count > 0
+        if hypotheses is not None:
+            mask = np.zeros(len(class_ids), dtype=bool)
+            mask[[class_index[c] for c in hypotheses if c in class_index]] = True
+            potential_hypotheses &= mask
+
         # get background counts
-        # TODO: consider doing this ahead of time
         if background is None:
-            background = set(self.subjects)
+            # ensure background includes all subjects
+            bg_count = self._incidence[4]
+            bg_size = len(subject_index) + len([s for s in subjects if s not in subject_index])
         else:
             background = set(background)
+            # ensure background includes all subjects
+            background.update(subjects)
+            (bg_count, bg_size) = self._class_counts(background)
 
-        # ensure background includes all subjects
-        background.update(subjects)
-        
-        bg_size = len(background)
-        
-        for c in hypotheses:
-            bg_count[c] = 0
-            sample_count[c] = 0
-        for s in background:
-            ancs = self.inferred_types(s)
-            for a in ancs.intersection(hypotheses):
-                bg_count[a] = bg_count[a]+1
-        for s in subjects:
-            for a in self.inferred_types(s):
-                if a in hypotheses:
-                    sample_count[a] = sample_count[a]+1
-
-        hypotheses = [x for x in hypotheses if bg_count[x] > 1]
-        logger.info("Filtered hypotheses: {}".format(hypotheses))
+        hypotheses = np.flatnonzero(potential_hypotheses & (bg_count > 1))
+        logger.info("Filtered hypotheses: {}".format(len(hypotheses)))
         num_hypotheses = len(hypotheses)
-                
+
+        # https://en.wikipedia.org/wiki/Fisher's_exact_test
+        #
+        #              Cls  NotCls    RowTotal
+        #              ---  ------    ---
+        # study/sample [a,      b]    sample_size
+        # rest of ref  [c,      d]    bg_size - sample_size
+        #              ---     ---
+        #              nCls  nNotCls
+        #
+        # all classes are tested at once, using the hypergeometric
+        # distribution as scipy.stats.fisher_exact does
+        a = sample_count[hypotheses]
+        n_cls = bg_count[hypotheses]
+        p_uncorrected = hypergeom_pvalues(a, bg_size, sample_size, n_cls, direction)
+        # fisher_exact gives p=1 for tables with an empty row or column
+        p_uncorrected = np.where((n_cls == bg_size) | (sample_size == bg_size), 1.0, p_uncorrected)
+        p = np.minimum(p_uncorrected * num_hypotheses, 1.0)
+
         results = []
-        for cls in hypotheses:
-            
-            # https://en.wikipedia.org/wiki/Fisher's_exact_test
-            #
-            #              Cls  NotCls    RowTotal
-            #              ---  ------    ---
-            # study/sample [a,      b]    sample_size
-            # rest of ref  [c,      d]    bg_size - sample_size
-            #              ---     ---
-            #              nCls  nNotCls
-
-            a = sample_count[cls]
-            b = sample_size - a
-            c = bg_count[cls] - a
-            d = (bg_size - bg_count[cls]) - b
-            #logger.debug("ABCD="+str((cls,a,b,c,d,sample_size)))
-            _, p_uncorrected = sp.stats.fisher_exact( [[a, b], [c, d]], direction)
-            p = p_uncorrected * num_hypotheses
-            if p>1.0:
-                p=1.0
-            #logger.debug("P={} uncorrected={}".format(p,p_uncorrected))
-            if p<threshold:
-                res = {'c':cls,'p':p,'p_uncorrected':p_uncorrected}
-                if labels:
-                    res['n'] = self.ontology.label(cls)
-                results.append(res)
-            
+        for i in np.flatnonzero(p < threshold):
+            cls = class_ids[hypotheses[i]]
+            res = {'c':cls,'p':float(p[i]),'p_uncorrected':float(p_uncorrected[i])}
+            if labels:
+                res['n'] = self.ontology.label(cls)
+            results.append(res)
+
         results = sorted(results, key=lambda x:x['p'])
         return results
             
@@ -480,39 +783,50 @@ class AssociationSet():
         """
         Query for similarity matrix between groups of subjects
 
-        Return a list of intersection result objects with keys:
-         - x : term from x
-         - y : term from y
-         - c : count of intersection
-         - j : jaccard score
+        Returns (z, x_subjects, y_subjects), where z[i][j] is the jaccard
+        score of the inferred types of y_subjects[i] and x_subjects[j]. If
+        symmetric, only pairs where the x subject sorts before the y subject
+        are scored; others are 0
+
+        See `subject_similarity_matrix` to get counts and scores as matrices
         """
         if x_subjects is None:
             x_subjects = []
         if y_subjects is None:
             y_subjects = []
+        (_, jaccard) = self.subject_similarity_matrix(x_subjects, y_subjects)
+        z = jaccard.values.T
+        if symmetric and z.size > 0:
+            z = np.where(np.array(x_subjects)[None, :] < np.array(y_subjects)[:, None], z, 0.0)
+        return (z.tolist(), x_subjects, y_subjects)
 
-        xset = set(x_subjects)
-        yset = set(y_subjects)
-        zset = xset.union(yset)
+    def subject_similarity_matrix(self, x_subjects, y_subjects=None, chunked=False, block_size=1 << 22):
+        """
+        Number of inferred types shared by each pair of subjects, and their Jaccard similarity
+
+        Arguments
+        ---------
+        x_subjects : list
+            subject ids
+        y_subjects : list
+            subject ids. If None, x_subjects are compared with each other; as
+            the matrix is symmetric, only its upper triangle is computed
+        chunked : bool
+            if True, return a generator of (counts, jaccard) for consecutive
+            blocks of x_subjects, rather than the whole matrix. If y_subjects
+            is None, blocks only have values in the upper triangle
+        block_size : int
+            maximum number of pairs computed at once
+
+        Returns
+        -------
+        (counts, jaccard)
+            DataFrames indexed by x_subjects, with y_subjects as columns
+        """
+        return self._pairwise_matrix(self._subject_rows(x_subjects),
+                                     None if y_subjects is None else self._subject_rows(y_subjects),
+                                     x_subjects, y_subjects, chunked, block_size)
 
-        # first built map of gene->termClosure.
-        # this could be calculated ahead of time for all g,
-        # but this may be space-expensive. TODO: benchmark
-        gmap={}
-        for z in zset:
-            gmap[z] = self.inferred_types(z)
-        ilist = []
-        for x in x_subjects:
-            for y in y_subjects:
-                if not symmetric or x<y:
-                    shared = gmap[x].intersection(gmap[y])
-                    union = gmap[x].union(gmap[y])
-                    j = 0
-                    if len(union)>0:
-                        j = len(shared) / len(union)
-                    ilist.append({'x':x,'y':y,'shared':shared, 'c':len(shared), 'j':j})
-        return self.intersectionlist_to_matrix(ilist, x_subjects, y_subjects)
-    
 
 class NamedEntity():
     """
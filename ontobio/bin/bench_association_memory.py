@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the memory used to hold a GAF in memory as GoAssociation objects,
+with and without an AssociationInterner.
+
+Example:
+python ontobio/bin/bench_association_memory.py -n 1000000 goa_uniprot_all.gaf
+
+If no GAF is given, a small test file is used.
+"""
+
+import argparse
+import gc
+import logging
+import time
+import tracemalloc
+
+from ontobio.io import gafparser
+from ontobio.model import association
+
+
+def load(lines, interner=None):
+    assocs = []
+    for line in lines:
+        result = gafparser.to_association(line.split("\t"))
+        if result.skipped:
+            continue
+        for a in result.associations:
+            assocs.append(a if interner is None else interner.intern(a))
+    return assocs
+
+
+def measure(lines, interner=None):
+    gc.collect()
+    tracemalloc.start()
+    t1 = time.process_time()
+    assocs = load(lines, interner=interner)
+    t = time.process_time() - t1
+    (current, _peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return assocs, current, t
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark memory used by GoAssociations held in memory',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-n', '--num_lines', type=int, default=None,
+                        help='Only load the first N lines')
+    parser.add_argument('-v', '--verbosity', default=0, action='count',
+                        help='Increase output verbosity')
+    parser.add_argument('gaf', nargs='?', default='tests/resources/test-qualifiers-2.2.gaf')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbosity >= 1 else logging.ERROR)
+
+    lines = []
+    with open(args.gaf) as file:
+        for line in file:
+            if line.startswith("!"):
+                continue
+            lines.append(line.rstrip("\n"))
+            if args.num_lines is not None and len(lines) >= args.num_lines:
+                break
+
+    for (name, interner) in [("plain", None),
+                             ("interned", association.AssociationInterner()),
+                             ("interned, no source lines", association.AssociationInterner(source_lines=False))]:
+        assocs, size, t = measure(lines, interner=interner)
+        print("{}: {} associations, {:.1f} MB ({:.0f} bytes/association), {:.2f}s".format(
+            name, len(assocs), size / (1 << 20), size / max(len(assocs), 1), t))
+        del assocs
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""
+Benchmark loading an obographs json file by parsing, and from a snapshot,
+as a networkx-backed Ontology and as a CompactOntology.
+
+Example:
+python ontobio/bin/bench_snapshot.py go.json
+
+If no ontology is given, a small test ontology is used. Each load is timed
+in a fresh process. Snapshots are written to a temporary directory, which
+is removed afterwards.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from ontobio.ontol_factory import OntologyFactory
+
+
+def timed_create(handle, snapshot_dir, args):
+    os.environ['ONTOBIO_SNAPSHOT_DIR'] = snapshot_dir
+    t1 = time.perf_counter()
+    ont = OntologyFactory().create(handle, **args)
+    return time.perf_counter() - t1, len(ont.nodes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ontology snapshots',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-v', '--verbosity', default=0, action='count',
+                        help='Increase output verbosity')
+    parser.add_argument('handle', nargs='?', default='tests/resources/go-truncated-pombase.json')
+
+    args = parser.parse_args()
+    if args.verbosity >= 1:
+        logging.basicConfig(level=logging.INFO)
+
+    snapshot_dir = tempfile.mkdtemp(prefix='ontobio-bench-')
+    context = multiprocessing.get_context('spawn')
+    try:
+        for (name, load_args) in [("parse", dict(snapshot=False)),
+                                  ("parse, write snapshot", dict(snapshot=True)),
+                                  ("snapshot", dict(snapshot=True)),
+                                  ("snapshot, no graphdoc", dict(snapshot=True, retain_graphdoc=False)),
+                                  ("compact, parse", dict(compact=True, snapshot=False)),
+                                  ("compact, snapshot", dict(compact=True))]:
+            with context.Pool(1) as pool:
+                t, num_nodes = pool.apply(timed_create, (args.handle, snapshot_dir, load_args))
+            print("{}: {:.3f}s ({} nodes)".format(name, t, num_nodes))
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+Benchmark relation-filtered traversal, with and without the per-predicate adjacency index.
+
+Example:
+python ontobio/bin/bench_traversal.py -r subClassOf -r BFO:0000050 go.json
+
+If no ontology is given, a small test ontology is used.
+"""
+
+import argparse
+import logging
+import time
+from ontobio.ontol_factory import OntologyFactory
+
+
+def timed_ancestors(ont, nodes, relations):
+    t1 = time.process_time()
+    n = 0
+    for x in nodes:
+        n += len(ont.ancestors(x, relations=relations))
+    return time.process_time() - t1, n
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark filtered ontology traversal',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-r', '--relation', dest='relations', action='append', default=None,
+                        help='Relation to filter on; may be repeated. Default: subClassOf')
+    parser.add_argument('-n', '--num_nodes', type=int, default=None,
+                        help='Only traverse from the first N nodes')
+    parser.add_argument('-v', '--verbosity', default=0, action='count',
+                        help='Increase output verbosity')
+    parser.add_argument('handle', nargs='?', default='tests/resources/go-truncated-pombase.json')
+
+    args = parser.parse_args()
+    if args.verbosity >= 1:
+        logging.basicConfig(level=logging.INFO)
+
+    relations = args.relations if args.relations is not None else ['subClassOf']
+    t1 = time.process_time()
+    ont = OntologyFactory().create(args.handle)
+    print("Loaded {} in {:.2f}s".format(args.handle, time.process_time() - t1))
+    nodes = list(ont.nodes())
+    if args.num_nodes is not None:
+        nodes = nodes[:args.num_nodes]
+
+    ont.use_adjacency_index = False
+    t_before, n_before = timed_ancestors(ont, nodes, relations)
+    print("Without index: {:.3f}s ({} ancestors over {} nodes)".format(t_before, n_before, len(nodes)))
+
+    ont.use_adjacency_index = True
+    t1 = time.process_time()
+    ont.parents(nodes[0], relations=relations)
+    print("Index build: {:.3f}s".format(time.process_time() - t1))
+    t_after, n_after = timed_ancestors(ont, nodes, relations)
+    print("With index: {:.3f}s ({} ancestors over {} nodes)".format(t_after, n_after, len(nodes)))
+    if n_before != n_after:
+        print("WARNING: results differ")
+    if t_after > 0:
+        print("Speedup: {:.1f}x".format(t_before / t_after))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,539 @@
+"""
+A compact, array-backed representation of an ontology graph.
+
+The default :class:`Ontology` implementation wraps a networkx
+MultiDiGraph, which holds an attribute dict for every node and every
+edge. For large ontologies such as GO, CHEBI or NCBITaxon this uses a
+lot of memory.
+
+:class:`CompactGraph` instead assigns each node an integer index, and
+stores the edges for each predicate as a pair of CSR (compressed sparse
+row) arrays, one indexed by subject and one by object.
+:class:`CompactOntology` is an :class:`Ontology` backed by a CompactGraph.
+
+See also:
+
+ - ontol.py
+ - ontol_factory.py
+
+"""
+
+import json
+import logging
+import sys
+from array import array
+
+import networkx as nx
+import numpy as np
+
+from ontobio.ontol import Ontology
+from ontobio.obograph_util import OboJsonMapper, iter_obograph_json
+from ontobio.vocabulary.relations import map_legacy_pred
+
+logger = logging.getLogger(__name__)
+
 
 class CompactGraph():
+    """
+    An integer-indexed graph, with per-predicate CSR adjacency arrays
+
+    For each predicate P, `o_by_ps[P]` is a pair `(indptr, indices)` such that
+    the objects (parents) of the node with index i are
+    `indices[indptr[i]:indptr[i+1]]`. `s_by_po[P]` is the transpose, giving
+    the subjects (children) of each node.
+    """
 
-    def __init__(self, nodes=None, edges=None):
+    def __init__(self, nodes=None, edges=None, parse_meta=True):
+        """
+        Arguments
+        ---------
+        nodes : list
+            obograph node dicts, with keys `id`, and optionally `lbl`, `type` and `meta`
+        edges : list
+            obograph edge dicts, with keys `sub`, `pred` and `obj`
+        parse_meta : bool
+            if False, node meta objects (synonyms, definitions, ...) are not retained
+        """
         if nodes is None:
             nodes = []
         if edges is None:
             edges = []
 
         id2index = {}
-        label_arr = []
         id_arr = []
+        label_arr = []
+        type_arr = []
+        meta_arr = []
 
-        e_by_p = {}
-        o_by_ps = {}
-        
-        i = 0
-
-            
-        # TODO: order nodes
-        # TODO: include undeclared
         for n in nodes:
-            id = n.id
-            id2index[id] = i
-            i = i+1
-            id_arr.append(id)
-            label_arr.append(n.lbl)
-            
+            id = n['id']
+            i = id2index.get(id)
+            if i is None:
+                i = len(id_arr)
+                id2index[id] = i
+                id_arr.append(id)
+                label_arr.append(None)
+                type_arr.append(None)
+                meta_arr.append(None)
+            if 'lbl' in n:
+                label_arr[i] = n['lbl']
+            if 'type' in n:
+                type_arr[i] = n['type']
+            if parse_meta and n.get('meta') is not None:
+                meta_arr[i] = n['meta']
+
+        subs_by_p = {}
+        objs_by_p = {}
         for e in edges:
-            ids = [e.sub,e.pred,e.obj]
-            for id in ids:
-                if id not in id2index:
+            ix = []
+            for id in (e['sub'], e['obj']):
+                i = id2index.get(id)
+                if i is None:
+                    # undeclared node
+                    i = len(id_arr)
                     id2index[id] = i
-                    i = i+1
                     id_arr.append(id)
-                    label_arr.append(id)
-            
-        for e in edges:
-            (s,p,o) = (e.sub,e.pred,e.obj)
-            (si,pi,oi) = (id2index[s],id2index[p],id2index[o])
-            if pi not in e_by_p:
-                e_by_p[pi] = []
-            e_by_p[pi].append((si,oi))
-            if pi not in o_by_ps:
-                o_by_ps[pi] = {}
-            if si not in o_by_ps[pi]:
-                o_by_ps[pi][si] = []
-            o_by_ps[pi][si].append(oi)
+                    label_arr.append(None)
+                    type_arr.append(None)
+                    meta_arr.append(None)
+                ix.append(i)
+            pred = e['pred']
+            if pred not in subs_by_p:
+                subs_by_p[pred] = array('q')
+                objs_by_p[pred] = array('q')
+            subs_by_p[pred].append(ix[0])
+            objs_by_p[pred].append(ix[1])
 
+        num_nodes = len(id_arr)
+        o_by_ps = {}
+        s_by_po = {}
+        for pred in subs_by_p.keys():
+            subs = np.frombuffer(subs_by_p[pred], dtype=np.int64)
+            objs = np.frombuffer(objs_by_p[pred], dtype=np.int64)
+            o_by_ps[pred] = _csr(subs, objs, num_nodes)
+            s_by_po[pred] = _csr(objs, subs, num_nodes)
+
+        self._set_arrays(id_arr, label_arr, type_arr, meta_arr, o_by_ps, s_by_po, id2index=id2index)
+
+    @classmethod
+    def from_arrays(cls, id_arr, label_arr, type_arr, meta_arr, o_by_ps, s_by_po):
+        """
+        Creates a CompactGraph directly from prebuilt arrays, e.g. from a snapshot
+
+        `label_arr`, `type_arr` and `meta_arr` may be any sequence supporting
+        indexing and len, such as a lazily decoded table
+        """
+        cg = cls.__new__(cls)
+        cg._set_arrays(id_arr, label_arr, type_arr, meta_arr, o_by_ps, s_by_po)
+        return cg
+
+    def _set_arrays(self, id_arr, label_arr, type_arr, meta_arr, o_by_ps, s_by_po, id2index=None):
+        if id2index is None:
+            id2index = {id: i for (i, id) in enumerate(id_arr)}
         self.id2index = id2index
         self.id_arr = id_arr
         self.label_arr = label_arr
-        self.e_by_p = e_by_p
+        self.type_arr = type_arr
+        self.meta_arr = meta_arr
         self.o_by_ps = o_by_ps
+        self.s_by_po = s_by_po
+        self._merged = {}
+        logger.info("CompactGraph: {} nodes, {} predicates, {} edges".format(
+            len(id_arr), len(o_by_ps), self.number_of_edges()))
+
+    def __len__(self):
+        return len(self.id_arr)
+
+    def predicates(self):
+        """
+        Returns all predicates used in edges
+        """
+        return list(self.o_by_ps.keys())
+
+    def number_of_edges(self):
+        return sum(len(indices) for (_, indices) in self.o_by_ps.values())
+
+    def edges(self):
+        """
+        Yields (subject, predicate, object) index triples
+        """
+        for (pred, (indptr, indices)) in self.o_by_ps.items():
+            counts = np.diff(indptr)
+            subs = np.repeat(np.arange(len(counts)), counts)
+            for (s, o) in zip(subs.tolist(), indices.tolist()):
+                yield (s, pred, o)
+
+    def adjacency(self, relations=None, reverse=False):
+        """
+        Returns CSR (indptr, indices) arrays for the union of a set of predicates
 
-    def parse(self):
-        print("TODO")
-        
-    def serialize(self):
-        for id in self.id_arr:
-            ix = self.id2index[id]
+        Arguments
+        ---------
+        relations : list
+            predicates to include. If None, all are used
+        reverse : bool
+            if False, rows are subjects and columns their objects (parents).
+            If True, rows are objects and columns their subjects (children)
+        """
+        by_p = self.s_by_po if reverse else self.o_by_ps
+        if relations is None:
+            preds = list(by_p.keys())
+        else:
+            preds = [p for p in relations if p in by_p]
+        if len(preds) == 1:
+            return by_p[preds[0]]
+        key = (frozenset(preds), reverse)
+        if key not in self._merged:
+            num_nodes = len(self.id_arr)
+            rows = []
+            cols = []
+            for p in preds:
+                (indptr, indices) = by_p[p]
+                rows.append(np.repeat(np.arange(num_nodes), np.diff(indptr)))
+                cols.append(indices)
+            if len(rows) > 0:
+                self._merged[key] = _csr(np.concatenate(rows), np.concatenate(cols), num_nodes)
+            else:
+                self._merged[key] = _csr(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), num_nodes)
+        return self._merged[key]
+
+    def neighbors(self, i, relations=None, reverse=False):
+        """
+        Returns list of indexes of direct parents (or children, if reverse) of node i
+        """
+        (indptr, indices) = self.adjacency(relations, reverse)
+        return indices[indptr[i]:indptr[i+1]].tolist()
+
+    def closure(self, i, relations=None, reverse=False, reflexive=False):
+        """
+        Returns set of indexes of all ancestors (or descendants, if reverse) of node i
+        """
+        (indptr, indices) = self.adjacency(relations, reverse)
+        seen = {i}
+        stack = [i]
+        while len(stack) > 0:
+            x = stack.pop()
+            for y in indices[indptr[x]:indptr[x+1]].tolist():
+                if y not in seen:
+                    seen.add(y)
+                    stack.append(y)
+        if not reflexive:
+            seen.discard(i)
+        return seen
+
+    def serialize(self, file=sys.stdout):
+        """
+        Writes a simple tab-separated dump of the graph
+        """
+        for (ix, id) in enumerate(self.id_arr):
             lbl = self.label_arr[ix]
-            print("{}\t{}".format(id,lbl))
-        print("#EDGES")
-        for (pi,o_by_s) in self.o_by_ps.items():
-            print("#P:{}".format(pi))
-            for (s,olist) in o_by_s.items():
-                olist_str = "\t".join([str(x) for x in olist])
-                print("{}\t{}".format(str(s),olist_str))
-        #for (p,tuples) in self.e_by_p.items():
-        #    print("#P:{}",p)
-        #    for (s,o) in tuples:
-        #        print("{}\t{}".format(s,o))
-                  
-            
-            
+            file.write("{}\t{}\n".format(id, lbl))
+        file.write("#EDGES\n")
+        for (p, (indptr, indices)) in self.o_by_ps.items():
+            file.write("#P:{}\n".format(p))
+            for s in range(len(self.id_arr)):
+                olist = indices[indptr[s]:indptr[s+1]].tolist()
+                if len(olist) > 0:
+                    olist_str = "\t".join([str(x) for x in olist])
+                    file.write("{}\t{}\n".format(str(s), olist_str))
+
+
+def _csr(rows, cols, num_rows):
+    """
+    Builds deduplicated CSR (indptr, indices) int32 arrays from parallel row and column arrays
+    """
+    order = np.lexsort((cols, rows))
+    rows = rows[order]
+    cols = cols[order]
+    if len(rows) > 1:
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        rows = rows[keep]
+        cols = cols[keep]
+    indptr = np.zeros(num_rows + 1, dtype=np.int32)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=indptr[1:])
+    return (indptr, cols.astype(np.int32))
+
+
+class CompactOntology(Ontology):
+    """
+    An :class:`Ontology` backed by a :class:`CompactGraph`.
+
+    Node lookups, labels, and graph traversal (parents, children,
+    ancestors, descendants) are answered directly from the compact
+    arrays. Methods that require a networkx graph (e.g. `get_graph`,
+    `get_filtered_graph`, `subontology`) materialize one on first use.
+
+    This implementation is read-only; `add_node` and `add_parent` are not
+    supported.
+
+    Typically created via `OntologyFactory().create('go.json', compact=True)`
+    """
+
+    def __init__(self,
+                 handle=None,
+                 id=None,
+                 cgraph=None,
+                 xref_graph=None,
+                 meta=None,
+                 logical_definitions=None,
+                 property_chain_axioms=None):
+        super().__init__(handle=handle, id=id, xref_graph=xref_graph, meta=meta)
+        if cgraph is None:
+            cgraph = CompactGraph()
+        self.cgraph = cgraph
+        # networkx graph is only created on demand
+        self.graph = None
+        self.all_logical_definitions = logical_definitions if logical_definitions is not None else []
+        self.all_property_chain_axioms = property_chain_axioms if property_chain_axioms is not None else []
+
+    @staticmethod
+    def from_obograph(obographdoc, handle=None, parse_meta=True, node_type=None, predicates=None):
+        """
+        Creates a CompactOntology from an obograph json object
+
+        Follows the same conventions as `obograph_util.convert_json_object`:
+        URIs are contracted to CURIEs, obsolete nodes are skipped, and
+        equivalentNodesSets are represented as equivalentTo edges in both directions.
+        """
+        builder = _CompactOntologyBuilder(context=obographdoc.get('@context', {}),
+                                          parse_meta=parse_meta, node_type=node_type, predicates=predicates)
+        for og in obographdoc['graphs']:
+            for node in og.get('nodes', []):
+                builder.add_node(node)
+            for edge in og.get('edges', []):
+                builder.add_edge(edge)
+            builder.add_graph(og)
+        return builder.build(handle=handle)
+
+    @staticmethod
+    def from_json_file(fn, handle=None, stream=False, retain_graphdoc=False, **args):
+        """
+        Creates a CompactOntology from an obograph json file
+
+        If `stream` is True, the file is parsed incrementally with
+        `obograph_util.iter_obograph_json`, so the whole json document is
+        never held in memory. The json document is never retained, so
+        `retain_graphdoc` is accepted for compatibility with
+        `obograph_util.convert_json_file` only
+        """
+        with open(fn, 'r') as file:
+            if stream:
+                return CompactOntology.from_json_stream(file, handle=handle, **args)
+            obographdoc = json.load(file)
+        return CompactOntology.from_obograph(obographdoc, handle=handle, **args)
+
+    @staticmethod
+    def from_json_stream(file, handle=None, parse_meta=True, node_type=None, predicates=None):
+        """
+        Creates a CompactOntology from an obographs json file object, parsed incrementally
+
+        As for `obograph_util.convert_json_stream`, the @context, if any, must
+        precede the graphs in the file; otherwise the file is re-read with `json.load`
+        """
+        args = dict(parse_meta=parse_meta, node_type=node_type, predicates=predicates)
+        builder = _CompactOntologyBuilder(**args)
+        og = None
+        for (event, value) in iter_obograph_json(file):
+            if event == 'node':
+                builder.add_node(value)
+            elif event == 'edge':
+                builder.add_edge(value)
+            elif event == 'graph_item':
+                (k, v) = value
+                og[k] = v
+            elif event == 'graph_start':
+                og = {}
+            elif event == 'graph_end':
+                builder.add_graph(og)
+            elif event == 'context':
+                if not builder.is_empty():
+                    logger.warning("@context follows graphs; cannot stream, reloading")
+                    file.seek(0)
+                    return CompactOntology.from_obograph(json.load(file), handle=handle, **args)
+                builder = _CompactOntologyBuilder(context=value, **args)
+        return builder.build(handle=handle)
+
+    def get_graph(self):
+        """
+        Return a networkx graph for the whole ontology.
+
+        The graph is created from the compact arrays on first call
+        """
+        if self.graph is None:
+            logger.info("Materializing networkx graph for {}".format(self))
+            cg = self.cgraph
+            g = nx.MultiDiGraph()
+            for (i, id) in enumerate(cg.id_arr):
+                g.add_node(id, **self._node_dict(i))
+            for (s, pred, o) in cg.edges():
+                g.add_edge(cg.id_arr[o], cg.id_arr[s], pred=pred)
+            self.graph = g
+        return self.graph
+
+    def _node_dict(self, i):
+        cg = self.cgraph
+        d = {'id': cg.id_arr[i]}
+        lbl = cg.label_arr[i]
+        if lbl is not None:
+            d['label'] = lbl
+            d['lbl'] = lbl
+        type = cg.type_arr[i]
+        if type is not None:
+            d['type'] = type
+        meta = cg.meta_arr[i]
+        if meta is not None:
+            d['meta'] = meta
+        return d
+
+    def nodes(self):
+        return list(self.cgraph.id_arr)
+
+    def node(self, id):
+        i = self.cgraph.id2index.get(id)
+        if i is None:
+            return None
+        return self._node_dict(i)
+
+    def has_node(self, id):
+        return id in self.cgraph.id2index
+
+    def label(self, nid, id_if_null=False):
+        i = self.cgraph.id2index.get(nid)
+        lbl = None
+        if i is not None:
+            lbl = self.cgraph.label_arr[i]
+        if lbl is None and id_if_null:
+            return nid
+        return lbl
+
+    def relations_used(self):
+        return self.cgraph.predicates()
+
+    def child_parent_relations(self, subj, obj, graph=None):
+        cg = self.cgraph
+        si = cg.id2index.get(subj)
+        oi = cg.id2index.get(obj)
+        preds = set()
+        if si is not None and oi is not None:
+            for (pred, (indptr, indices)) in cg.o_by_ps.items():
+                if oi in indices[indptr[si]:indptr[si+1]]:
+                    preds.add(pred)
+        return preds
+
+    def parents(self, node, relations=None):
+        return self._neighbors(node, relations, reverse=False)
+
+    def children(self, node, relations=None):
+        return self._neighbors(node, relations, reverse=True)
+
+    def ancestors(self, node, relations=None, reflexive=False):
+        return self._closure(node, relations, reverse=False, reflexive=reflexive)
+
+    def descendants(self, node, relations=None, reflexive=False):
+        return self._closure(node, relations, reverse=True, reflexive=reflexive)
+
+    def _neighbors(self, node, relations, reverse):
+        cg = self.cgraph
+        i = cg.id2index.get(node)
+        if i is None:
+            return []
+        id_arr = cg.id_arr
+        return [id_arr[j] for j in cg.neighbors(i, relations=relations, reverse=reverse)]
+
+    def _closure(self, node, relations, reverse, reflexive):
+        cg = self.cgraph
+        i = cg.id2index.get(node)
+        if i is None:
+            return [node] if reflexive else []
+        id_arr = cg.id_arr
+        return [id_arr[j] for j in cg.closure(i, relations=relations, reverse=reverse, reflexive=reflexive)]
+
+    def add_node(self, id, label=None, type='CLASS', meta=None):
+        raise NotImplementedError("CompactOntology is read-only")
+
+    def add_parent(self, id, pid, relation='subClassOf'):
+        raise NotImplementedError("CompactOntology is read-only")
+
+    def merge(self, ontologies):
+        raise NotImplementedError("CompactOntology is read-only")
+
+
+class _CompactOntologyBuilder():
+    """
+    Accumulates the nodes, edges and axioms of one or more obographs,
+    in the conventions of `obograph_util.OboJsonMapper`, and builds a CompactOntology
+    """
+
+    def __init__(self, context=None, parse_meta=True, node_type=None, predicates=None):
+        self.mapper = OboJsonMapper(context=context if context is not None else {})
+        self.parse_meta = parse_meta
+        self.node_type = node_type
+        self.predicates = predicates
+        self.nodes = []
+        self.edges = []
+        self.xref_graph = nx.MultiGraph()
+        self.logical_definitions = []
+        self.property_chain_axioms = []
+        self.base_og = None
+
+    def is_empty(self):
+        return len(self.nodes) == 0 and len(self.edges) == 0 and self.base_og is None
+
+    def add_node(self, node):
+        if node.get('is_obsolete') == 'true':
+            return
+        if self.node_type is not None and node.get('type') != self.node_type:
+            return
+        mapper = self.mapper
+        id = mapper.contract_uri(node['id'])
+        n = {'id': id}
+        if 'lbl' in node:
+            n['lbl'] = node['lbl']
+        if 'type' in node:
+            n['type'] = node['type']
+        if self.parse_meta and node.get('meta') is not None:
+            meta = mapper.transform_meta(node['meta'])
+            n['meta'] = meta
+            for x in meta.get('xrefs', []):
+                self.xref_graph.add_edge(mapper.contract_uri(x['val']), id, source=id)
+        self.nodes.append(n)
+
+    def add_edge(self, edge):
+        mapper = self.mapper
+        pred = map_legacy_pred(mapper.contract_uri(edge['pred']))
+        if pred == 'is_a':
+            pred = 'subClassOf'
+        if self.predicates is None or pred in self.predicates:
+            self.edges.append({'sub': mapper.contract_uri(edge['sub']),
+                               'pred': pred,
+                               'obj': mapper.contract_uri(edge['obj'])})
+
+    def add_graph(self, og):
+        """
+        Adds the equivalentNodesSets and axioms of an obograph; nodes and edges are added separately
+        """
+        mapper = self.mapper
+        for ns in og.get('equivalentNodesSets', []):
+            ids = [mapper.contract_uri(i) for i in ns['nodeIds']]
+            for i in ids:
+                for j in ids:
+                    if i != j:
+                        # matches the networkx edge direction used by OboJsonMapper
+                        self.edges.append({'sub': j, 'pred': 'equivalentTo', 'obj': i})
+        self.logical_definitions += mapper.logical_definitions(og)
+        self.property_chain_axioms += mapper.property_chain_axioms(og)
+        if self.base_og is None:
+            self.base_og = og
 
+    def build(self, handle=None):
+        if self.base_og is None:
+            raise ValueError("No graphs in obographs json")
+        cgraph = CompactGraph(nodes=self.nodes, edges=self.edges, parse_meta=self.parse_meta)
+        return CompactOntology(handle=handle,
+                               id=self.base_og.get('id'),
+                               cgraph=cgraph,
+                               xref_graph=self.xref_graph,
+                               meta=self.base_og.get('meta'),
+                               logical_definitions=self.logical_definitions,
+                               property_chain_axioms=self.property_chain_axioms)
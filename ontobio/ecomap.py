@@ -24,19 +24,45 @@ class EcoMap():
     Provides mapping between GO Evidence codes (IDA, IEA, ISS, etc) and ECO classes.
 
     The mapping is actually between a (code, ref) pair and an eco class
+
+    Use :func:`default_ecomap` for a shared, already loaded instance
     """
 
     PURL = 'http://purl.obolibrary.org/obo/eco/gaf-eco-mapping.txt'
 
     def __init__(self):
         self._mappings = None
-    
+        self._class_by_coderef = None
+        self._default_class_by_code = None
+        self._coderef_by_class = None
+
     def mappings(self):
         if self._mappings is None:
             s = get_ecomap_str(self.PURL)
-            self._mappings = self.parse_ecomap_str(s)
+            self._index(self.parse_ecomap_str(s))
         return self._mappings
 
+    def _index(self, mappings):
+        """
+        Sets the mappings, and builds the lookup indexes over them.
+
+        Indexes give the same answers as scanning the mappings in order would
+        """
+        class_by_coderef = {}
+        default_class_by_code = {}
+        coderef_by_class = {}
+        for (code, ref, cls) in mappings:
+            class_by_coderef.setdefault((code, ref), cls)
+            if ref is None:
+                # Scanning, the last default mapping for a code wins
+                default_class_by_code[code] = cls
+            coderef_by_class.setdefault(cls, (code, ref))
+
+        self._class_by_coderef = class_by_coderef
+        self._default_class_by_code = default_class_by_code
+        self._coderef_by_class = coderef_by_class
+        self._mappings = mappings
+
     def parse_ecomap_str(self, str):
         lines = str.split("\n")
         tups = []
@@ -69,15 +95,12 @@ class EcoMap():
         str
             ECO class CURIE/ID
         """
-        mcls = None
-        for (this_code, this_ref, cls) in self.mappings():
-            if str(this_code) == str(code):
-                if this_ref  == reference:
-                    return cls
-                if this_ref is None:
-                    mcls = cls
-                    
-        return mcls
+        self.mappings()
+        code = str(code)
+        cls = self._class_by_coderef.get((code, reference))
+        if cls is None:
+            cls = self._default_class_by_code.get(code)
+        return cls
                 
     def ecoclass_to_coderef(self, cls):
         """
@@ -97,9 +120,19 @@ class EcoMap():
         (str, str)
             code, reference tuple
         """
-        code = ''
-        ref = None
-        for (code,ref,this_cls) in self.mappings():
-            if cls == this_cls:
-                return code, ref
-        return None, None
+        self.mappings()
+        return self._coderef_by_class.get(cls, (None, None))
+
+
+_default_ecomap = None
+
+def default_ecomap():
+    """
+    Returns the shared EcoMap, with its mappings loaded
+    """
+    global _default_ecomap
+    if _default_ecomap is None:
+        m = EcoMap()
+        m.mappings()
+        _default_ecomap = m
+    return _default_ecomap
@@ -8,8 +8,13 @@ All parser objects instantiate a subclass of the abstract `AssocParser` object
 # TODO: Refactor - move some stuff out into generic parser object
 
 import re
+import sys
 import requests
 import tempfile
+import collections
+import copy
+import itertools
+import multiprocessing
 from contextlib import closing
 import subprocess
 import logging
@@ -25,6 +30,7 @@ from typing import Optional, List, Dict, Set
 
 from ontobio import ontol
 from ontobio import ecomap
+from ontobio.ecomap import default_ecomap
 from ontobio.io import parsereport
 from ontobio.util.user_agent import get_user_agent
 from ontobio.model import association
@@ -55,6 +61,10 @@ class AssocParserConfig():
     Configuration for an association parser
 
     rule_metadata: Dictionary of rule IDs to metadata pulled out by yamldown
+    report_rule_passes: If True, an INFO message is reported for every GO rule an annotation passes.
+        Otherwise only the rules that can fire for an annotation are run, see `qc.compile_rules`
+    report_sample_size: If set, parse reports count all messages, but keep only a random sample of
+        this many example messages per rule (and overall), so memory stays flat on large files
     """
     def __init__(self,
                  remove_double_prefixes=False,
@@ -65,7 +75,7 @@ class AssocParserConfig():
                  class_idspaces=None,
                  entity_idspaces=None,
                  group_idspace=None,
-                 ecomap=ecomap.EcoMap(),
+                 ecomap=None,
                  exclude_relations=None,
                  include_relations=None,
                  filter_out_evidence=None,
@@ -79,7 +89,9 @@ class AssocParserConfig():
                  suppress_rule_reporting_tags=[],
                  annotation_inferences=None,
                  extensions_constraints=None,
-                 rule_contexts=[]):
+                 rule_contexts=[],
+                 report_rule_passes=False,
+                 report_sample_size=None):
 
         self.remove_double_prefixes=remove_double_prefixes
         self.ontology=ontology
@@ -87,7 +99,7 @@ class AssocParserConfig():
         self.entity_map=entity_map
         self.valid_taxa=valid_taxa
         self.class_idspaces=class_idspaces
-        self.ecomap=ecomap
+        self.ecomap=ecomap if ecomap is not None else default_ecomap()
         self.include_relations=include_relations
         self.exclude_relations=exclude_relations
         self.filter_out_evidence = filter_out_evidence
@@ -103,6 +115,10 @@ class AssocParserConfig():
         self.extensions_constraints = AssocParserConfig._compute_constraint_subclasses(extensions_constraints, ontology)
         self.group_idspace = None if group_idspace is None else set(group_idspace)
         self.rule_contexts = rule_contexts
+        self.report_rule_passes = report_rule_passes
+        self.report_sample_size = report_sample_size
+        # Compiled GO rules for this config, see qc.compile_rules
+        self.rule_plan = None
         # This is a dictionary from ruleid: `gorule-0000001` to title strings
         if self.exclude_relations is None:
             self.exclude_relations = []
@@ -133,7 +149,9 @@ class AssocParserConfig():
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            # The compiled rule plan is a cache, derived from the rest of the config
+            return {k: v for (k, v) in self.__dict__.items() if k != "rule_plan"} == \
+                {k: v for (k, v) in other.__dict__.items() if k != "rule_plan"}
         else:
             return False
 
@@ -179,14 +197,16 @@ class Report(object):
 
 
     def __init__(self, group="unknown", dataset="unknown", config=None):
-        self.messages = []
-        self.n_lines = 0
-        self.n_assocs = 0
-        self.skipped = 0
-        self.reporter = parsereport.Report(group, dataset)
         if config is None:
             config = AssocParserConfig()
         self.config = config
+        sample_size = config.report_sample_size
+        self.reporter = parsereport.Report(group, dataset, sample_size=sample_size)
+        # With a sample size, messages is a random sample of all recorded messages
+        self.messages = [] if sample_size is None else parsereport.Reservoir(sample_size)
+        self.n_lines = 0
+        self.n_assocs = 0
+        self.skipped = 0
         self.header = []
 
     def error(self, line, type, obj, msg="", taxon="", rule=None):
@@ -196,6 +216,11 @@ class Report(object):
         self.message(self.WARNING, line, type, obj, msg, taxon=taxon, rule=rule)
 
     def message(self, level, line, type, obj, msg="", taxon="", rule=None, dont_record=["INFO"]):
+        if level == self.INFO and level in dont_record:
+            # INFO messages are never stored by the reporter either, so don't build one
+            self.reporter.tally(level, type, rule)
+            return
+
         message = {
             'level': level,
             'line': line,
@@ -207,7 +232,10 @@ class Report(object):
         }
         if not level in dont_record:
             # Only record a message if we want that
-            self.messages.append(message)
+            if self.config.report_sample_size is None:
+                self.messages.append(message)
+            else:
+                self.messages.offer(message)
 
         self.reporter.message(message, rule)
 
@@ -238,6 +266,20 @@ class Report(object):
             if result.evidence_used not in evidence_to_filter:
                 write_to_file(evidence_filtered_file, result.parsed_line + "\n")
 
+    def merge(self, other):
+        """
+        Add the counts, headers and messages of another Report, e.g. from parsing a later chunk of the same file
+        """
+        if self.config.report_sample_size is None:
+            self.messages += other.messages
+        else:
+            self.messages.merge(other.messages)
+        self.n_lines += other.n_lines
+        self.n_assocs += other.n_assocs
+        self.skipped += other.skipped
+        self.header += other.header
+        self.reporter.merge(other.reporter)
+
     def short_summary(self):
         return "Parsed {} assocs from {} lines. Skipped: {}".format(self.n_assocs, self.n_lines, self.skipped)
 
@@ -253,6 +295,7 @@ class Report(object):
         Generate a summary in markdown format
         """
         json = self.to_report_json()
+        totals = self.reporter.totals()
         # summary = json['summary']
 
         s = "# Group: {group} - Dataset: {dataset}\n".format(group=json["group"], dataset=json["dataset"])
@@ -290,7 +333,7 @@ class Report(object):
             s += "### {rule}\n\n".format(rule=rule)
             if rule != "other" and self.config.rule_metadata:
                 s += "{title}\n\n".format(title=self.config.rule_metadata.get(rule, {}).get("title", ""))
-            s += "* total: {amount}\n".format(amount=len(messages))
+            s += "* total: {amount}\n".format(amount=totals.get(rule, len(messages)))
             if len(messages) > 0:
                 s += "#### Messages\n"
             for message in messages:
@@ -308,6 +351,43 @@ class ParseResult:
     evidence_used: List[str] = None
 
 
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+_parallel_worker = None
+
+def _init_parallel_worker(parser, writer):
+    # runs in each forked worker; parser and writer are inherited, not pickled
+    global _parallel_worker
+    _parallel_worker = (parser, writer)
+
+def _parse_chunk(lines, collect=False):
+    """
+    Worker side of `AssocParser.parallel_write`: returns (written text, filtered evidence text, Report, associations)
+
+    associations is None unless `collect` is set
+    """
+    (parser, writer) = _parallel_worker
+    reporter = parser.report.reporter
+    parser.report = Report(group=reporter.group, dataset=reporter.dataset, config=parser.config)
+    writer = copy.copy(writer)
+    writer.file = io.StringIO()
+    filtered = io.StringIO()
+    associations = [] if collect else None
+    for line in lines:
+        parser._write_parsed_line(line, writer, filtered, sink=associations)
+    report = parser.report
+    # the config holds the ontology, so it is not sent back
+    report.config = None
+    return (writer.file.getvalue(), filtered.getvalue(), report, associations)
+
+
 # TODO avoid using names that are builtin python: file, id
 
 parser_version_regex = re.compile(r"!([\w]+)-version:[\s]*([\d]+\.[\d]+(\.[\d]+)?)")
@@ -317,6 +397,10 @@ class AssocParser(object):
     """
     Abstract superclass of all association parser classes
     """
+
+    # characters read at a time by skim_association_map
+    skim_block_size = 1 << 22
+
     def is_header(self, line):
         return line.startswith("!")
 
@@ -363,6 +447,95 @@ class AssocParser(object):
         logger.info(self.report.short_summary())
         file.close()
 
+    def parallel_write(self, file, writer, processes=None, chunk_size=10000, sink=None):
+        """
+        Parses and validates a file in a pool of worker processes, writing associations with `writer`
+
+        The output, the filtered evidence file and `self.report` are identical
+        to writing each association from `association_generator`, in order.
+        The leading header lines are parsed in this process first, so that
+        the workers inherit the detected format version. Workers are forked
+        and share this parser, including the config and ontology, read-only.
+
+        This is a generator: it yields the number of lines processed after each
+        chunk is written, and must be consumed for the file to be written.
+
+        Arguments
+        ---------
+        file : file or string
+            input association file
+        writer : AssocWriter
+            writer for the valid associations; workers write into copies of it
+        processes : int
+            number of worker processes. Default: number of CPUs
+        chunk_size : int
+            number of lines given to a worker at a time
+        sink : object with a `write_assoc` method
+            optional; also given each written association, in order, in this process.
+            Workers send their associations back to this process only if this is set
+        """
+        file = self._ensure_file(file)
+        lines = []
+        for line in file:
+            if not self.is_header(line):
+                lines.append(line)
+                break
+            self._write_parsed_line(line, writer, self.config.filtered_evidence_file, sink=sink)
+            yield 1
+
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            context = None
+        if context is None or processes == 1:
+            # no fork (or no point): parse in this process
+            for line in itertools.chain(lines, file):
+                self._write_parsed_line(line, writer, self.config.filtered_evidence_file, sink=sink)
+                yield 1
+            file.close()
+            return
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        chunks = _chunks(itertools.chain(lines, file), chunk_size)
+        with context.Pool(processes, initializer=_init_parallel_worker, initargs=(self, writer)) as pool:
+            pending = collections.deque()
+            while True:
+                # bounded number of chunks in flight, so the input is not read into memory all at once
+                for chunk in itertools.islice(chunks, 2 * processes - len(pending)):
+                    pending.append((len(chunk), pool.apply_async(_parse_chunk, (chunk, sink is not None))))
+                if len(pending) == 0:
+                    break
+                (n, result) = pending.popleft()
+                (written, filtered, report, associations) = result.get()
+                if writer.file:
+                    writer.file.write(written)
+                else:
+                    print(written, end="")
+                write_to_file(self.config.filtered_evidence_file, filtered)
+                if sink is not None:
+                    for association in associations:
+                        sink.write_assoc(association)
+                report.config = self.report.config
+                self.report.merge(report)
+                yield n
+
+        logger.info(self.report.short_summary())
+        file.close()
+
+    def _write_parsed_line(self, line, writer, evidence_filtered_file, sink=None):
+        """
+        `sink` is either None, a list to append associations to, or another writer
+        """
+        parsed_result = self.parse_line(line)
+        self.report.report_parsed_result(parsed_result, None, evidence_filtered_file, self.config.filter_out_evidence)
+        for association in parsed_result.associations:
+            writer.write_assoc(association)
+            if isinstance(sink, list):
+                sink.append(association)
+            elif sink is not None:
+                sink.write_assoc(association)
+
     def generate_associations(self, line, outfile=None):
         associations = self.association_generator(line, outfile=outfile)
         for association in associations:
@@ -434,6 +607,101 @@ class AssocParser(object):
         """
         raise NotImplementedError("AssocParser.skim not implemented")
 
+    def skim_association_map(self, file):
+        """
+        Lightweight parse of a file into a map of subjects to classes.
+
+        Equivalent to grouping the tuples returned by `skim` by subject,
+        and suitable for passing directly to `AssociationSet`. Subclasses
+        override this with a faster columnar implementation.
+
+        Return a tuple (association_map, subject_label_map)
+        """
+        association_map = {}
+        subject_label_map = {}
+        for (subj, label, obj) in self.skim(file):
+            subject_label_map[subj] = label
+            if subj not in association_map:
+                association_map[subj] = []
+            association_map[subj].append(obj)
+        return (association_map, subject_label_map)
+
+    def _skim_columns(self, file, db_col, id_col, label_col, qualifier_col, term_col, aspect_col=None, taxon_col=None):
+        """
+        Columnar implementation of `skim_association_map`.
+
+        The file is read in large blocks and each line is split only as
+        far as the columns needed. Each distinct subject is validated
+        once, so invalid subjects are reported on their first line only.
+        Subject and class IDs are interned.
+        """
+        file = self._ensure_file(file)
+        # the relation is only needed to apply include/exclude relation filters
+        check_relation = bool(self.config.include_relations) or bool(self.config.exclude_relations)
+        columns = [db_col, id_col, qualifier_col, term_col]
+        if label_col is not None:
+            columns.append(label_col)
+        if check_relation and aspect_col is not None:
+            columns.append(aspect_col)
+        num_columns = max(columns) + 1
+
+        association_map = {}
+        subject_label_map = {}
+        subject_ids = {}
+        term_ids = {}
+        remainder = ""
+        while True:
+            block = file.read(self.skim_block_size)
+            if block:
+                lines = (remainder + block).split("\n")
+                remainder = lines.pop()
+            else:
+                lines = [remainder]
+            for line in lines:
+                if line == "" or line.startswith("!"):
+                    continue
+                vals = line.split("\t", num_columns)
+                if len(vals) < num_columns:
+                    logger.error("Unexpected number of columns: {}".format(vals))
+                    continue
+                qualifier = vals[qualifier_col]
+                if "NOT" in qualifier:
+                    # never include NOTs in a skim
+                    if "NOT" in qualifier.split("|"):
+                        continue
+                if check_relation:
+                    aspect = vals[aspect_col] if aspect_col is not None else None
+                    _, relation, _ = self._parse_qualifier(qualifier, aspect)
+                    if self._is_exclude_relation(relation):
+                        continue
+                key = (vals[db_col], vals[id_col])
+                if key in subject_ids:
+                    id = subject_ids[key]
+                else:
+                    id = self._pair_to_id(*key)
+                    all_vals = line.split("\t")
+                    taxon = all_vals[taxon_col] if taxon_col is not None and taxon_col < len(all_vals) else ""
+                    if self._validate_id(id, SplitLine(line=line, values=all_vals, taxon=taxon), context=ENTITY):
+                        id = sys.intern(id)
+                    else:
+                        id = None
+                    subject_ids[key] = id
+                if id is None:
+                    continue
+                term = vals[term_col]
+                term = term_ids.setdefault(term, term)
+                if label_col is not None:
+                    subject_label_map[id] = vals[label_col]
+                else:
+                    subject_label_map[id] = None
+                if id in association_map:
+                    association_map[id].append(term)
+                else:
+                    association_map[id] = [term]
+            if not block:
+                break
+        return (association_map, subject_label_map)
+
     def normalize_columns(self, number_of_columns, columns):
         columns += [""] * (number_of_columns - len(columns))
         return columns
@@ -128,7 +128,7 @@ class GpadWriter(AssocWriter):
     def __init__(self, file=None):
         self.file = file
         self._write("!gpa-version: 1.1\n")
-        self.ecomap = ecomap.EcoMap()
+        self.ecomap = ecomap.default_ecomap()
 
     def as_tsv(self, assoc):
         """
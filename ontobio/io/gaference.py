@@ -11,7 +11,6 @@ from ontobio.model import association
 from ontobio.rdfgen import relations
 
 import logging
-import copy
 
 prefix_context = {key: value for context in curie_util.default_curie_maps + [curie_util.read_biocontext("go_context")] for key, value in context.items()}
 
@@ -165,12 +164,12 @@ def gaf_inferences_from_value(original_gaf: association.GoAssociation, inferred_
     # At this point it has inferences
     inferred_gafs = []  # type: List[association.GoAssociation]
     for inference in inferred_value.inferences:
-        new_gaf = copy.deepcopy(original_gaf)
         goterm = inference.term.rsplit("/", maxsplit=1)[1].replace("_", ":")
         aspect = relation_aspect_map[inference.relation]
-        new_gaf.object.id = goterm
-        new_gaf.aspect = aspect
-        new_gaf.object_extensions = []
+        # Everything but the term, aspect, and extensions is shared with the original
+        new_gaf = original_gaf.replace(object=association.Term(goterm, original_gaf.object.taxon),
+                                       aspect=aspect,
+                                       object_extensions=[])
         inferred_gafs.append(new_gaf)
 
     return InferenceResult(inferred_gafs, None)
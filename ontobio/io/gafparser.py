@@ -13,7 +13,7 @@ from ontobio.io import qc
 from ontobio.io import entityparser
 from ontobio.io import entitywriter
 from ontobio.model import association
-from ontobio.ecomap import EcoMap
+from ontobio.ecomap import default_ecomap
 from ontobio.rdfgen import relations
 
 import click
@@ -186,6 +186,9 @@ class GafParser(assocparser.AssocParser):
         return tuples
 
 
+    def skim_association_map(self, file):
+        return self._skim_columns(file, db_col=0, id_col=1, label_col=2, qualifier_col=3, term_col=4, aspect_col=8, taxon_col=12)
+
     def parse_line(self, line):
         """
         Parses a single line of a GAF
@@ -244,7 +247,12 @@ class GafParser(assocparser.AssocParser):
         assoc = parsed.associations[0]
         # self.report = parsed.report
         ## Run GO Rules, save split values into individual variables
-        go_rule_results = qc.test_go_rules(assoc, self.config, group=self.group)
+        if self.config.report_rule_passes:
+            go_rule_results = qc.test_go_rules(assoc, self.config, group=self.group)
+        else:
+            # Only rules that can fire are run, and only those that did not pass are returned
+            self.report.reporter.add_rules(qc.compile_rules(self.config).rule_numbers)
+            go_rule_results = qc.run_go_rules(assoc, self.config, group=self.group)
         for rule, result in go_rule_results.all_results.items():
             if result.result_type == qc.ResultType.WARNING:
                 self.report.warning(line, assocparser.Report.VIOLATES_GO_RULE, "",
@@ -458,8 +466,7 @@ class GafParser(assocparser.AssocParser):
 
         return assocparser.ParseResult(line, [assoc], False, evidence.upper())
 
-ecomap = EcoMap()
-ecomap.mappings()
+ecomap = default_ecomap()
 relation_tuple = re.compile(r'(.+)\((.+)\)')
 
 def to_association(gaf_line: List[str], report=None, group="unknown", dataset="unknown", qualifier_parser=Qualifier2_1()) -> assocparser.ParseResult:
@@ -76,6 +76,9 @@ class GpadParser(assocparser.AssocParser):
             tuples.append( (id,None,t) )
         return tuples
 
+    def skim_association_map(self, file):
+        return self._skim_columns(file, db_col=0, id_col=1, label_col=None, qualifier_col=2, term_col=3)
+
     def parse_line(self, line):
         """Parses a single line of a GPAD.
 
@@ -108,7 +111,12 @@ class GpadParser(assocparser.AssocParser):
 
         assoc = parsed.associations[0]
 
-        go_rule_results = qc.test_go_rules(assoc, self.config)
+        if self.config.report_rule_passes:
+            go_rule_results = qc.test_go_rules(assoc, self.config)
+        else:
+            # Only rules that can fire are run, and only those that did not pass are returned
+            self.report.reporter.add_rules(qc.compile_rules(self.config).rule_numbers)
+            go_rule_results = qc.run_go_rules(assoc, self.config)
         for rule, result in go_rule_results.all_results.items():
             if result.result_type == qc.ResultType.WARNING:
                 self.report.warning(line, assocparser.Report.VIOLATES_GO_RULE, "",
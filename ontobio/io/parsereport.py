@@ -1,18 +1,83 @@
 import json
+import random
+import collections
 
 import typing
 from typing import Dict, List, Optional
 
 Message = Dict[str, str]
 
+
+class Reservoir(list):
+    """
+    A list holding a uniform random sample of at most `size` of the items offered to it.
+
+    `seen` is the number of items offered so far.
+    """
+
+    def __init__(self, size: int, rand: Optional[random.Random]=None):
+        super().__init__()
+        self.size = size
+        self.seen = 0
+        self._random = rand if rand is not None else random.Random(0)
+
+    def offer(self, item) -> None:
+        self.seen += 1
+        if len(self) < self.size:
+            self.append(item)
+        else:
+            i = self._random.randrange(self.seen)
+            if i < self.size:
+                self[i] = item
+
+    def merge(self, other: "Reservoir") -> None:
+        """
+        Make this a sample of the items offered to either this or `other`
+        """
+        if len(self) + len(other) <= self.size:
+            self.extend(other)
+        else:
+            mine = list(self)
+            theirs = list(other)
+            self._random.shuffle(mine)
+            self._random.shuffle(theirs)
+            # Draw without replacement, each sample standing in for the items it was drawn from
+            (left, right) = (self.seen, getattr(other, "seen", len(other)))
+            sample = []
+            while len(sample) < self.size and (mine or theirs):
+                if theirs and (not mine or self._random.randrange(left + right) >= left):
+                    sample.append(theirs.pop())
+                    right -= 1
+                else:
+                    sample.append(mine.pop())
+                    left -= 1
+            self[:] = sample
+        self.seen += getattr(other, "seen", len(other))
+
+
 class Report(object):
 
-    def __init__(self, group, dataset):
+    def __init__(self, group, dataset, sample_size=None, seed=0):
+        """
+        If `sample_size` is given, the report aggregates: it counts every message
+        by rule, level and type, and keeps a random sample of at most `sample_size`
+        messages per rule. Otherwise the first 10000 messages per rule are kept.
+        """
         self.group = group
         self.dataset = dataset
+        self.sample_size = sample_size
+        self._random = random.Random(seed)
         self.messages = {} # type: Dict[str, List[Message]] # rule id --> List of messages
-        self.messages["other"] = []
+        self.messages["other"] = self._message_list()
+        # rule id --> (level, type) --> count, only kept when aggregating
+        self.counts = collections.defaultdict(collections.Counter)
         self._rule_message_cap = 10000
+        self._added_rules = None
+
+    def _message_list(self) -> List[Message]:
+        if self.sample_size is None:
+            return []
+        return Reservoir(self.sample_size, self._random)
 
     def _rule_id(self, id: int) -> str:
         """
@@ -33,11 +98,64 @@ class Report(object):
         """
         rule_id = self._rule_id(rule)
         if rule_id not in self.messages:
-            self.messages[rule_id] = []
+            self.messages[rule_id] = self._message_list()
 
-        if len(self.messages[rule_id]) < self._rule_message_cap and message["level"] != "INFO":
+        if self.sample_size is not None:
+            self.counts[rule_id][(message["level"], message["type"])] += 1
+            if message["level"] != "INFO":
+                self.messages[rule_id].offer(message)
+        elif len(self.messages[rule_id]) < self._rule_message_cap and message["level"] != "INFO":
             self.messages[rule_id].append(message)
 
+    def tally(self, level: str, type: str, rule: Optional[int]) -> None:
+        """
+        Account for a message that is not stored, such as an INFO message,
+        without building it: the rule is listed, and counted when aggregating
+        """
+        rule_id = self._rule_id(rule)
+        if rule_id not in self.messages:
+            self.messages[rule_id] = self._message_list()
+        if self.sample_size is not None:
+            self.counts[rule_id][(level, type)] += 1
+
+    def add_rules(self, rules: List[int]) -> None:
+        """
+        Make sure each rule in `rules` has a (possibly empty) list of messages,
+        as if a message had been reported for it.
+        """
+        if rules is self._added_rules:
+            return
+
+        for rule in rules:
+            rule_id = self._rule_id(rule)
+            if rule_id not in self.messages:
+                self.messages[rule_id] = self._message_list()
+        self._added_rules = rules
+
+    def merge(self, other: "Report") -> None:
+        """
+        Append the messages of `other`, as if its messages had been reported after ours
+        """
+        for (rule_id, messages) in other.messages.items():
+            if rule_id not in self.messages:
+                self.messages[rule_id] = self._message_list()
+            if self.sample_size is not None:
+                self.messages[rule_id].merge(messages)
+            else:
+                room = self._rule_message_cap - len(self.messages[rule_id])
+                self.messages[rule_id] += messages[:max(room, 0)]
+        for (rule_id, counts) in other.counts.items():
+            self.counts[rule_id].update(counts)
+
+    def totals(self) -> Dict[str, int]:
+        """
+        Number of messages reported per rule id, excluding INFO messages
+        """
+        if self.sample_size is None:
+            return {rule_id: len(messages) for (rule_id, messages) in self.messages.items()}
+        return {rule_id: sum(n for ((level, _), n) in self.counts.get(rule_id, {}).items() if level != "INFO")
+                for rule_id in self.messages}
+
     def json(self, lines, associations, skipped) -> Dict:
         result = {
             "group": self.group,
@@ -47,4 +165,11 @@ class Report(object):
             "associations": associations,
             "messages": self.messages
         }
+        if self.sample_size is not None:
+            # rule id --> level --> type --> count
+            counts = {}
+            for (rule_id, rule_counts) in self.counts.items():
+                for ((level, type), n) in rule_counts.items():
+                    counts.setdefault(rule_id, {}).setdefault(level, {})[type] = n
+            result["counts"] = counts
         return result
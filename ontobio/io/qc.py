@@ -2,7 +2,6 @@ import json
 import enum
 import collections
 import datetime
-import copy
 import logging
 
 from dataclasses import dataclass
@@ -55,6 +54,13 @@ def repair_result(repair_state: RepairState, fail_mode: FailMode) -> ResultType:
 
 class GoRule(object):
 
+    # Config attributes that must be set for this rule to ever fire. If any is None, the rule always passes
+    required_config = ()
+    # If not None, the rule always passes unless the annotation evidence type is in this set
+    triggering_evidence = None
+    # If not None, the rule always passes unless the subject id prefix is in this set
+    triggering_subject_prefixes = None
+
     def __init__(self, id, title, fail_mode: FailMode, tags=[]):
         self.id = id
         self.title = title
@@ -75,6 +81,13 @@ class GoRule(object):
         # Or, if any run_context_tags is in rule_tags_to_match, then run
         return len(self.run_context_tags) == 0 or any(self.run_context_tags & rule_tags_to_match)
 
+    def can_fire(self, config: assocparser.AssocParserConfig) -> bool:
+        """
+        False if this rule passes every annotation under `config`: it is not run
+        in the config's contexts, or config lacks metadata the rule checks against
+        """
+        return self._is_run_from_context(config) and all(getattr(config, attr) is not None for attr in self.required_config)
+
     def _run_if_context(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         result = TestResult(ResultType.PASS, "", annotation)
         if self._is_run_from_context(config):
@@ -131,6 +144,8 @@ class GoRule06(GoRule):
         super().__init__("GORULE:0000006", "IEP and HEP usage is restricted to terms from the Biological Process ontology", FailMode.HARD)
         self.iep = "ECO:0000270"
         self.hep = "ECO:0007007"
+        self.required_config = ("ontology",)
+        self.triggering_evidence = {self.iep, self.hep}
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         if config.ontology is None:
@@ -146,6 +161,8 @@ class GoRule07(GoRule):
     def __init__(self):
         super().__init__("GORULE:0000007", "IPI should not be used with catalytic activity molecular function terms", FailMode.SOFT)
         self.children_of_catalytic_activity = None
+        self.required_config = ("ontology",)
+        self.triggering_evidence = {"ECO:0000353"}
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         catalytic_activity = "GO:0003824"
@@ -170,6 +187,7 @@ class GoRule08(GoRule):
         super().__init__("GORULE:0000008", "No annotations should be made to uninformatively high level terms", FailMode.SOFT)
         self.do_not_annotate = None
         self.do_not_manually_annotate = None
+        self.required_config = ("ontology",)
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         # Cache the subsets
@@ -215,6 +233,7 @@ class GoRule13(GoRule):
     def __init__(self):
         super().__init__("GORULE:0000013", "Taxon-appropriate annotation check", FailMode.HARD)
         self.non_experimental_evidence = set(["ECO:0000318", "ECO:0000320", "ECO:0000321", "ECO:0000305", "ECO:0000247", "ECO:0000255", "ECO:0000266", "ECO:0000250", "ECO:0000303", "ECO:0000245", "ECO:0000304", "ECO:0000307", "ECO:0000501"])
+        self.required_config = ("annotation_inferences",)
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         if config.annotation_inferences is None:
@@ -247,6 +266,7 @@ class GoRule15(GoRule):
     def __init__(self):
         super().__init__("GORULE:0000015", "Dual species taxon check", FailMode.SOFT)
         self.allowed_dual_species_terms = None
+        self.required_config = ("ontology",)
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
 
@@ -276,6 +296,7 @@ class GoRule16(GoRule):
 
     def __init__(self):
         super().__init__("GORULE:0000016", "All IC annotations should include a GO ID in the \"With/From\" column", FailMode.HARD)
+        self.triggering_evidence = {"ECO:0000305"}
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         evidence = annotation.evidence.type
@@ -293,6 +314,7 @@ class GoRule17(GoRule):
 
     def __init__(self):
         super().__init__("GORULE:0000017", "IDA annotations must not have a With/From entry", FailMode.SOFT)
+        self.triggering_evidence = {"ECO:0000314"}
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         evidence = annotation.evidence.type
@@ -307,6 +329,7 @@ class GoRule18(GoRule):
 
     def __init__(self):
         super().__init__("GORULE:0000018", "IPI annotations require a With/From entry", FailMode.SOFT)
+        self.triggering_evidence = {"ECO:0000353"}
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         evidence = annotation.evidence.type
@@ -338,6 +361,7 @@ class GoRule28(RepairRule):
             "cellular_component": "C",
             "molecular_function": "F"
         }
+        self.required_config = ("ontology",)
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         aspect = annotation.aspect
@@ -375,6 +399,7 @@ class GoRule29(GoRule):
         super().__init__("GORULE:0000029", "All IEAs over a year are warned, all IEAs over two are removed", FailMode.HARD)
         self.one_year = datetime.timedelta(days=365)
         self.two_years = datetime.timedelta(days=730)
+        self.triggering_evidence = {"ECO:0000501"}
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         evidence = annotation.evidence.type
@@ -423,6 +448,7 @@ class GoRule37(GoRule):
 
     def __init__(self):
         super().__init__("GORULE:0000037", "IBA annotations should ONLY be assigned_by GO_Central and have PMID:21873635 as a reference", FailMode.HARD)
+        self.triggering_evidence = {"ECO:0000318"}
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         # If the evidence code is IBA, then (1) the assigned_by field must be GO_Central and (2) the reference field must be PMID:21873635
@@ -440,6 +466,7 @@ class GoRule39(GoRule):
 
     def __init__(self):
         super().__init__("GORULE:0000039", "Protein complexes can not be annotated to GO:0032991 (protein-containing complex) or its descendants", FailMode.HARD)
+        self.triggering_subject_prefixes = {"ComplexPortal"}
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         # An implementation note: This is done by testing if the DB (column 1) is ComplexPortal.
@@ -454,6 +481,7 @@ class GoRule42(GoRule):
 
     def __init__(self):
         super().__init__("GORULE:0000042", "Qualifier: IKR evidence code requires a NOT qualifier", FailMode.HARD)
+        self.triggering_evidence = {"ECO:0000320"}
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         evidence = annotation.evidence.type
@@ -469,7 +497,8 @@ class GoRule43(GoRule):
 
     def __init__(self):
         super().__init__("GORULE:0000043", "Check for valid combination of evidence code and GO_REF", FailMode.SOFT)
-        self.ecomapping = ecomap.EcoMap()
+        self.ecomapping = ecomap.default_ecomap()
+        self.required_config = ("goref_metadata",)
 
     def _ref_curi_to_id(self, goref) -> str:
         """
@@ -533,6 +562,7 @@ class GoRule50(GoRule):
     def __init__(self):
         super().__init__("GORULE:0000050", "Annotations to ISS, ISA and ISO should not be self-referential", FailMode.SOFT)
         self.the_evidences = ["ECO:0000250", "ECO:0000247", "ECO:0000266"]
+        self.triggering_evidence = set(self.the_evidences)
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         # should not have the same identifier in the 'gene product column' (column 2) and in the 'with/from' column (column 8)
@@ -566,6 +596,7 @@ class GoRule57(GoRule):
 
     def __init__(self):
         super().__init__("GORULE:0000057", "Group specific filter rules should be applied to annotations", FailMode.HARD, tags=["context-import"])
+        self.required_config = ("group_metadata",)
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
         # Check group_metadata is present
@@ -594,6 +625,7 @@ class GoRule58(RepairRule):
 
     def __init__(self):
         super().__init__("GORULE:0000058", "Object extensions should conform to the extensions-patterns.yaml file in metadata", FailMode.HARD, tags=["context-import"])
+        self.required_config = ("extensions_constraints", "ontology")
 
     def test(self, annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> TestResult:
 
@@ -605,21 +637,22 @@ class GoRule58(RepairRule):
 
         repair_state = RepairState.OKAY
 
-        bad_conjunctions = []
+        good_conjunctions = []
         for con in annotation.object_extensions:
             # Count each extension unit, represented by tuple (Relation, Namespace)
             extension_counts = collections.Counter([(unit.relation, unit.term.split(":")[0]) for unit in con.elements])
 
             matches = self._do_conjunctions_match_constraint(con, annotation.object.id, config.extensions_constraints, extension_counts)
             # If there is a match in the constraints, then we're all good and we can exit with a pass!
-            if not matches:
-                bad_conjunctions.append(con)
+            if matches:
+                good_conjunctions.append(con)
+            else:
                 repair_state = RepairState.REPAIRED
 
-        repaired_annotation = copy.deepcopy(annotation)
-        for con in bad_conjunctions:
-            # Remove the bad conjunctions as the "repair"
-            repaired_annotation.object_extensions.remove(con)
+        repaired_annotation = annotation
+        if repair_state == RepairState.REPAIRED:
+            # Remove the bad conjunctions as the "repair", sharing the rest of the annotation
+            repaired_annotation = annotation.replace(object_extensions=good_conjunctions)
 
         return TestResult(repair_result(repair_state, self.fail_mode), self.message(repair_state), repaired_annotation)
 
@@ -706,3 +739,83 @@ def test_go_rules(annotation: association.GoAssociation, config: assocparser.Ass
         all_results[rule.value] = result
 
     return GoRulesResults(all_results, active_annotation)
+
+
+class RulePlan(object):
+    """
+    The GO rules compiled for one AssocParserConfig.
+
+    Rules that cannot fire under the config (not run in its contexts, or missing
+    the metadata they check against) are dropped, and the remaining rules are
+    indexed by the evidence types and subject prefixes that trigger them. Rules
+    keep their `GoRules` order.
+
+    Use `compile_rules` rather than creating this directly.
+    """
+
+    def __init__(self, config: assocparser.AssocParserConfig):
+        self.key = RulePlan.config_key(config)
+        self.rules = [rule.value for rule in GoRules if rule.value.can_fire(config)]
+        # Numbers of all rules, including dropped ones, so reports can list every rule
+        self.rule_numbers = tuple(int(rule.value.id.split(":")[1]) for rule in GoRules)
+        self.uses_prefix = any(rule.triggering_subject_prefixes is not None for rule in self.rules)
+        self._rules_by_trigger = {}  # (evidence, prefix) -> List[GoRule]
+
+    @staticmethod
+    def config_key(config: assocparser.AssocParserConfig) -> Tuple:
+        """
+        The parts of `config` that decide which rules can fire
+        """
+        return (tuple(config.rule_contexts),) + tuple(getattr(config, attr) is None for attr in _REQUIRED_CONFIG)
+
+    def rules_for(self, annotation: association.GoAssociation) -> List[GoRule]:
+        """
+        Rules in this plan that can fire for `annotation`, in order
+        """
+        evidence = annotation.evidence.type
+        prefix = annotation.subject.id.split(":", maxsplit=1)[0] if self.uses_prefix else None
+        rules = self._rules_by_trigger.get((evidence, prefix))
+        if rules is None:
+            rules = [rule for rule in self.rules
+                        if (rule.triggering_evidence is None or evidence in rule.triggering_evidence) and
+                            (rule.triggering_subject_prefixes is None or prefix in rule.triggering_subject_prefixes)]
+            self._rules_by_trigger[(evidence, prefix)] = rules
+
+        return rules
+
+_REQUIRED_CONFIG = sorted(set(attr for rule in GoRules for attr in rule.value.required_config))
+
+
+def compile_rules(config: assocparser.AssocParserConfig) -> RulePlan:
+    """
+    Returns the RulePlan for `config`. The plan is cached on the config, and
+    rebuilt if the config has since changed in a way that affects it.
+    """
+    plan = config.rule_plan
+    if plan is None or plan.key != RulePlan.config_key(config):
+        plan = RulePlan(config)
+        config.rule_plan = plan
+
+    return plan
+
+
+def run_go_rules(annotation: association.GoAssociation, config: assocparser.AssocParserConfig, group=None) -> GoRulesResults:
+    """
+    Like `test_go_rules`, but only runs the rules in the compiled plan for `config`
+    that can fire for `annotation`, and `all_results` only holds the rules that did not pass.
+    """
+    failures = {}
+
+    active_annotation = annotation
+    # Repairs never change evidence or subject, so the triggered rules are fixed up front
+    for rule in compile_rules(config).rules_for(annotation):
+        result = rule.test(active_annotation, config, group=group)
+        if isinstance(rule, RepairRule):
+            active_annotation = result.result
+        else:
+            result.result = active_annotation
+
+        if result.result_type != ResultType.PASS:
+            failures[rule] = result
+
+    return GoRulesResults(failures, active_annotation)
@@ -27,6 +27,7 @@ import networkx as nx
 from networkx.algorithms import strongly_connected_components
 import logging
 import re
+import multiprocessing
 from ontobio.ontol import Synonym, Ontology
 from collections import defaultdict
 import pandas as pd
@@ -38,12 +39,59 @@ from marshmallow import Schema, fields, pprint, post_load
 LABEL_OR_EXACT = 'label_or_exact'
 logger = logging.getLogger(__name__)
 
+CAPS_PATTERN = re.compile('[A-Z]+')
+ALPHA_PATTERN = re.compile('.*[a-zA-Z]')
+CAMELCASE_PATTERN = re.compile('([a-z])([A-Z])')
+
 
 def logit(p):
     return math.log2(p/(1-p))
 def inv_logit(w):
     return 1/(1+2**(-w))
 
+# weights are log odds w=log(p/(1-p)) for (Sub,Sup,Eq,Other),
+# for a match between synonyms of a given pair of scopes
+SCOPE_PAIRS = [
+    ('label',   'label',   0.0, 0.0, 3.0,-0.8),
+    ('label',   'exact',   0.0, 0.0, 2.5,-0.5),
+    ('label',   'broad',  -1.0, 1.0, 0.0, 0.0),
+    ('label',   'narrow',  1.0,-1.0, 0.0, 0.0),
+    ('label',   'related', 0.0, 0.0, 0.0, 0.0),
+    ('exact',   'exact',   0.0, 0.0, 2.5,-0.5),
+    ('exact',   'broad',  -1.0, 1.0, 0.0, 0.0),
+    ('exact',   'narrow',  1.0,-1.0, 0.0, 0.0),
+    ('exact',   'related', 0.0, 0.0, 0.0, 0.0),
+    ('related', 'broad',  -0.5, 0.5, 0.0, 0.0),
+    ('related', 'narrow',  0.5,-0.5, 0.0, 0.0),
+    ('related', 'related', 0.0, 0.0, 0.0, 0.0),
+    ('broad',   'broad',   0.0, 0.0, 0.0, 1.0),
+    ('broad',   'narrow', -0.5, 0.5, 0.0, 0.2),
+    ('narrow',  'narrow',  0.0, 0.0, 0.0, 0.0)
+]
+SCOPES = ['LABEL', 'EXACT', 'BROAD', 'NARROW', 'RELATED']
+SCOPE_INDEX = {s: i for (i, s) in enumerate(SCOPES)}
+
+# weight of a match where one synonym is a substring of the other
+SUBSTRING_WEIGHT = 0.2
+
+def scope_weight_table():
+    """
+    Symmetric lookup table of weights for pairs of synonym scopes
+
+    Returns an array of shape (n+1, n+1, 4), where n is the number of SCOPES;
+    the final row and column are for unknown scopes, and are zero
+    """
+    n = len(SCOPES)
+    T = np.zeros((n+1, n+1, 4))
+    for (l,r,w1,w2,w3,w4) in SCOPE_PAIRS:
+        i = SCOPE_INDEX[l.upper()]
+        j = SCOPE_INDEX[r.upper()]
+        T[i, j] = (w1,w2,w3,w4)
+        T[j, i] = (w2,w1,w3,w4)
+    return T
+
+SCOPE_WEIGHTS = scope_weight_table()
+
 def default_wsmap():
     """
     Default word to normalized synonym list
@@ -75,6 +123,16 @@ def default_wsmap():
         '':''
     }
 
+_lexmap_worker = None
+
+def _init_lexmap_worker(engine):
+    # runs in each forked worker; the engine is inherited, not pickled
+    global _lexmap_worker
+    _lexmap_worker = engine
+
+def _lexical_forms_chunk(keys):
+    return [_lexmap_worker._lexical_forms(prefix, val) for (prefix, val) in keys]
+
 class LexicalMapEngine():
     """
     generates lexical matches between pairs of ontology classes
@@ -106,9 +164,39 @@ class LexicalMapEngine():
         self.merged_ontology = Ontology()
         self.config = config if config is not None else {}
         self.stats = {}
+        # caches used when indexing; see index_synonym
+        self._form_cache = {}
+        self._prefix_settings_cache = {}
+        # closures shared by semantic similarity scoring and weighted_axioms_batch;
+        # reset as ontologies are added, see index_ontology
+        self._blanket_cache = {}
+        self._ancestor_cache = {}
+        # previous xref graph and similarity scores, for incremental rescoring
+        self._scored_xref_graph = None
+        self._simscore_cache = {}
+        self._changed_nodes = set()
+        # caches used when scoring mappings; see weighted_axioms_batch
+        self._prefix_map = {}
+        self._syn_tables = {}
+        self._prior_cache = {}
+        self._cardinality_cache = {}
+        self._xref_weight_map = None
+
+    def index_ontologies(self, onts, processes=1):
+        """
+        Adds ontologies to the index
 
-    def index_ontologies(self, onts):
+        Arguments
+        ---------
+        onts : list
+            list of `Ontology` objects
+        processes : int
+            if greater than 1, the lexical forms of all synonyms are computed
+            in this many processes before indexing. None means the number of CPUs
+        """
         logger.info('Indexing: {}'.format(onts))
+        if processes is None or processes > 1:
+            self._parallel_lexical_forms(onts, processes)
         for ont in onts:
             self.index_ontology(ont)
         
@@ -119,6 +207,22 @@ class LexicalMapEngine():
         This iterates through all labels and synonyms in the ontology, creating an index
         """
         self.merged_ontology.merge([ont])
+        syns = self._ontology_synonyms(ont)
+        logger.info("Indexing {} syns in {}".format(len(syns),ont))
+        logger.info("Distinct lexical values: {}".format(len(self.lmap.keys())))
+        for syn in syns:
+            self.index_synonym(syn, ont)
+        # the merged ontology has changed, as have the blankets of nodes in ont
+        self._ancestor_cache = {}
+        for nid in ont.nodes():
+            self.id_to_ontology_map[nid].append(ont)
+            self._blanket_cache.pop(nid, None)
+            self._changed_nodes.add(nid)
+
+    def _ontology_synonyms(self, ont):
+        """
+        All synonyms to be indexed for an ontology, including labels, and IDs if meaningful_ids is set
+        """
         syns = ont.all_synonyms(include_label=True)
         
         include_id = self._is_meaningful_ids()
@@ -131,13 +235,33 @@ class LexicalMapEngine():
                     v = re.sub('.*/','',v)
                     v = re.sub('.*#','',v)
                 syns.append(Synonym(n, val=v, pred='label'))
-        
-        logger.info("Indexing {} syns in {}".format(len(syns),ont))
-        logger.info("Distinct lexical values: {}".format(len(self.lmap.keys())))
-        for syn in syns:
-            self.index_synonym(syn, ont)
-        for nid in ont.nodes():
-            self.id_to_ontology_map[nid].append(ont)
+        return syns
+
+    def _parallel_lexical_forms(self, onts, processes, chunk_size=10000):
+        """
+        Computes lexical forms of all synonym values in onts in a pool of forked
+        processes, populating the cache used by `_lexical_forms`
+        """
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            return
+        keys = set()
+        for ont in onts:
+            for syn in self._ontology_synonyms(ont):
+                if syn.val:
+                    prefix,_ = ont.prefix_fragment(syn.class_id)
+                    keys.add((prefix, syn.val))
+        keys = [k for k in keys if k not in self._form_cache]
+        if len(keys) == 0:
+            return
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        logger.info("Computing lexical forms for {} values in {} processes".format(len(keys), processes))
+        chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+        with context.Pool(processes, initializer=_init_lexmap_worker, initargs=(self,)) as pool:
+            for (chunk, forms) in zip(chunks, pool.map(_lexical_forms_chunk, chunks)):
+                self._form_cache.update(zip(chunk, forms))
 
     def label(self, nid):
         return self.merged_ontology.label(nid)
@@ -163,34 +287,19 @@ class LexicalMapEngine():
         syn.ontology = ont
         prefix,_ = ont.prefix_fragment(syn.class_id)
         
-        v = syn.val
-
-        caps_match = re.match('[A-Z]+',v)
-        if caps_match:
-            # if > 75% of length is caps, assume abbreviation
-            if caps_match.span()[1] >= len(v)/3:
-                syn.is_abbreviation(True)
-                
-        # chebi 'synonyms' are often not real synonyms
-        # https://github.com/ebi-chebi/ChEBI/issues/3294
-        if not re.match('.*[a-zA-Z]',v):
+        forms = self._lexical_forms(prefix, syn.val)
+        if forms is None:
+            # chebi 'synonyms' are often not real synonyms
+            # https://github.com/ebi-chebi/ChEBI/issues/3294
             if prefix != 'CHEBI':
                 logger.warning('Ignoring suspicous synonym: {}'.format(syn))
             return
-        
-        v = self._standardize_label(v)
-
-        # TODO: do this once ahead of time
-        wsmap = {}
-        for w,s in self.wsmap.items():
-            wsmap[w] = s
-        for ss in self._get_config_val(prefix,'synsets',[]):
-            # TODO: weights
-            wsmap[ss['synonym']] = ss['word']
-        nv = self._normalize_label(v, wsmap)
+        (v, nv, is_abbreviation) = forms
+        if is_abbreviation:
+            syn.is_abbreviation(True)
         
         self._index_synonym_val(syn, v)
-        nweight = self._get_config_val(prefix, 'normalized_form_confidence', 0.8)
+        (_, nweight) = self._prefix_settings(prefix)
         if nweight > 0 and not syn.is_abbreviation():
             if nv != v:
                 nsyn = Synonym(syn.class_id,
@@ -201,6 +310,51 @@ class LexicalMapEngine():
                                confidence=syn.confidence * nweight)
                 self._index_synonym_val(nsyn, nv)
 
+    def _lexical_forms(self, prefix, val):
+        """
+        Returns (standardized value, normalized value, is abbreviation) for a
+        synonym value in an ontology with a given prefix, or None if the value
+        should be ignored; memoized by (prefix, val)
+        """
+        k = (prefix, val)
+        if k in self._form_cache:
+            return self._form_cache[k]
+        v = val
+        is_abbreviation = False
+        caps_match = CAPS_PATTERN.match(v)
+        if caps_match:
+            # if > 75% of length is caps, assume abbreviation
+            if caps_match.span()[1] >= len(v)/3:
+                is_abbreviation = True
+
+        # values with no letters are not indexed
+        if not ALPHA_PATTERN.match(v):
+            forms = None
+        else:
+            v = self._standardize_label(v)
+            (wsmap, _) = self._prefix_settings(prefix)
+            forms = (v, self._normalize_label(v, wsmap), is_abbreviation)
+        self._form_cache[k] = forms
+        return forms
+
+    def _prefix_settings(self, prefix):
+        """
+        Returns (wsmap, normalized form confidence) for an ontology prefix,
+        where wsmap is the engine wsmap extended with synsets from the config
+        """
+        settings = self._prefix_settings_cache.get(prefix)
+        if settings is None:
+            wsmap = {}
+            for w,s in self.wsmap.items():
+                wsmap[w] = s
+            for ss in self._get_config_val(prefix,'synsets',[]):
+                # TODO: weights
+                wsmap[ss['synonym']] = ss['word']
+            nweight = self._get_config_val(prefix, 'normalized_form_confidence', 0.8)
+            settings = (wsmap, nweight)
+            self._prefix_settings_cache[prefix] = settings
+        return settings
+
     def _index_synonym_val(self, syn, v):
         lmap = self.lmap
         smap = self.smap
@@ -211,10 +365,11 @@ class LexicalMapEngine():
         if cid not in smap:
             smap[cid] = []
         smap[cid].append(syn)
+        self._syn_tables.pop(cid, None)
 
     def _standardize_label(self, v):
         # Add spaces separating camelcased strings
-        v = re.sub('([a-z])([A-Z])',r'\1 \2',v)
+        v = CAMELCASE_PATTERN.sub(r'\1 \2',v)
         
         # always use lowercase when comparing
         # we may want to make this configurable in future
@@ -280,6 +435,10 @@ class LexicalMapEngine():
         score: int
             score indicating strength of mapping, between 0 and 100
 
+        If this is called again after more ontologies have been indexed, or
+        ontology_pairs has changed, semantic similarity is only recomputed for
+        mappings that may be affected by the changes; see `score_xrefs_by_semsim`
+
         Returns
         -------
         Graph
@@ -295,6 +454,7 @@ class LexicalMapEngine():
         i = 0
         sum_nsyns = 0
         n_skipped = 0
+        g_size = 0
         has_self_comparison = False
         if self.ontology_pairs:
             for (o1id,o2id) in self.ontology_pairs:
@@ -321,7 +481,9 @@ class LexicalMapEngine():
                         next
                     if s1cid != s2.class_id:
                         if self._is_comparable(s1,s2):
-                            g.add_edge(s1.class_id, s2.class_id, syns=(s1,s2))
+                            # explicit keys avoid a search for a free key per edge
+                            g.add_edge(s1.class_id, s2.class_id, key=g_size, syns=(s1,s2))
+                            g_size += 1
 
         logger.info("getting best supporting synonym pair for each match")
         # graph of best matches
@@ -343,7 +505,7 @@ class LexicalMapEngine():
                             syns=syns,
                             idpair=(i,j))
 
-        self.score_xrefs_by_semsim(xg)
+        self._rescore_xrefs_by_semsim(xg)
         self.assign_best_matches(xg)
         if self.merged_ontology.xref_graph is not None:
             self.compare_to_xrefs(xg, self.merged_ontology.xref_graph)
@@ -365,44 +527,146 @@ class LexicalMapEngine():
             return s1.class_id < s2.class_id
 
     def _blanket(self, nid):
-        nodes = set()
-        for ont in self.id_to_ontology_map[nid]:
-            nodes.update(ont.ancestors(nid))
-            nodes.update(ont.descendants(nid))
-        return list(nodes)
+        """
+        All ancestors and descendants of a node, in each ontology it belongs to; memoized
+        """
+        nodes = self._blanket_cache.get(nid)
+        if nodes is None:
+            nodes = set()
+            for ont in self.id_to_ontology_map[nid]:
+                nodes.update(ont.ancestors(nid))
+                nodes.update(ont.descendants(nid))
+            nodes = list(nodes)
+            self._blanket_cache[nid] = nodes
+        return nodes
+
+    def _ancestors(self, nid):
+        """
+        Ancestors of a node in the merged ontology, as a set; memoized
+        """
+        ancs = self._ancestor_cache.get(nid)
+        if ancs is None:
+            ancs = set(self.merged_ontology.ancestors(nid))
+            self._ancestor_cache[nid] = ancs
+        return ancs
+
+    def _neighbors_by_prefix(self, xg):
+        """
+        Index of an xref graph: maps each node to a dict of prefix -> neighbors with that prefix
+        """
+        index = {}
+        for n in xg.nodes():
+            m = defaultdict(set)
+            for x in xg.neighbors(n):
+                m[self._id_to_ontology(x)].add(x)
+            index[n] = m
+        return index
     
-    def score_xrefs_by_semsim(self, xg, ont=None):
+    def score_xrefs_by_semsim(self, xg, ont=None, edges=None):
         """
         Given an xref graph (see ref:`get_xref_graph`), this will adjust scores based on
         the semantic similarity of matches.
+
+        Arguments
+        ---------
+        xg : Graph
+            an xref graph
+        edges : list
+            if set, only these (i, j) edges are scored
         """
         logger.info("scoring xrefs by semantic similarity for {} nodes in {}".format(len(xg.nodes()), ont))
-        for (i,j,d) in xg.edges(data=True):
+        if edges is None:
+            edges = xg.edges()
+        nbrs = self._neighbors_by_prefix(xg)
+        for (i,j) in edges:
             pfx1 = self._id_to_ontology(i)
             pfx2 = self._id_to_ontology(j)
             ancs1 = self._blanket(i)
             ancs2 = self._blanket(j)
-            s1,_,_ = self._sim(xg, ancs1, ancs2, pfx1, pfx2)
-            s2,_,_ = self._sim(xg, ancs2, ancs1, pfx2, pfx1)
+            s1,_,_ = self._sim(xg, ancs1, ancs2, pfx1, pfx2, nbrs=nbrs)
+            s2,_,_ = self._sim(xg, ancs2, ancs1, pfx2, pfx1, nbrs=nbrs)
             s = 1 - ((1-s1) * (1-s2))
-            logger.debug("Score {} x {} = {} x {} = {} // {}".format(i,j,s1,s2,s, d))
+            logger.debug("Score %s x %s = %s x %s = %s", i, j, s1, s2, s)
             xg[i][j][self.SIMSCORES] = (s1,s2)
             xg[i][j][self.SCORE] *= s
+            self._simscore_cache[(i,j)] = (s1,s2)
+
+    def _rescore_xrefs_by_semsim(self, xg):
+        """
+        As `score_xrefs_by_semsim`, but reuses similarity scores from the previous
+        xref graph for edges unaffected by changes since it was scored
+
+        The similarity of (i, j) depends on the blankets of i and j, and the
+        neighbors in xg of nodes in those blankets. An edge is rescored if either
+        node belongs to a newly indexed ontology, or if either blanket includes
+        such a node or a node whose set of neighbors has changed
+        """
+        prev = self._scored_xref_graph
+        changed = self._changed_nodes
+        self._scored_xref_graph = xg
+        self._changed_nodes = set()
+        if prev is None:
+            self._simscore_cache = {}
+            self.score_xrefs_by_semsim(xg)
+            return
+        for (i,j) in self._edge_changes(prev, xg):
+            changed.add(i)
+            changed.add(j)
+        affected = set(n for n in xg.nodes() if n in changed or not changed.isdisjoint(self._blanket(n)))
+        edges = []
+        cache = self._simscore_cache
+        self._simscore_cache = {}
+        for (i,j) in xg.edges():
+            if i in affected or j in affected:
+                edges.append((i,j))
+            elif (i,j) in cache:
+                self._set_simscores(xg, i, j, cache[(i,j)])
+            elif (j,i) in cache:
+                (s2,s1) = cache[(j,i)]
+                self._set_simscores(xg, i, j, (s1,s2))
+            else:
+                edges.append((i,j))
+        logger.info("rescoring {} of {} xrefs".format(len(edges), xg.number_of_edges()))
+        self.score_xrefs_by_semsim(xg, edges=edges)
 
-    def _sim(self, xg, ancs1, ancs2, pfx1, pfx2):
+    def _edge_changes(self, g1, g2):
+        """
+        Edges in exactly one of two graphs
+        """
+        for (i,j) in g1.edges():
+            if not g2.has_edge(i,j):
+                yield (i,j)
+        for (i,j) in g2.edges():
+            if not g1.has_edge(i,j):
+                yield (i,j)
+
+    def _set_simscores(self, xg, i, j, simscores):
+        (s1,s2) = simscores
+        s = 1 - ((1-s1) * (1-s2))
+        xg[i][j][self.SIMSCORES] = (s1,s2)
+        xg[i][j][self.SCORE] *= s
+        self._simscore_cache[(i,j)] = (s1,s2)
+
+    def _sim(self, xg, ancs1, ancs2, pfx1, pfx2, nbrs=None):
         """
         Compare two lineages
+
+        nbrs is an optional index of xg, see `_neighbors_by_prefix`
         """
         xancs1 = set()
         for a in ancs1:
             if a in xg:
+                if nbrs is not None:
+                    xancs1.update(nbrs[a].get(pfx2, ()))
+                    continue
                 # TODO: restrict this to neighbors in single ontology
                 for n in xg.neighbors(a):
                     pfx = self._id_to_ontology(n)
                     if pfx == pfx2:
                         xancs1.add(n)
-        logger.debug('SIM={}/{} ## {}'.format(len(xancs1.intersection(ancs2)), len(xancs1), xancs1.intersection(ancs2), xancs1))
-        n_shared = len(xancs1.intersection(ancs2))
+        shared = xancs1.intersection(ancs2)
+        logger.debug('SIM=%s/%s ## %s', len(shared), len(xancs1), shared)
+        n_shared = len(shared)
         n_total = len(xancs1)
         return (1+n_shared) / (1+n_total), n_shared, n_total
 
@@ -410,8 +674,8 @@ class LexicalMapEngine():
     # return map keyed by ontology id, value is a list of (score, ext_class_id) pairs
     def _neighborscores_by_ontology(self, xg, nid):
         xrefmap = defaultdict(list)
-        for x in xg.neighbors(nid):
-            score = xg[nid][x][self.SCORE]
+        for (x, edge) in xg[nid].items():
+            score = edge[self.SCORE]
             for ont in self.id_to_ontology_map[x]:
                 xrefmap[ont.id].append( (score,x) )
         return xrefmap
@@ -426,7 +690,11 @@ class LexicalMapEngine():
             return None
 
     def _id_to_ontology(self, id):
-        return self.merged_ontology.prefix(id)
+        pfx = self._prefix_map.get(id)
+        if pfx is None:
+            pfx = self.merged_ontology.prefix(id)
+            self._prefix_map[id] = pfx
+        return pfx
         #onts = self.id_to_ontology_map[id]
         #if len(onts) > 1:
         #    logger.warning(">1 ontology for {}".format(id))
@@ -476,22 +744,24 @@ class LexicalMapEngine():
         """
         logger.info("assigning best matches for {} nodes".format(len(xg.nodes())))
         for i in xg.nodes():
+            edges_i = xg[i]
             xrefmap = self._neighborscores_by_ontology(xg, i)
             for (ontid,score_node_pairs) in xrefmap.items():
                 score_node_pairs.sort(reverse=True)
                 (best_score,best_node) = score_node_pairs[0]
-                logger.info("BEST for {}: {} in {} from {}".format(i, best_node, ontid, score_node_pairs))
-                edge = xg[i][best_node]
+                logger.debug("BEST for %s: %s in %s from %s", i, best_node, ontid, score_node_pairs)
+                edge = edges_i[best_node]
                 dirn = self._dirn(edge, i, best_node)
                 best_kwd = 'best_' + dirn
                 if len(score_node_pairs) == 1 or score_node_pairs[0] > score_node_pairs[1]:
                     edge[best_kwd] = 2
                 else:
                     edge[best_kwd] = 1
+                total = sum([s for s,_ in score_node_pairs])
                 for (score,j) in score_node_pairs:
-                    edge_ij = xg[i][j]
+                    edge_ij = edges_i[j]
                     dirn_ij = self._dirn(edge_ij, i, j)
-                    edge_ij['cpr_'+dirn_ij] = score / sum([s for s,_ in score_node_pairs])
+                    edge_ij['cpr_'+dirn_ij] = score / total
         for (i,j,edge) in xg.edges(data=True):
             # reciprocal score is set if (A) i is best for j, and (B) j is best for i
             rs = 0
@@ -500,36 +770,104 @@ class LexicalMapEngine():
             edge['reciprocal_score'] = rs
             edge['cpr'] = edge['cpr_fwd'] * edge['cpr_rev']
 
-    def _best_match_syn(self, sx, sys, scope_map):
+    def _syn_table(self, nid):
         """
+        Returns (values, scope indexes, confidences, abbreviation confidence) for
+        all indexed synonyms of a node, used when comparing synonyms of pairs of nodes
+        """
+        t = self._syn_tables.get(nid)
+        if t is None:
+            syns = self.smap.get(nid, [])
+            vals = [self._standardize_label(s.val) for s in syns]
+            scopes = np.array([SCOPE_INDEX.get(s.scope(), len(SCOPES)) for s in syns], dtype=np.intp)
+            confs = np.array([s.confidence for s in syns], dtype=float)
+            abbr = self._get_config_val(self._id_to_ontology(nid), 'abbreviation_confidence', 0.5)
+            t = (vals, scopes, confs, abbr)
+            self._syn_tables[nid] = t
+        return t
+
+    def _best_match_weights(self, x, y):
+        """
+        Weights for the best match between any synonym of x and any synonym of y
+
+        Exact matches are weighted by the scopes of the two synonyms (see
+        :data:`SCOPE_WEIGHTS`) plus the log odds of the combined confidence;
+        a synonym that is a substring of the other suggests a sub/superclass.
         The best match is determined by the highest magnitude weight
         """
-        SUBSTRING_WEIGHT = 0.2
-        WBEST = None
-        sbest = None
-        sxv = self._standardize_label(sx.val)
-        sxp = self._id_to_ontology(sx.class_id)
-        for sy in sys:
-            syv = self._standardize_label(sy.val)
-            syp = self._id_to_ontology(sy.class_id)
-            W = None
-            if sxv == syv:
-                confidence = sx.confidence * sy.confidence
-                if sx.is_abbreviation() or sy.is_abbreviation:
-                    confidence *= self._get_config_val(sxp, 'abbreviation_confidence', 0.5)
-                    confidence *= self._get_config_val(syp, 'abbreviation_confidence', 0.5)
-                W = scope_map[sx.scope()][sy.scope()] + logit(confidence/2)
-            elif sxv in syv:
-                W = np.array((-SUBSTRING_WEIGHT, SUBSTRING_WEIGHT, 0, 0))
-            elif syv in sxv:
-                W = np.array((SUBSTRING_WEIGHT, -SUBSTRING_WEIGHT, 0, 0))
-            if W is not None:
-                # The best match is determined by the highest magnitude weight
-                if WBEST is None or max(abs(W)) > max(abs(WBEST)):
-                    WBEST = W
-                    sbest = sy
-        return WBEST, sbest
-    
+        (xvals, xscopes, xconfs, xabbr) = self._syn_table(x)
+        (yvals, yscopes, yconfs, yabbr) = self._syn_table(y)
+        W = np.zeros((len(xvals), len(yvals), 4))
+        if W.size == 0:
+            return np.zeros(4)
+        matched = np.zeros(W.shape[0:2], dtype=bool)
+        eq = np.zeros(W.shape[0:2], dtype=bool)
+        for (i, xv) in enumerate(xvals):
+            for (j, yv) in enumerate(yvals):
+                if xv == yv:
+                    eq[i, j] = True
+                elif xv in yv:
+                    W[i, j] = (-SUBSTRING_WEIGHT, SUBSTRING_WEIGHT, 0, 0)
+                elif yv in xv:
+                    W[i, j] = (SUBSTRING_WEIGHT, -SUBSTRING_WEIGHT, 0, 0)
+                else:
+                    continue
+                matched[i, j] = True
+        if eq.any():
+            # note the abbreviation confidence is applied to all exact matches
+            confidence = xconfs[:, np.newaxis] * yconfs[np.newaxis, :] * xabbr * yabbr
+            logits = np.array([logit(c/2) for c in confidence[eq]])
+            W[eq] = SCOPE_WEIGHTS[xscopes[:, np.newaxis], yscopes[np.newaxis, :]][eq] + logits[:, np.newaxis]
+        magnitude = np.where(matched, np.abs(W).max(axis=2), 0.0)
+        # first match of highest magnitude, in synonym order
+        (i, j) = np.unravel_index(np.argmax(magnitude), magnitude.shape)
+        if magnitude[i, j] > 0:
+            return W[i, j]
+        return np.zeros(4)
+
+    def _prior_weights(self, pfx1, pfx2):
+        """
+        Weights for a match between classes in a pair of ontologies, from the
+        match_weights and default_weights config; memoized by prefix pair
+        """
+        WS = self._prior_cache.get((pfx1, pfx2))
+        if WS is None:
+            # TODO: get prior based on ontology pair
+            for mw in self.config.get('match_weights', []):
+                mpfx1 = mw.get('prefix1','')
+                mpfx2 = mw.get('prefix2','')
+                X = np.array(mw['weights'], dtype=float)
+                if mpfx1 == pfx1 and mpfx2 == pfx2:
+                    WS = X
+                elif mpfx2 == pfx1 and mpfx1 == pfx2:
+                    WS = self._flipweights(X)
+                elif mpfx1 == pfx1 and mpfx2 == '' and WS is None:
+                    WS = X
+                elif mpfx2 == pfx1 and mpfx1 == '' and WS is None:
+                    WS = self._flipweights(X)
+            if WS is None:
+                WS = np.array((0.0, 0.0, 0.0, 0.0))
+            # defaults
+            WS += np.array(self.config.get('default_weights', [0.0, 0.0, 1.5, -0.1]))
+            self._prior_cache[(pfx1, pfx2)] = WS
+        return WS
+
+    def _xref_weights(self, x, y):
+        """
+        List of weights from the xref_weights config that apply to the pair (x, y)
+        """
+        if self._xref_weight_map is None:
+            m = defaultdict(list)
+            for xw in self.config.get('xref_weights', []):
+                left = xw.get('left','')
+                right = xw.get('right','')
+                X = np.array(xw['weights'])
+                m[(left, right)].append(X)
+                if left != right:
+                    m[(right, left)].append(self._flipweights(X))
+            self._xref_weight_map = m
+        return self._xref_weight_map.get((x, y), [])
+
     def weighted_axioms(self, x, y, xg):
         """
         return a tuple (sub,sup,equiv,other) indicating estimated prior probabilities for an interpretation of a mapping
@@ -537,122 +875,71 @@ class LexicalMapEngine():
 
         See kboom paper
         """
-        # TODO: allow additional weighting
-        # weights are log odds w=log(p/(1-p))
-        # (Sub,Sup,Eq,Other)
-        scope_pairs = [
-            ('label',   'label',   0.0, 0.0, 3.0,-0.8), 
-            ('label',   'exact',   0.0, 0.0, 2.5,-0.5), 
-            ('label',   'broad',  -1.0, 1.0, 0.0, 0.0), 
-            ('label',   'narrow',  1.0,-1.0, 0.0, 0.0), 
-            ('label',   'related', 0.0, 0.0, 0.0, 0.0), 
-            ('exact',   'exact',   0.0, 0.0, 2.5,-0.5), 
-            ('exact',   'broad',  -1.0, 1.0, 0.0, 0.0), 
-            ('exact',   'narrow',  1.0,-1.0, 0.0, 0.0), 
-            ('exact',   'related', 0.0, 0.0, 0.0, 0.0), 
-            ('related', 'broad',  -0.5, 0.5, 0.0, 0.0), 
-            ('related', 'narrow',  0.5,-0.5, 0.0, 0.0), 
-            ('related', 'related', 0.0, 0.0, 0.0, 0.0), 
-            ('broad',   'broad',   0.0, 0.0, 0.0, 1.0), 
-            ('broad',   'narrow', -0.5, 0.5, 0.0, 0.2), 
-            ('narrow',  'narrow',  0.0, 0.0, 0.0, 0.0)
-        ]
-        # populate symmetric lookup matrix
-        scope_map = defaultdict(dict)
-        for (l,r,w1,w2,w3,w4) in scope_pairs:
-            l = l.upper()
-            r = r.upper()
-            scope_map[l][r] = np.array((w1,w2,w3,w4))
-            scope_map[r][l] = np.array((w2,w1,w3,w4))
-
-        # TODO: get prior based on ontology pair
-        # cumulative sum of weights
-        WS = None
-        pfx1 = self._id_to_ontology(x)
-        pfx2 = self._id_to_ontology(y)
-        for mw in self.config.get('match_weights', []):
-            mpfx1 = mw.get('prefix1','')
-            mpfx2 = mw.get('prefix2','')
-            X = np.array(mw['weights'])
-            if mpfx1 == pfx1 and mpfx2 == pfx2:
-                WS = X
-            elif mpfx2 == pfx1 and mpfx1 == pfx2:
-                WS = self._flipweights(X)
-            elif mpfx1 == pfx1 and mpfx2 == '' and WS is None:
-                WS = X
-            elif mpfx2 == pfx1 and mpfx1 == '' and WS is None:
-                WS = self._flipweights(X)
+        return self.weighted_axioms_batch([(x, y)], xg)[0]
 
-        if WS is None:
-            WS = np.array((0.0, 0.0, 0.0, 0.0))
-        # defaults
-        WS += np.array(self.config.get('default_weights', [0.0, 0.0, 1.5, -0.1]))
-        logger.info('WS defaults={}'.format(WS))
-
-        for xw in self.config.get('xref_weights', []):
-            left = xw.get('left','')
-            right = xw.get('right','')
-            X = np.array(xw['weights'])
-            if x == left and y == right:
-                WS += X
-                logger.info('MATCH: {} for {}-{}'.format(X, x, y))
-            elif y == left and x == right:
-                WS += self._flipweights(X)
-                logger.info('IMATCH: {}'.format(X))
+    def weighted_axioms_batch(self, pairs, xg):
+        """
+        Estimated prior probabilities for interpretations of many mappings at once
 
-        smap = self.smap
-        # TODO: symmetrical
-        WT = np.array((0.0, 0.0, 0.0, 0.0))
-        WBESTMAX = np.array((0.0, 0.0, 0.0, 0.0))
-        n = 0
-        for sx in smap[x]:
-            WBEST, _ = self._best_match_syn(sx, smap[y], scope_map)
-            if WBEST is not None:
-                WT += WBEST
-                n += 1
-                if max(abs(WBEST)) > max(abs(WBESTMAX)):
-                    WBESTMAX = WBEST
-        for sy in smap[y]:
-            WBEST, _ = self._best_match_syn(sy, smap[x], scope_map)
-            if WBEST is not None:
-                WT += WBEST
-                n += 1
-        # average best match
-        if n > 0:
-            logger.info('Adding BESTMAX={}'.format(WBESTMAX))
-            WS += WBESTMAX
-                    
-        # TODO: xref, many to many
-        WS += self._graph_weights(x, y, xg)
-        # TODO: include additional defined weights, eg ORDO
-        logger.info('Adding WS, gw={}'.format(WS))
+        Equivalent to calling :meth:`weighted_axioms` for each pair, but weight
+        tables derived from the config are computed once, and the final
+        probabilities are calculated over all pairs as arrays
+
+        Arguments
+        ---------
+        pairs : list
+            list of (x, y) class id pairs; each must be an edge in xg
+        xg : Graph
+            an xref graph, see :meth:`get_xref_graph`
+
+        Returns
+        -------
+        ndarray
+            array of shape (len(pairs), 4), each row being (sub,sup,equiv,other)
+        """
+        # weights are log odds w=log(p/(1-p))
+        # (Sub,Sup,Eq,Other)
+        WS = np.zeros((len(pairs), 4))
+        sims = np.zeros((len(pairs), 2))
+        rs = np.zeros(len(pairs), dtype=int)
+        nbrs = self._neighbors_by_prefix(xg)
+        for (k, (x, y)) in enumerate(pairs):
+            W = WS[k]
+            W += self._prior_weights(self._id_to_ontology(x), self._id_to_ontology(y))
+            for X in self._xref_weights(x, y):
+                W += X
+            W += self._best_match_weights(x, y)
+            # TODO: xref, many to many
+            W += self._graph_weights(x, y, xg, nbrs=nbrs)
+            # TODO: include additional defined weights, eg ORDO
+            logger.debug('WS for %s-%s = %s', x, y, W)
+            sims[k] = xg[x][y][self.SIMSCORES]
+            rs[k] = xg[x][y]['reciprocal_score']
 
         # jaccard similarity
-        (ss1,ss2) = xg[x][y][self.SIMSCORES]
-        WS[3] += ((1-ss1) + (1-ss2)) / 2
+        WS[:, 3] += ((1-sims[:, 0]) + (1-sims[:, 1])) / 2
 
         # reciprocal best hits are higher confidence of equiv
-        rs = xg[x][y]['reciprocal_score']
-        if rs == 4:
-            WS[2] += 0.5
-        if rs == 0:
-            WS[2] -= 0.2
-        
-        #P = np.expit(WS)
+        WS[rs == 4, 2] += 0.5
+        WS[rs == 0, 2] -= 0.2
+
         P = 1/(1+np.exp(-WS))
-        logger.info('Final WS={}, init P={}'.format(WS, P))
         # probs should sum to 1.0
-        P = P / np.sum(P)
+        P = P / np.sum(P, axis=1)[:, np.newaxis]
         return P
 
-    def _graph_weights(self, x, y, xg):
-        ont = self.merged_ontology
-        xancs = ont.ancestors(x)
-        yancs = ont.ancestors(y)
+    def _graph_weights(self, x, y, xg, nbrs=None):
+        ancestors = self._ancestors
+        xancs = ancestors(x)
+        yancs = ancestors(y)
         pfx = self._id_to_ontology(x)
         pfy = self._id_to_ontology(y)
-        xns = [n for n in xg.neighbors(y) if n != x and pfx == self._id_to_ontology(n)]
-        yns = [n for n in xg.neighbors(x) if n != y and pfy == self._id_to_ontology(n)]
+        if nbrs is None:
+            xns = [n for n in xg.neighbors(y) if n != x and pfx == self._id_to_ontology(n)]
+            yns = [n for n in xg.neighbors(x) if n != y and pfy == self._id_to_ontology(n)]
+        else:
+            xns = [n for n in nbrs[y].get(pfx, ()) if n != x]
+            yns = [n for n in nbrs[x].get(pfy, ()) if n != y]
         pweight = 1.0
         W = np.array((0,0,0,0))
         card = '11'
@@ -661,7 +948,7 @@ class LexicalMapEngine():
             for x2 in xns:
                 if x2 in xancs:
                     W[0] += pweight
-                if x in ont.ancestors(x2):
+                if x in ancestors(x2):
                     W[1] += pweight
         if len(yns) > 0:
             if card == '11':
@@ -671,17 +958,26 @@ class LexicalMapEngine():
             for y2 in yns:
                 if y2 in yancs:
                     W[1] += pweight
-                if y in ont.ancestors(y2):
+                if y in ancestors(y2):
                     W[0] += pweight
 
-        logger.debug('CARD: {}/{} <-> {}/{} = {} // X={} Y={} // W={}'.format(x,pfx, y,pfy, card, xns, yns, W))
+        logger.debug('CARD: %s/%s <-> %s/%s = %s // X=%s Y=%s // W=%s', x,pfx, y,pfy, card, xns, yns, W)
+        return W + self._cardinality_weights(pfx, pfy, card)
+
+    def _cardinality_weights(self, pfx, pfy, card):
+        """
+        Weights for a mapping with a given cardinality between classes in a
+        pair of ontologies; memoized by (pfx, pfy, card)
+        """
+        CW = self._cardinality_cache.get((pfx, pfy, card))
+        if CW is not None:
+            return CW
         invcard = card
         if card == '1m':
             invcard = 'm1'
         elif card == 'm1':
             invcard = '1m'
-            
-        CW = None
+
         DEFAULT_CW = None
         for cw in self.config.get('cardinality_weights', []):
             if 'prefix1' not in cw and 'prefix2' not in cw:
@@ -708,7 +1004,8 @@ class LexicalMapEngine():
                     CW = np.array((0.4, 0.6, 0.0, 0.0))
                 elif card == 'mm':
                     CW = np.array((0.2, 0.2, 0.0, 0.5))
-        return W + CW
+        self._cardinality_cache[(pfx, pfy, card)] = CW
+        return CW
     
     def _flipweights(self, W):
         return np.array((W[1],W[0],W[2],W[3]))
@@ -764,7 +1061,7 @@ class LexicalMapEngine():
         if s1.is_abbreviation() or s2.is_abbreviation():
             s *= self._get_config_val(self._id_to_ontology(s1.class_id), 'abbreviation_confidence', 0.5)
             s *= self._get_config_val(self._id_to_ontology(s1.class_id), 'abbreviation_confidence', 0.5)
-        logger.debug("COMBINED: {} + {} = {}/{}".format(s1,s2,cpred,s))
+        logger.debug("COMBINED: %s + %s = %s/%s", s1, s2, cpred, s)
         return round(s)
     
     def _rollup(self, p):
@@ -799,15 +1096,21 @@ class LexicalMapEngine():
     
     def as_dataframe(self, xg):
         cliques = self.cliques(xg)
+        clique_map = {}
+        for s in cliques:
+            for n in s:
+                clique_map.setdefault(n, s)
         ont = self.merged_ontology
         items = []
-        for (x,y,d) in xg.edges(data=True):
-            # xg is a non-directional Graph object.
-            # to get a deterministic ordering we use the idpair key
+        edges = list(xg.edges(data=True))
+        # xg is a non-directional Graph object.
+        # to get a deterministic ordering we use the idpair key
+        PS = self.weighted_axioms_batch([d['idpair'] for (_,_,d) in edges], xg)
+        for ((_,_,d), P) in zip(edges, PS):
             (x,y) = d['idpair']
             (s1,s2)=d['syns']
             (ss1,ss2)=d['simscores']
-            clique = self._in_clique(x, cliques)
+            clique = clique_map.get(x, set())
             #ancs = nx.ancestors(g,x)
             left_label = ont.label(x)
             right_label = ont.label(y)
@@ -816,7 +1119,6 @@ class LexicalMapEngine():
             if ont.is_obsolete(y) and not right_label.startwith('obsolete'):
                 right_label = "obsolete " + right_label
 
-            P = self.weighted_axioms(x,y,xg)
             item = {'left':x, 'left_label':left_label,
                     'right':y, 'right_label':right_label,
                     'score':d['score'],
@@ -4,10 +4,11 @@ import collections
 import enum
 import datetime
 import re
+import sys
+import dataclasses
 
-from ontobio.ecomap import EcoMap
-ecomap = EcoMap()
-ecomap.mappings()
+from ontobio.ecomap import default_ecomap
+ecomap = default_ecomap()
 
 
 from typing import List, Optional, NamedTuple, Dict, Callable, Union, TypeVar
@@ -18,8 +19,12 @@ Curie = typing.NewType("Curie", str)
 Provider = typing.NewType("Provider", str)
 Date = typing.NewType("Date", str)
 
+# The model classes below are slotted: there may be many millions of them in memory,
+# and a per-instance __dict__ would dominate their size. See also AssociationInterner
+
 @dataclass
 class Subject:
+    __slots__ = ("id", "label", "fullname", "synonyms", "type", "taxon")
     id: Curie
     label: str
     fullname: str
@@ -29,6 +34,7 @@ class Subject:
 
 @dataclass
 class Term:
+    __slots__ = ("id", "taxon")
     id: Curie
     taxon: Curie
 
@@ -40,6 +46,7 @@ class Error:
 
 @dataclass(unsafe_hash=True)
 class ConjunctiveSet:
+    __slots__ = ("elements",)
     elements: List
 
     def __str__(self) -> str:
@@ -81,6 +88,7 @@ class ConjunctiveSet:
 
 @dataclass
 class Evidence:
+    __slots__ = ("type", "has_supporting_reference", "with_support_from")
     type: Curie # Curie of the ECO class
     has_supporting_reference: List[Curie]
     with_support_from: List[ConjunctiveSet]
@@ -89,6 +97,7 @@ relation_tuple = re.compile(r'(.+)\((.+)\)')
 
 @dataclass(unsafe_hash=True)
 class ExtensionUnit:
+    __slots__ = ("relation", "term")
     relation: Curie
     term: Curie
 
@@ -109,6 +118,9 @@ class ExtensionUnit:
 
 @dataclass(repr=True, unsafe_hash=True)
 class GoAssociation:
+    __slots__ = ("source_line", "subject", "relation", "object", "negated", "qualifiers", "aspect",
+                 "interacting_taxon", "evidence", "subject_extensions", "object_extensions",
+                 "provided_by", "date", "properties")
     source_line: Optional[str]
     subject: Subject
     relation: Curie # This is the relation Curie
@@ -124,6 +136,16 @@ class GoAssociation:
     date: Date
     properties: Dict[Curie, List[str]]
 
+    def replace(self, **changes) -> "GoAssociation":
+        """
+        Returns a copy of this association with the given fields replaced, e.g.
+        `assoc.replace(object=Term(goid, assoc.object.taxon), aspect="P")`.
+
+        Unchanged fields are shared with this association, not copied, so treat
+        their values as read-only in both: replace a part rather than mutating it.
+        """
+        return dataclasses.replace(self, **changes)
+
     def to_gaf_tsv(self) -> List:
         gp_isoforms = "" if not self.subject_extensions else self.subject_extensions[0].term
         db, subid = self.subject.id.split(":", maxsplit=1)
@@ -181,3 +203,76 @@ class GoAssociation:
             ConjunctiveSet.list_to_str(self.object_extensions),
             "|".join(props_list)
         ]
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+class AssociationInterner(object):
+    """
+    Shares equal parts between GoAssociations that are held in memory together.
+
+    Low cardinality strings (taxa, relations, qualifiers, aspect, evidence types,
+    references, provided_by, dates) are interned, all associations of a gene product
+    share one `Subject`, and all associations to a term in a taxon share one `Term`.
+
+    Shared parts must not be mutated in place, as the change would show up in
+    every association sharing them: use `GoAssociation.replace` instead.
+
+    Example:
+        interner = AssociationInterner()
+        assocs = [interner.intern(a) for a in associations]
+    """
+
+    def __init__(self, source_lines=True):
+        """
+        Arguments
+        ---------
+        source_lines : bool
+            If False, the `source_line` of interned associations is dropped (set to None)
+        """
+        self.source_lines = source_lines
+        self.subjects = {}  # type: Dict[tuple, Subject]
+        self.terms = {}  # type: Dict[tuple, Term]
+
+    def subject(self, subject: Subject) -> Subject:
+        key = (subject.id, subject.label, subject.fullname, tuple(subject.synonyms), subject.type, subject.taxon)
+        shared = self.subjects.get(key)
+        if shared is None:
+            subject.type = _intern(subject.type)
+            subject.taxon = _intern(subject.taxon)
+            self.subjects[key] = shared = subject
+        return shared
+
+    def term(self, term: Term) -> Term:
+        key = (term.id, term.taxon)
+        shared = self.terms.get(key)
+        if shared is None:
+            shared = Term(_intern(term.id), _intern(term.taxon))
+            self.terms[key] = shared
+        return shared
+
+    def intern(self, association: GoAssociation) -> GoAssociation:
+        """
+        Replaces the parts of `association` with shared ones, in place, and returns it
+        """
+        if not self.source_lines:
+            association.source_line = None
+        association.subject = self.subject(association.subject)
+        association.object = self.term(association.object)
+        association.relation = _intern(association.relation)
+        association.qualifiers = [_intern(q) for q in association.qualifiers]
+        association.aspect = _intern(association.aspect)
+        association.interacting_taxon = _intern(association.interacting_taxon)
+        association.provided_by = _intern(association.provided_by)
+        association.date = _intern(association.date)
+
+        evidence = association.evidence
+        evidence.type = _intern(evidence.type)
+        evidence.has_supporting_reference = [_intern(ref) for ref in evidence.has_supporting_reference]
+        for conjunction in association.object_extensions:
+            for unit in conjunction.elements:
+                # Interning keeps strings equal, so hashes are unchanged
+                unit.relation = _intern(unit.relation)
+
+        return association
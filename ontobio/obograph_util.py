@@ -10,8 +10,10 @@ from ontobio.golr.golr_associations import search_associations
 import json
 import networkx
 import logging
-from prefixcommons.curie_util import expand_uri, contract_uri
+import re
+from prefixcommons.curie_util import expand_uri, contract_uri, default_curie_maps
 from diskcache import Cache
+from functools import lru_cache
 import tempfile
 
 
@@ -21,12 +23,70 @@ cache = Cache(tempfile.gettempdir())
 logger = logging.getLogger(__name__)
 
 
+class CurieContractor(object):
+    """
+    Contracts URIs to CURIEs using a character trie of URI prefixes
+
+    Equivalent to taking the shortest result of `prefixcommons.curie_util.contract_uri`,
+    but the prefix maps are compiled once, rather than scanned and
+    sorted for every URI. Ties between equally short CURIEs are broken
+    alphabetically.
+    """
+
+    def __init__(self, cmaps):
+        self.trie = {}
+        for cmap in cmaps:
+            for (k, v) in cmap.items():
+                if not isinstance(v, str):
+                    continue
+                t = self.trie
+                for c in v:
+                    t = t.setdefault(c, {})
+                t.setdefault(None, set()).add((k, v))
+
+    def contract(self, uri):
+        """
+        Returns shortest CURIE for a URI, or None if no prefix matches
+        """
+        best = None
+        t = self.trie
+        for c in uri:
+            t = t.get(c)
+            if t is None:
+                break
+            if None in t:
+                for (k, v) in t[None]:
+                    curie = uri.replace(v, k + ":")
+                    if best is None or (len(curie), curie) < (len(best), best):
+                        best = curie
+        return best
+
+
+_default_contractor = None
+
+
+def get_default_contractor():
+    """
+    Returns a shared CurieContractor for the prefixcommons default curie maps
+    """
+    global _default_contractor
+    if _default_contractor is None:
+        _default_contractor = CurieContractor(default_curie_maps)
+    return _default_contractor
+
+
 class OboJsonMapper(object):
+
+    # maximum number of distinct URIs memoized by contract_uri
+    contract_uri_cache_size = 1 << 18
+
     def __init__(self,
                  digraph=None,
                  context=None):
         self.digraph = digraph
         self.context = context if context is not None else {}
+        self.context_contractor = CurieContractor([self.context]) if len(self.context) > 0 else None
+        self.contract_uri = lru_cache(maxsize=self.contract_uri_cache_size)(self._contract_uri)
 
     def add_obograph_digraph(
             self,
@@ -42,68 +102,104 @@ class OboJsonMapper(object):
         """
         Converts a single obograph to Digraph edges and adds to an existing networkx DiGraph
         """
-        digraph = self.digraph
         logger.info("NODES: {}".format(len(og['nodes'])))
-
-        # if client passes an xref_graph we must parse metadata
-        if xref_graph is not None:
-            parse_meta = True
-
         for node in og['nodes']:
-            is_obsolete = 'is_obsolete' in node and node['is_obsolete'] == 'true'
-            if is_obsolete:
-                continue
-            if node_type is not None and ('type' not in node or node['type'] != node_type):
-                continue
-            id = self.contract_uri(node['id'])
-            digraph.add_node(id, **node)
-            if 'lbl' in node:
-                digraph.node[id]['label'] = node['lbl']
-            if parse_meta and 'meta' in node:
-                if node['meta'] is None:
-                    node['meta'] = {}
-                meta = self.transform_meta(node['meta'])
-                if xref_graph is not None and 'xrefs' in meta:
-                    for x in meta['xrefs']:
-                        xref_graph.add_edge(self.contract_uri(x['val']), id, source=id)
+            self.add_obograph_node(node, node_type=node_type, xref_graph=xref_graph, parse_meta=parse_meta)
         logger.info("EDGES: {}".format(len(og['edges'])))
         for edge in og['edges']:
-            sub = self.contract_uri(edge['sub'])
-            obj = self.contract_uri(edge['obj'])
-            pred = self.contract_uri(edge['pred'])
-            pred = map_legacy_pred(pred)
-            if pred == 'is_a':
-                pred = 'subClassOf'
-            if predicates is None or pred in predicates:
-                meta = edge['meta'] if 'meta' in edge else {}
-                if reverse_edges:
-                    digraph.add_edge(obj, sub, pred=pred, **meta)
-                else:
-                    digraph.add_edge(sub, obj, pred=pred, **meta)
-
+            self.add_obograph_edge(edge, predicates=predicates, reverse_edges=reverse_edges)
+        self.add_equivalent_nodes_sets(og)
+        if logical_definitions is not None:
+            logical_definitions += self.logical_definitions(og)
+        if property_chain_axioms is not None:
+            property_chain_axioms += self.property_chain_axioms(og)
+
+    def add_obograph_node(self, node, node_type=None, xref_graph=None, parse_meta=True):
+        """
+        Adds a single obograph node to the digraph
+        """
+        # if client passes an xref_graph we must parse metadata
+        if xref_graph is not None:
+            parse_meta = True
+        is_obsolete = 'is_obsolete' in node and node['is_obsolete'] == 'true'
+        if is_obsolete:
+            return
+        if node_type is not None and ('type' not in node or node['type'] != node_type):
+            return
+        digraph = self.digraph
+        id = self.contract_uri(node['id'])
+        digraph.add_node(id, **node)
+        if 'lbl' in node:
+            digraph.node[id]['label'] = node['lbl']
+        if parse_meta and 'meta' in node:
+            meta = self.transform_node_meta(node)
+            if xref_graph is not None and 'xrefs' in meta:
+                for x in meta['xrefs']:
+                    xref_graph.add_edge(self.contract_uri(x['val']), id, source=id)
+
+    def add_obograph_edge(self, edge, predicates=None, reverse_edges=True):
+        """
+        Adds a single obograph edge to the digraph
+        """
+        sub = self.contract_uri(edge['sub'])
+        obj = self.contract_uri(edge['obj'])
+        pred = self.contract_uri(edge['pred'])
+        pred = map_legacy_pred(pred)
+        if pred == 'is_a':
+            pred = 'subClassOf'
+        if predicates is None or pred in predicates:
+            meta = edge['meta'] if 'meta' in edge else {}
+            if reverse_edges:
+                self.digraph.add_edge(obj, sub, pred=pred, **meta)
+            else:
+                self.digraph.add_edge(sub, obj, pred=pred, **meta)
+
+    def add_equivalent_nodes_sets(self, og):
+        """
+        Adds equivalentTo edges between all members of each of the equivalentNodesSets of an obograph
+        """
         if 'equivalentNodesSets' in og:
             nslist = og['equivalentNodesSets']
             logger.info("CLIQUES: {}".format(len(nslist)))
             for ns in nslist:
-                equivNodeIds = ns['nodeIds']
                 for i in ns['nodeIds']:
                     ix = self.contract_uri(i)
                     for j in ns['nodeIds']:
                         if i != j:
                             jx = self.contract_uri(j)
-                            digraph.add_edge(ix, jx, pred='equivalentTo')
-        if logical_definitions is not None and 'logicalDefinitionAxioms' in og:
-            for a in og['logicalDefinitionAxioms']:
-                ld = LogicalDefinition(self.contract_uri(a['definedClassId']),
-                                       [self.contract_uri(x) for x in a['genusIds']],
-                                       [(self.contract_uri(x['propertyId']),
-                                         self.contract_uri(x['fillerId'])) for x in a['restrictions'] if x is not None])
-                logical_definitions.append(ld)
-        if property_chain_axioms is not None and 'propertyChainAxioms' in og:
-            for a in og['propertyChainAxioms']:
-                pca = PropertyChainAxiom(predicate_id=self.contract_uri(a['predicateId']),
-                                         chain_predicate_ids=[self.contract_uri(x) for x in a['chainPredicateIds']])
-                property_chain_axioms.append(pca)
+                            self.digraph.add_edge(ix, jx, pred='equivalentTo')
+
+    def logical_definitions(self, og):
+        """
+        Returns list of LogicalDefinition objects for a single obograph
+        """
+        ldefs = []
+        for a in og.get('logicalDefinitionAxioms', []):
+            ld = LogicalDefinition(self.contract_uri(a['definedClassId']),
+                                   [self.contract_uri(x) for x in a['genusIds']],
+                                   [(self.contract_uri(x['propertyId']),
+                                     self.contract_uri(x['fillerId'])) for x in a['restrictions'] if x is not None])
+            ldefs.append(ld)
+        return ldefs
+
+    def property_chain_axioms(self, og):
+        """
+        Returns list of PropertyChainAxiom objects for a single obograph
+        """
+        pcas = []
+        for a in og.get('propertyChainAxioms', []):
+            pca = PropertyChainAxiom(predicate_id=self.contract_uri(a['predicateId']),
+                                     chain_predicate_ids=[self.contract_uri(x) for x in a['chainPredicateIds']])
+            pcas.append(pca)
+        return pcas
+
+    def transform_node_meta(self, node):
+        """
+        Contracts the URIs in the meta object of an obograph node, in place
+        """
+        if node['meta'] is None:
+            node['meta'] = {}
+        return self.transform_meta(node['meta'])
 
     def transform_meta(self, meta):
         if 'basicPropertyValues' in meta:
@@ -112,32 +208,43 @@ class OboJsonMapper(object):
                 x['val'] = self.contract_uri(x['val'])
         return meta
 
-    def contract_uri(self, uri):
-        if len(self.context.keys()) > 0:
-            curies = contract_uri(uri, cmaps=[self.context])
-            if len(curies) > 0:
-                return sorted(curies, key=len)[0] # sort by length
+    def _contract_uri(self, uri):
+        # uncached; use self.contract_uri
+        if self.context_contractor is not None:
+            curie = self.context_contractor.contract(uri)
+            if curie is not None:
+                return curie
 
-        curies = sorted(contract_uri(uri), key=len) # Sort by length
-        if len(curies) > 0:
-            return curies[0]
+        curie = get_default_contractor().contract(uri)
+        if curie is not None:
+            return curie
         else:
             return uri
 
 
-def convert_json_file(obographfile, **args):
+def convert_json_file(obographfile, stream=False, retain_graphdoc=True, **args):
     """
     Return a networkx MultiDiGraph of the ontologies
     serialized as a json string
 
+    Arguments
+    ---------
+    obographfile : str
+        path to obographs json file
+    stream : bool
+        if True, nodes and edges are added to the graph as they are parsed,
+        so the whole json document is never held in memory. Implies retain_graphdoc=False
+    retain_graphdoc : bool
+        if False, the parsed json document is not included in the result
     """
-    file = open(obographfile, 'r')
-    jsonstr = file.read()
-    file.close()
-    return convert_json_object(json.loads(jsonstr), **args)
+    with open(obographfile, 'r') as file:
+        if stream:
+            return convert_json_stream(file, **args)
+        jsonstr = file.read()
+    return convert_json_object(json.loads(jsonstr), retain_graphdoc=retain_graphdoc, **args)
 
 
-def convert_json_object(obographdoc, reverse_edges=True, **args):
+def convert_json_object(obographdoc, reverse_edges=True, retain_graphdoc=True, **args):
     """
     Return a networkx MultiDiGraph of the ontologies
     serialized as a json object
@@ -165,12 +272,225 @@ def convert_json_object(obographdoc, reverse_edges=True, **args):
         'meta': base_og.get('meta'),
         'graph': mapper.digraph,
         'xref_graph': xref_graph,
-        'graphdoc': obographdoc,
+        'graphdoc': obographdoc if retain_graphdoc else None,
         'logical_definitions': logical_definitions,
         'property_chain_axioms': property_chain_axioms
         }
 
 
+def transform_graphdoc(obographdoc, node_type=None):
+    """
+    Applies to an obographs json object the changes made to it in place by
+    `convert_json_object`, i.e. contracts the URIs in the meta objects of nodes
+
+    Used to give the same graphdoc for an ontology loaded from a snapshot
+    as when parsing the json document. Returns the object
+    """
+    mapper = OboJsonMapper(context=obographdoc.get('@context', {}))
+    for og in obographdoc['graphs']:
+        for node in og.get('nodes', []):
+            if node.get('is_obsolete') == 'true':
+                continue
+            if node_type is not None and node.get('type') != node_type:
+                continue
+            if 'meta' in node:
+                mapper.transform_node_meta(node)
+    return obographdoc
+
+
+def convert_json_stream(file, node_type=None, predicates=None, parse_meta=True, reverse_edges=True, **args):
+    """
+    Return a networkx MultiDiGraph of the ontologies in an obographs json file object,
+    adding nodes and edges as they are parsed
+
+    Returns the same payload as `convert_json_object`, without the graphdoc.
+
+    The @context, if any, must precede the graphs in the file;
+    otherwise the file is re-read with `json.load`
+    """
+    digraph = networkx.MultiDiGraph()
+    xref_graph = networkx.MultiGraph()
+    logical_definitions = []
+    property_chain_axioms = []
+    mapper = OboJsonMapper(digraph=digraph)
+    base_og = None
+    og = None
+    num_nodes = 0
+    num_edges = 0
+    for (event, value) in iter_obograph_json(file):
+        if event == 'node':
+            num_nodes += 1
+            mapper.add_obograph_node(value, node_type=node_type, xref_graph=xref_graph, parse_meta=parse_meta)
+        elif event == 'edge':
+            num_edges += 1
+            mapper.add_obograph_edge(value, predicates=predicates, reverse_edges=reverse_edges)
+        elif event == 'graph_item':
+            (k, v) = value
+            og[k] = v
+        elif event == 'graph_start':
+            og = {}
+            num_nodes = 0
+            num_edges = 0
+        elif event == 'graph_end':
+            logger.info("NODES: {} EDGES: {}".format(num_nodes, num_edges))
+            mapper.add_equivalent_nodes_sets(og)
+            logical_definitions += mapper.logical_definitions(og)
+            property_chain_axioms += mapper.property_chain_axioms(og)
+            if base_og is None:
+                base_og = og
+        elif event == 'context':
+            if len(digraph) > 0:
+                logger.warning("@context follows graphs; cannot stream, reloading")
+                file.seek(0)
+                return convert_json_object(json.load(file), node_type=node_type, predicates=predicates,
+                                           parse_meta=parse_meta, reverse_edges=reverse_edges,
+                                           retain_graphdoc=False, **args)
+            logger.info("CONTEXT: {}".format(value))
+            mapper = OboJsonMapper(digraph=digraph, context=value)
+    if base_og is None:
+        raise ValueError("No graphs in obographs json")
+
+    return {
+        'id': base_og.get('id'),
+        'meta': base_og.get('meta'),
+        'graph': mapper.digraph,
+        'xref_graph': xref_graph,
+        'graphdoc': None,
+        'logical_definitions': logical_definitions,
+        'property_chain_axioms': property_chain_axioms
+        }
+
+
+def iter_obograph_json(file, chunk_size=1 << 16):
+    """
+    Incrementally parses an obographs json file object, yielding (event, value) pairs
+
+    Events:
+
+     - ('context', dict) : the @context of the document
+     - ('graph_start', None), ('graph_end', None) : delimit each graph
+     - ('node', dict), ('edge', dict) : each node and edge of the current graph
+     - ('graph_item', (key, value)) : any other member of the current graph, e.g. id, meta, logicalDefinitionAxioms
+     - ('item', (key, value)) : any other top-level member of the document
+
+    Only a single node or edge is held in memory at a time.
+    """
+    reader = _JsonStreamReader(file, chunk_size=chunk_size)
+    for key in reader.keys():
+        if key == '@context':
+            yield ('context', reader.value())
+        elif key == 'graphs':
+            for _ in reader.elements():
+                yield ('graph_start', None)
+                for gkey in reader.keys():
+                    if gkey in ('nodes', 'edges') and reader.peek() == '[':
+                        event = gkey[:-1]
+                        for _ in reader.elements():
+                            yield (event, reader.value())
+                    elif reader.peek() == '[':
+                        # axiom lists are parsed element by element to avoid re-decoding large arrays
+                        yield ('graph_item', (gkey, [reader.value() for _ in reader.elements()]))
+                    else:
+                        yield ('graph_item', (gkey, reader.value()))
+                yield ('graph_end', None)
+        else:
+            yield ('item', (key, reader.value()))
+
+
+class _JsonStreamReader():
+    """
+    Minimal pull parser over a text file object
+
+    Structural tokens of objects and arrays are scanned here; each
+    leaf value is decoded with `json.JSONDecoder.raw_decode` from a
+    buffer that is refilled as needed.
+    """
+
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, file, chunk_size=1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        # reads at least as much again as is buffered, so re-decoding a large value is amortized
+        chunk = self.file.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if chunk == '':
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Returns the next non-whitespace character, without consuming it
+        """
+        while True:
+            self.pos = self.WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of json")
+
+    def _expect(self, chars):
+        c = self.peek()
+        if c not in chars:
+            raise ValueError("Expected one of '{}' but found '{}' at offset {}".format(chars, c, self.pos))
+        self.pos += 1
+        return c
+
+    def value(self):
+        """
+        Decodes and returns the next complete json value
+        """
+        self.peek()
+        while True:
+            try:
+                (v, end) = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # a number may continue into the next chunk
+            if end == len(self.buf) and not self.eof and isinstance(v, (int, float)) and self._fill():
+                continue
+            self.pos = end
+            return v
+
+    def keys(self):
+        """
+        Iterates over the keys of the next json object; the caller must consume each value
+        """
+        self._expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(':')
+            yield key
+            if self._expect(',}') == '}':
+                return
+
+    def elements(self):
+        """
+        Iterates over the next json array; the caller must consume each element
+        """
+        self._expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield None
+            if self._expect(',]') == ']':
+                return
+
+
 def _get_association_nodes(digraph, sub, predicate, obj):
     """
     Given a subject, predicate, object, retrieve the OBAN association
@@ -8,8 +8,12 @@ See also:
 """
 
 import networkx as nx
+from networkx.classes.graphviews import subgraph_view
+from networkx.classes.filters import no_filter
+import numpy as np
 import logging
 import re
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +27,24 @@ class Ontology():
 
     """
 
+    # maps a relation set key to a ClosureIndex; see build_closure_index
+    _closure_indexes = None
+
+    # if True, relation-filtered parents/children lookups use a per-predicate
+    # adjacency index, built lazily on first use. Opt-in: the index is only
+    # discarded by add_parent/merge, not by direct edits to the networkx graph
+    use_adjacency_index = False
+    _adjacency_index = None
+
+    # if set, a callable returning the obograph json document; called on first
+    # access of graphdoc, e.g. for an ontology loaded from a snapshot
+    graphdoc_loader = None
+    _graphdoc = None
+
+    # maximum number of (relations, prefix) views retained by get_filtered_graph
+    filtered_graph_cache_size = 16
+    _filtered_graph_cache = None
+
     def __init__(self,
                  handle=None,
                  id=None,
@@ -66,6 +88,20 @@ class Ontology():
             self.all_logical_definitions = payload.get('logical_definitions')
             self.all_property_chain_axioms = payload.get('property_chain_axioms')
 
+    @property
+    def graphdoc(self):
+        """
+        The obograph json document the ontology was parsed from, if retained
+        """
+        if self._graphdoc is None and self.graphdoc_loader is not None:
+            self._graphdoc = self.graphdoc_loader()
+            self.graphdoc_loader = None
+        return self._graphdoc
+
+    @graphdoc.setter
+    def graphdoc(self, graphdoc):
+        self._graphdoc = graphdoc
+
     def __str__(self):
         return '{} handle: {} meta: {}'.format(self.id, self.handle, self.meta)
     def __repr__(self):
@@ -84,14 +120,17 @@ class Ontology():
         """
         return self.graph
 
-    # consider caching
     def get_filtered_graph(self, relations=None, prefix=None):
         """
         Returns a networkx graph for the whole ontology, for a subset of relations
 
         Only implemented for eager methods.
 
-        Implementation notes: currently this is not cached
+        Implementation notes: the returned graph is a read-only view onto the
+        graph returned by `get_graph`; no nodes or edges are copied. Views are
+        cached by (relations, prefix), and the cache is cleared when the
+        ontology is modified via `add_parent` or `merge`. Use `.copy()` on the
+        result if a mutable graph is required.
 
         Arguments
         ---------
@@ -105,32 +144,41 @@ class Ontology():
             A networkx MultiDiGraph object representing the filtered ontology
         """
 
+        # default method - wrap get_graph
+        srcg = self.get_graph()
+        if prefix is None and relations is None:
+            logger.info("No filtering on "+str(self))
+            return srcg
+
+        cache = self._filtered_graph_cache
+        if cache is None or cache[0] is not srcg:
+            cache = (srcg, OrderedDict())
+            self._filtered_graph_cache = cache
+        views = cache[1]
+        key = (self._relations_key(relations), prefix)
+        if key in views:
+            views.move_to_end(key)
+            return views[key]
+
         # trigger synonym cache
         self.all_synonyms()
         self.all_obsoletes()
 
-        # default method - wrap get_graph
-        srcg = self.get_graph()
+        logger.info("Filtering {} for {} prefix: {}".format(self, relations, prefix))
+        filter_node = no_filter
         if prefix is not None:
-            srcg = srcg.subgraph([n for n in srcg.nodes() if n.startswith(prefix+":")])
-        if relations is None:
-            logger.info("No filtering on "+str(self))
-            return srcg
-        logger.info("Filtering {} for {}".format(self, relations))
-        g = nx.MultiDiGraph()
-
-        # TODO: copy full metadata
-        logger.info("copying nodes")
-        for (n,d) in srcg.nodes(data=True):
-            g.add_node(n, **d)
-
-        logger.info("copying edges")
-        num_edges = 0
-        for (x,y,d) in srcg.edges(data=True):
-            if d['pred'] in relations:
-                num_edges += 1
-                g.add_edge(x,y,**d)
-        logger.info("Filtered edges: {}".format(num_edges))
+            pfx = prefix + ":"
+            filter_node = lambda n: n.startswith(pfx)
+        filter_edge = no_filter
+        if relations is not None:
+            rset = set(relations)
+            adj = srcg.adj
+            filter_edge = lambda x, y, k: adj[x][y][k].get('pred') in rset
+        g = subgraph_view(srcg, filter_node=filter_node, filter_edge=filter_edge)
+
+        views[key] = g
+        while len(views) > self.filtered_graph_cache_size:
+            views.popitem(last=False)
         return g
 
     def merge(self, ontologies):
@@ -151,6 +199,7 @@ class Ontology():
             if ont.xref_graph is not None:
                 for (o,s,m) in ont.xref_graph.edges(data=True):
                     self.xref_graph.add_edge(o,s,**m)
+        self._invalidate_indexes()
 
     def subgraph(self, nodes=None):
         """
@@ -186,7 +235,7 @@ class Ontology():
 
         ont = Ontology(graph=g, xref_graph=self.xref_graph) # TODO - add metadata
         if relations is not None:
-            g = ont.get_filtered_graph(relations)
+            g = ont.get_filtered_graph(relations).copy()
             ont = Ontology(graph=g, xref_graph=self.xref_graph)
         return ont
 
@@ -419,12 +468,14 @@ class Ontology():
         """
         g = self.get_graph()
         if node in g:
-            parents = list(g.predecessors(node))
             if relations is None:
-                return parents
+                return list(g.predecessors(node))
+            elif self.use_adjacency_index:
+                parents_by_pred, _ = self._get_adjacency_index()
+                return self._adjacent_by_relations(parents_by_pred, node, relations)
             else:
                 rset = set(relations)
-                return [p for p in parents if len(self.child_parent_relations(node, p, graph=g).intersection(rset)) > 0 ]
+                return [p for p in g.predecessors(node) if len(self.child_parent_relations(node, p, graph=g).intersection(rset)) > 0 ]
         else:
             return []
 
@@ -448,15 +499,50 @@ class Ontology():
         """
         g = self.get_graph()
         if node in g:
-            children = list(g.successors(node))
             if relations is None:
-                return children
+                return list(g.successors(node))
+            elif self.use_adjacency_index:
+                _, children_by_pred = self._get_adjacency_index()
+                return self._adjacent_by_relations(children_by_pred, node, relations)
             else:
                 rset = set(relations)
-                return [c for c in children if len(self.child_parent_relations(c, node, graph=g).intersection(rset)) > 0 ]
+                return [c for c in g.successors(node) if len(self.child_parent_relations(c, node, graph=g).intersection(rset)) > 0 ]
         else:
             return []
 
+    def _get_adjacency_index(self):
+        """
+        Returns a pair of dicts (parents_by_pred, children_by_pred)
+
+        Each maps a predicate to a dict of node to list of adjacent nodes.
+        Built lazily, and rebuilt if the underlying graph object is replaced
+        """
+        g = self.get_graph()
+        if self._adjacency_index is None or self._adjacency_index[0] is not g:
+            logger.info("Building adjacency index for {}".format(self))
+            parents_by_pred = {}
+            children_by_pred = {}
+            for (p, c, d) in g.edges(data=True):
+                pred = d.get('pred')
+                parents = parents_by_pred.setdefault(pred, {}).setdefault(c, [])
+                if p not in parents:
+                    parents.append(p)
+                    children_by_pred.setdefault(pred, {}).setdefault(p, []).append(c)
+            self._adjacency_index = (g, parents_by_pred, children_by_pred)
+        return self._adjacency_index[1:]
+
+    def _adjacent_by_relations(self, nodes_by_pred, node, relations):
+        results = []
+        for r in relations:
+            m = nodes_by_pred.get(r)
+            if m is not None and node in m:
+                results.extend(m[node])
+        if len(relations) > 1:
+            # a node may be connected by more than one of the relations
+            seen = set()
+            results = [x for x in results if not (x in seen or seen.add(x))]
+        return results
+
     def ancestors(self, node, relations=None, reflexive=False):
         """Return all ancestors of specified node.
 
@@ -479,6 +565,9 @@ class Ontology():
             ancestor node IDs
 
         """
+        ix = self.closure_index(relations)
+        if ix is not None:
+            return ix.ancestors(node, reflexive=reflexive)
         seen = set()
         nextnodes = [node]
         while len(nextnodes) > 0:
@@ -513,6 +602,9 @@ class Ontology():
         list[str]
             descendant node IDs
         """
+        ix = self.closure_index(relations)
+        if ix is not None:
+            return ix.descendants(node, reflexive=reflexive)
         seen = set()
         nextnodes = [node]
         while len(nextnodes) > 0:
@@ -524,6 +616,67 @@ class Ontology():
             seen -= {node}
         return list(seen)
 
+    def build_closure_index(self, relations=None):
+        """
+        Precomputes the transitive closure of the ontology graph for a set of relations
+
+        Once built, calls to `ancestors` and `descendants` using the same
+        set of relations are answered from the index, rather than by
+        traversing the graph. This is opt-in; it is worthwhile when the
+        same ontology is queried many times, e.g. when indexing associations.
+
+        The index is discarded if the ontology is subsequently modified
+        using `add_parent` or `merge`. Modifications made directly on the
+        networkx graph are not detected.
+
+        Arguments
+        ---------
+        relations : list
+             relation (object property) IDs used to filter. If None, all are used
+
+        Returns
+        -------
+        ClosureIndex
+        """
+        if self._closure_indexes is None:
+            self._closure_indexes = {}
+        logger.info("Building closure index for {} relations: {}".format(self, relations))
+        ix = ClosureIndex(self.get_graph(), relations=relations)
+        self._closure_indexes[self._relations_key(relations)] = ix
+        return ix
+
+    def closure_index(self, relations=None):
+        """
+        Returns the precomputed closure index for a set of relations, or None if not built
+
+        See `build_closure_index`
+
+        Arguments
+        ---------
+        relations : list
+             relation (object property) IDs used to filter
+
+        Returns
+        -------
+        ClosureIndex
+        """
+        if not self._closure_indexes:
+            return None
+        return self._closure_indexes.get(self._relations_key(relations))
+
+    def _relations_key(self, relations):
+        if relations is None:
+            return None
+        return frozenset(relations)
+
+    def _invalidate_indexes(self):
+        """
+        Discards any cached indexes; called whenever the graph is modified
+        """
+        self._closure_indexes = None
+        self._adjacency_index = None
+        self._filtered_graph_cache = None
+
 
     def equiv_graph(self):
         """
@@ -827,6 +980,7 @@ class Ontology():
         """
         g = self.get_graph()
         g.add_edge(pid, id, pred=relation)
+        self._invalidate_indexes()
 
     def add_xref(self, id, xref):
         """
@@ -877,7 +1031,7 @@ class Ontology():
         """
         syns = []
         for n in self.nodes():
-            syns = syns + self.synonyms(n, include_label=include_label)
+            syns.extend(self.synonyms(n, include_label=include_label))
         return syns
 
     def all_obsoletes(self):
@@ -1017,6 +1171,124 @@ class Ontology():
         """
         return self.resolve_names([searchterm], **args)
 
+class ClosureIndex():
+    """
+    A precomputed reflexive transitive closure over an ontology graph.
+
+    Each node is assigned an integer index; the ancestors and descendants
+    of every node are stored as sorted integer arrays in compressed sparse
+    row (CSR) form. Lookups are O(size of result).
+
+    Cycles (e.g. between equivalentTo edges) are handled by collapsing
+    strongly connected components before propagating.
+
+    Typically you do not need to create this yourself; see
+    :meth:`Ontology.build_closure_index`
+    """
+
+    def __init__(self, graph, relations=None):
+        """
+        Arguments
+        ---------
+        graph : nx.MultiDiGraph
+            ontology graph, with edges directed from parent to child
+        relations : list
+            relation (object property) IDs used to filter. If None, all are used
+        """
+        self.relations = relations
+        self.ids = list(graph.nodes())
+        self.id2index = {n: i for i, n in enumerate(self.ids)}
+        num_nodes = len(self.ids)
+
+        rset = set(relations) if relations is not None else None
+        dg = nx.DiGraph()
+        dg.add_nodes_from(range(num_nodes))
+        for (p, c, d) in graph.edges(data=True):
+            if rset is None or d.get('pred') in rset:
+                dg.add_edge(self.id2index[p], self.id2index[c])
+
+        # propagate in topological order over the condensation; the closure of
+        # a component is no longer needed once all its children are processed
+        cg = nx.condensation(dg)
+        remaining = {n: cg.out_degree(n) for n in cg}
+        closures = {}
+        anc_arrs = [None] * num_nodes
+        for n in nx.topological_sort(cg):
+            ancs = set(cg.nodes[n]['members'])
+            for pn in cg.predecessors(n):
+                ancs.update(closures[pn])
+                remaining[pn] -= 1
+                if remaining[pn] == 0:
+                    del closures[pn]
+            if remaining[n] > 0:
+                closures[n] = ancs
+            arr = np.array(sorted(ancs), dtype=np.int32)
+            for m in cg.nodes[n]['members']:
+                anc_arrs[m] = arr
+
+        counts = np.array([len(a) for a in anc_arrs], dtype=np.int64)
+        self._anc_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._anc_indptr[1:])
+        if num_nodes > 0:
+            self._anc_indices = np.concatenate(anc_arrs)
+        else:
+            self._anc_indices = np.zeros(0, dtype=np.int32)
+
+        # descendants are the transpose of the ancestor matrix
+        rows = np.repeat(np.arange(num_nodes, dtype=np.int32), counts)
+        order = np.lexsort((rows, self._anc_indices))
+        self._desc_indices = rows[order]
+        self._desc_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self._anc_indices, minlength=num_nodes), out=self._desc_indptr[1:])
+        logger.info("Closure index: {} nodes, {} entailed edges".format(num_nodes, len(self._anc_indices)))
+
+    def __contains__(self, node):
+        return node in self.id2index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def ancestors(self, node, reflexive=False):
+        """
+        Returns all ancestors of a node, as a list of IDs
+        """
+        return self._lookup(node, self._anc_indptr, self._anc_indices, reflexive)
+
+    def descendants(self, node, reflexive=False):
+        """
+        Returns all descendants of a node, as a list of IDs
+        """
+        return self._lookup(node, self._desc_indptr, self._desc_indices, reflexive)
+
+    def ancestor_indexes(self, node, reflexive=False):
+        """
+        Returns ancestors of a node as a sorted array of integer indexes
+        """
+        return self._lookup_indexes(node, self._anc_indptr, self._anc_indices, reflexive)
+
+    def descendant_indexes(self, node, reflexive=False):
+        """
+        Returns descendants of a node as a sorted array of integer indexes
+        """
+        return self._lookup_indexes(node, self._desc_indptr, self._desc_indices, reflexive)
+
+    def _lookup_indexes(self, node, indptr, indices, reflexive):
+        i = self.id2index.get(node)
+        if i is None:
+            return np.zeros(0, dtype=np.int32)
+        arr = indices[indptr[i]:indptr[i+1]]
+        if not reflexive:
+            arr = arr[arr != i]
+        return arr
+
+    def _lookup(self, node, indptr, indices, reflexive):
+        i = self.id2index.get(node)
+        if i is None:
+            return [node] if reflexive else []
+        ids = self.ids
+        return [ids[j] for j in indices[indptr[i]:indptr[i+1]].tolist() if reflexive or j != i]
+
+
 class LogicalDefinition():
     """
     A simple OWL logical definition conforming to the pattern:
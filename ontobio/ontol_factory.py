@@ -8,6 +8,8 @@ import ontobio.obograph_util as obograph_util
 from ontobio.ontol import Ontology
 from ontobio.sparql.sparql_ontology import EagerRemoteSparqlOntology
 import os
+import json
+import functools
 import subprocess
 import hashlib
 import logging
@@ -58,6 +60,24 @@ class OntologyFactory():
         ---------
         handle : str
             specifies how to retrieve the ontology info
+        compact : bool
+            if True, obographs json files are loaded into a read-only
+            :class:`ontobio.cgraph.CompactOntology`, which uses a fraction of
+            the memory of the default networkx-backed implementation
+        stream : bool
+            if True, obographs json files are parsed incrementally, without
+            holding the whole json document in memory; the ontology will
+            have no graphdoc
+        retain_graphdoc : bool
+            if False, the parsed obographs json document is not kept as
+            the graphdoc of the ontology
+        snapshot : bool
+            if True, a binary snapshot of a parsed obographs json file is
+            written on first load, and used on subsequent loads of the same
+            file. If a graphdoc is retained, it is loaded on first access.
+            Defaults to True if compact is set, as a snapshot only loads
+            much faster than parsing as a CompactOntology.
+            See :mod:`ontobio.ontol_snapshot`
 
         """
         if handle is None:
@@ -102,8 +122,7 @@ def create_ontology(handle=None, **args):
             logger.info(cp)
         else:
             logger.info("using cached file: "+fn)
-        g = obograph_util.convert_json_file(fn)
-        ont = Ontology(handle=handle, payload=g)
+        ont = load_obograph_file(fn, handle=handle)
     elif handle.startswith("wdq:"):
         from ontobio.sparql.wikidata_ontology import EagerWikidataOntology
         logger.info("Fetching from Wikidata")
@@ -131,8 +150,7 @@ def create_ontology(handle=None, **args):
             logger.info(cp)
         else:
             logger.info("using cached file: "+fn)
-        g = obograph_util.convert_json_file(fn)
-        ont = Ontology(handle=handle, payload=g)
+        ont = load_obograph_file(fn, handle=handle)
     else:
         logger.info("Fetching from SPARQL")
         ont = EagerRemoteSparqlOntology(handle=handle)
@@ -145,10 +163,9 @@ def create_ontology_from_obograph(og):
     ont = Ontology(handle=None, payload=g)
     return ont
 
-def translate_file_to_ontology(handle, **args):
+def translate_file_to_ontology(handle, compact=False, snapshot=None, **args):
     if handle.endswith(".json"):
-        g = obograph_util.convert_json_file(handle, **args)
-        return Ontology(handle=handle, payload=g)
+        return load_obograph_file(handle, handle=handle, compact=compact, snapshot=snapshot, **args)
     elif handle.endswith(".ttl"):
         from ontobio.sparql.rdf2nx import RdfMapper
         logger.info("RdfMapper: {}".format(args))
@@ -166,8 +183,64 @@ def translate_file_to_ontology(handle, **args):
             logger.info(cp)
         else:
             logger.info("using cached file: "+fn)
+        return load_obograph_file(fn, handle=handle, compact=compact, snapshot=snapshot, **args)
+
+def load_obograph_file(fn, handle=None, compact=False, snapshot=None, **args):
+    """
+    Creates an ontology from an obographs json file, using a snapshot if available
+
+    Arguments
+    ---------
+    fn : str
+        path to obographs json file
+    handle : str
+        handle to assign to the ontology
+    compact : bool
+        if True, return a :class:`ontobio.cgraph.CompactOntology`
+    snapshot : bool
+        if True, load from a snapshot of this file if one exists, otherwise
+        write one after parsing. Defaults to the value of compact
+    """
+    from ontobio import ontol_snapshot
+    if snapshot is None:
+        snapshot = compact
+    path = None
+    if snapshot:
+        # options that only affect how the file is read do not change the snapshot
+        key_args = {k: v for (k, v) in args.items() if k not in ('stream', 'retain_graphdoc')}
+        path = ontol_snapshot.snapshot_path(fn, **key_args)
+        if os.path.isdir(path):
+            try:
+                ont = ontol_snapshot.load_snapshot(path, handle=handle, compact=compact)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Could not load snapshot {}, reparsing {}: {}".format(path, fn, e))
+            else:
+                # the graphdoc is read from the copy of the source in the snapshot, when first used
+                if not compact and not args.get('stream', False) and args.get('retain_graphdoc', True):
+                    source = os.path.join(path, ontol_snapshot.SOURCE)
+                    if not os.path.isfile(source):
+                        source = fn
+                    ont.graphdoc_loader = functools.partial(_load_graphdoc, source, node_type=args.get('node_type'))
+                return ont
+    if compact:
+        from ontobio.cgraph import CompactOntology
+        ont = CompactOntology.from_json_file(fn, handle=handle, **args)
+    else:
         g = obograph_util.convert_json_file(fn, **args)
-        return Ontology(handle=handle, payload=g)
+        ont = Ontology(handle=handle, payload=g)
+    if path is not None and not os.path.isdir(path):
+        try:
+            ontol_snapshot.write_snapshot(ont, path, source=fn)
+        except OSError as e:
+            logger.warning("Could not write snapshot {}: {}".format(path, e))
+    return ont
+
+def _load_graphdoc(fn, node_type=None):
+    """
+    Reads an obographs json file, as the graphdoc of an ontology parsed from it
+    """
+    with open(fn, 'r') as file:
+        return obograph_util.transform_graphdoc(json.load(file), node_type=node_type)
 
 def get_checksum(file):
     """
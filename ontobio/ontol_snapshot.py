@@ -0,0 +1,464 @@
+"""
+Binary on-disk snapshots of parsed ontologies.
+
+Parsing a large obograph json file (contracting every URI, building
+the networkx graph) is slow. A snapshot stores the result of parsing as
+a directory of NumPy arrays plus a JSON manifest, which can be loaded
+(memory-mapped) much faster than re-parsing the source.
+
+A snapshot directory contains:
+
+ - `manifest.json` : format version, ontology id and metadata, predicates,
+   logical definitions, property chain axioms, xref edges
+ - `ids.npy` : newline-separated node ids, utf-8 encoded
+ - `labels`, `types`, `meta` : per-node tables; meta (synonyms,
+   definitions, xrefs, ...) is JSON encoded
+ - `edges_N_{o,s}_{indptr,indices}.npy` : CSR arrays per predicate, see :class:`CompactGraph`.
+   These back a :class:`CompactOntology`
+ - `node_attr_N` : one JSON table per node attribute of the networkx graph
+ - `graph_edges.npy`, `edge_attrs` : the edges of the networkx graph, in order,
+   as (parent, child, predicate, key) rows, and any attributes other than pred
+ - `source.json` : a copy of the source file, from which the graphdoc is
+   loaded on demand
+
+A snapshot is loaded much faster than parsing as a :class:`CompactOntology`.
+Loading as a networkx-backed :class:`Ontology` still has to decode the
+metadata of every node, and build the networkx graph; see
+`ontobio/bin/bench_snapshot.py`
+
+Snapshots are keyed by the checksum of the source file and the load
+arguments, so a modified source file is never served from a stale snapshot.
+When a snapshot is written for a source file, snapshots of earlier versions
+of the same file are removed.
+
+Typically you do not need to call this module directly; see
+:meth:`OntologyFactory.create`
+
+See also:
+
+ - ontol_factory.py
+ - cgraph.py
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import networkx as nx
+import numpy as np
+
+from ontobio.ontol import Ontology, LogicalDefinition, PropertyChainAxiom
+from ontobio.cgraph import CompactGraph, CompactOntology
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 2
+
+MANIFEST = 'manifest.json'
+
+SOURCE = 'source.json'
+
+
+def get_snapshot_dir():
+    """
+    Returns the directory used to store snapshots
+
+    Set the environment variable ONTOBIO_SNAPSHOT_DIR to override the default,
+    which is a subdirectory of the system temp directory
+    """
+    d = os.environ.get('ONTOBIO_SNAPSHOT_DIR')
+    if d is None:
+        d = os.path.join(tempfile.gettempdir(), 'ontobio-snapshots')
+    return d
+
+
+def file_checksum(fn, blocksize=1 << 20):
+    """
+    Get SHA256 hash from the contents of a given file, read in blocks
+    """
+    h = hashlib.sha256()
+    with open(fn, 'rb') as file:
+        for block in iter(lambda: file.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def snapshot_path(fn, snapshot_dir=None, **args):
+    """
+    Returns the path of the snapshot directory for a source file and load arguments
+    """
+    if snapshot_dir is None:
+        snapshot_dir = get_snapshot_dir()
+    argstr = json.dumps(args, sort_keys=True, default=str)
+    argsum = hashlib.sha256(argstr.encode('utf-8')).hexdigest()[0:12]
+    name = "{}-{}-v{}".format(file_checksum(fn), argsum, SNAPSHOT_FORMAT_VERSION)
+    return os.path.join(snapshot_dir, name)
+
+
+class _Table():
+    """
+    A sequence of optional strings, stored as a single utf-8 blob with (start, length) offsets.
+
+    Entries are decoded on access, so the blob may be memory-mapped.
+    A length of -1 represents None
+    """
+
+    def __init__(self, blob, index):
+        self.blob = blob
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        (start, length) = self.index[i]
+        if length < 0:
+            return None
+        return self._decode(self.blob[start:start+length].tobytes().decode('utf-8'))
+
+    def _decode(self, s):
+        return s
+
+    @staticmethod
+    def encode(values, encoder=None):
+        """
+        Encodes a list of optional values as (blob, index) arrays
+        """
+        parts = []
+        index = np.zeros((len(values), 2), dtype=np.int64)
+        pos = 0
+        for (i, v) in enumerate(values):
+            if v is None:
+                index[i] = (pos, -1)
+                continue
+            if encoder is not None:
+                v = encoder(v)
+            b = v.encode('utf-8')
+            parts.append(b)
+            index[i] = (pos, len(b))
+            pos += len(b)
+        return np.frombuffer(b''.join(parts), dtype=np.uint8), index
+
+
+class _JsonTable(_Table):
+    """
+    A sequence of optional JSON values; see _Table
+
+    The blob is itself a JSON array, with null for absent entries, so
+    the whole table can be decoded at once with :meth:`tolist`
+    """
+
+    def _decode(self, s):
+        return json.loads(s)
+
+    def tolist(self):
+        """
+        Returns a pair (values, present): a list of all values, decoded at once,
+        and a boolean array that is False for absent entries
+        """
+        if len(self) == 0:
+            return ([], np.zeros(0, dtype=bool))
+        values = json.loads(self.blob.tobytes().decode('utf-8'))
+        return (values, np.asarray(self.index)[:, 1] >= 0)
+
+    @staticmethod
+    def encode(values, present=None):
+        """
+        Encodes a list of values as (blob, index) arrays
+
+        Entries where present is False, or by default entries that are None, are absent
+        """
+        parts = [b'[']
+        index = np.zeros((len(values), 2), dtype=np.int64)
+        pos = 1
+        for (i, v) in enumerate(values):
+            if i > 0:
+                parts.append(b',')
+                pos += 1
+            if (v is None) if present is None else not present[i]:
+                parts.append(b'null')
+                index[i] = (pos, -1)
+                pos += 4
+                continue
+            b = json.dumps(v).encode('utf-8')
+            parts.append(b)
+            index[i] = (pos, len(b))
+            pos += len(b)
+        parts.append(b']')
+        return np.frombuffer(b''.join(parts), dtype=np.uint8), index
+
+
+def write_snapshot(ont, path, source=None):
+    """
+    Writes an ontology as a snapshot directory
+
+    The snapshot is written to a temporary directory and moved into place,
+    so concurrent readers never see a partial snapshot
+
+    Arguments
+    ---------
+    ont : Ontology
+        a networkx-backed :class:`Ontology` or a :class:`CompactOntology`
+    path : str
+        snapshot directory to create
+    source : str
+        path of the file the ontology was parsed from. If set, it is recorded
+        in the manifest, and snapshots of other versions of the same file are
+        removed; see :func:`prune_snapshots`
+    """
+    if isinstance(ont, CompactOntology):
+        cg = ont.cgraph
+        (attrs, edges) = _networkx_from_compact_graph(ont)
+    else:
+        (cg, attrs, edges) = _compact_graph_from_networkx(ont.get_graph())
+
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        def save(name, arr):
+            np.save(os.path.join(tmp, name + '.npy'), arr, allow_pickle=False)
+
+        def save_table(name, blob_index):
+            (blob, index) = blob_index
+            save(name, blob)
+            save(name + '_index', index)
+
+        save('ids', np.frombuffer("\n".join(cg.id_arr).encode('utf-8'), dtype=np.uint8))
+        save_table('labels', _Table.encode(cg.label_arr))
+        save_table('meta', _JsonTable.encode(cg.meta_arr))
+
+        # networkx node attributes other than meta, one column per attribute
+        attr_keys = []
+        for d in attrs:
+            for k in d:
+                if k not in attr_keys:
+                    attr_keys.append(k)
+        for (j, k) in enumerate(attr_keys):
+            save_table('node_attr_{}'.format(j),
+                       _JsonTable.encode([d.get(k) for d in attrs], present=[k in d for d in attrs]))
+
+        # networkx edges, in order
+        edge_preds = []
+        pred_codes = {}
+        rows = np.zeros((len(edges), 4), dtype=np.int64)
+        for (e, (u, v, key, d)) in enumerate(edges):
+            pred = d.get('pred')
+            if pred not in pred_codes:
+                pred_codes[pred] = len(edge_preds)
+                edge_preds.append(pred)
+            # keys other than non-negative integers are reassigned on loading
+            rows[e] = (u, v, pred_codes[pred], key if isinstance(key, int) and key >= 0 else -1)
+        save('graph_edges', rows)
+        save_table('edge_attrs', _JsonTable.encode([{k: x for (k, x) in d.items() if k != 'pred'} or None
+                                                    for (_, _, _, d) in edges]))
+
+        types = sorted(set(t for t in cg.type_arr if t is not None))
+        type_codes = {t: i+1 for (i, t) in enumerate(types)}
+        save('types', np.array([type_codes.get(t, 0) for t in cg.type_arr], dtype=np.int32))
+
+        predicates = cg.predicates()
+        for (k, pred) in enumerate(predicates):
+            for (d, by_p) in [('o', cg.o_by_ps), ('s', cg.s_by_po)]:
+                (indptr, indices) = by_p[pred]
+                save('edges_{}_{}_indptr'.format(k, d), indptr)
+                save('edges_{}_{}_indices'.format(k, d), indices)
+
+        xref_edges = []
+        if ont.xref_graph is not None:
+            xref_edges = [[x, y, d] for (x, y, d) in ont.xref_graph.edges(data=True)]
+        ldefs = ont.all_logical_definitions or []
+        pcas = getattr(ont, 'all_property_chain_axioms', None) or []
+        manifest = {
+            'version': SNAPSHOT_FORMAT_VERSION,
+            'source': os.path.abspath(source) if source is not None else None,
+            'id': ont.id,
+            'meta': ont.meta,
+            'predicates': predicates,
+            'types': types,
+            'node_attrs': attr_keys,
+            'edge_predicates': edge_preds,
+            'xref_edges': xref_edges,
+            'logical_definitions': [[ld.class_id, ld.genus_ids, ld.restrictions] for ld in ldefs],
+            'property_chain_axioms': [pca.as_dict() for pca in pcas],
+        }
+        with open(os.path.join(tmp, MANIFEST), 'w') as file:
+            json.dump(manifest, file)
+        if source is not None:
+            shutil.copyfile(source, os.path.join(tmp, SOURCE))
+        os.rename(tmp, path)
+        logger.info("Wrote snapshot: {}".format(path))
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+    if source is not None:
+        prune_snapshots(path, source)
+
+
+def prune_snapshots(path, source):
+    """
+    Removes snapshots of a source file, other than those sharing the checksum of path
+
+    Snapshots with the same checksum are for the same file contents, loaded
+    with different arguments, and are kept. Snapshots written without a
+    source are never removed
+
+    Arguments
+    ---------
+    path : str
+        current snapshot directory for source, see :func:`snapshot_path`
+    source : str
+        path of the source file
+    """
+    source = os.path.abspath(source)
+    (parent, name) = os.path.split(path)
+    checksum = name.split('-')[0]
+    for sibling in os.listdir(parent):
+        if sibling.startswith(checksum + '-') or sibling.startswith('.'):
+            continue
+        spath = os.path.join(parent, sibling)
+        try:
+            with open(os.path.join(spath, MANIFEST), 'r') as file:
+                sibling_source = json.load(file).get('source')
+        except (OSError, ValueError):
+            continue
+        if sibling_source == source:
+            logger.info("Removing stale snapshot: {}".format(spath))
+            shutil.rmtree(spath, ignore_errors=True)
+
+
+def _compact_graph_from_networkx(g):
+    """
+    Returns (CompactGraph, node attribute dicts, edges)
+
+    Node attribute dicts exclude meta. Edges are (parent index, child index, key, attribute dict),
+    in the order networkx iterates them
+    """
+    nodes = []
+    attrs = []
+    for (n, d) in g.nodes(data=True):
+        nodes.append({'id': n, 'lbl': d.get('label'), 'type': d.get('type'), 'meta': d.get('meta')})
+        attrs.append({k: v for (k, v) in d.items() if k != 'meta'})
+    edges = [{'sub': c, 'pred': d['pred'], 'obj': p} for (p, c, d) in g.edges(data=True)]
+    cg = CompactGraph(nodes=nodes, edges=edges)
+    id2index = cg.id2index
+    edges = [(id2index[p], id2index[c], key, d) for (p, c, key, d) in g.edges(keys=True, data=True)]
+    return (cg, attrs, edges)
+
+
+def _networkx_from_compact_graph(ont):
+    """
+    Returns (node attribute dicts, edges) of the networkx graph of a CompactOntology,
+    as for :func:`_compact_graph_from_networkx`, without materializing it
+    """
+    cg = ont.cgraph
+    attrs = []
+    for i in range(len(cg)):
+        d = ont._node_dict(i)
+        d.pop('meta', None)
+        attrs.append(d)
+    edges = []
+    keys = {}
+    for (s, pred, o) in cg.edges():
+        key = keys.get((o, s), 0)
+        keys[(o, s)] = key + 1
+        edges.append((o, s, key, {'pred': pred}))
+    return (attrs, edges)
+
+
+def load_snapshot(path, handle=None, compact=False, mmap=True):
+    """
+    Loads an ontology from a snapshot directory
+
+    Arguments
+    ---------
+    path : str
+        snapshot directory
+    handle : str
+        handle to assign to the ontology
+    compact : bool
+        if True, return a :class:`CompactOntology` backed directly by the
+        (memory-mapped) snapshot arrays. Otherwise a networkx-backed
+        :class:`Ontology` is created
+    mmap : bool
+        if True, arrays are memory-mapped rather than read into memory
+
+    Returns
+    -------
+    Ontology
+    """
+    with open(os.path.join(path, MANIFEST), 'r') as file:
+        manifest = json.load(file)
+    if manifest.get('version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError("Unsupported snapshot version {} in {}".format(manifest.get('version'), path))
+    mmap_mode = 'r' if mmap else None
+
+    def load(name):
+        return np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+
+    id_blob = load('ids')
+    id_arr = id_blob.tobytes().decode('utf-8').split('\n') if len(id_blob) > 0 else []
+    label_arr = _Table(load('labels'), load('labels_index'))
+    meta_arr = _JsonTable(load('meta'), load('meta_index'))
+    type_vocab = [None] + manifest['types']
+    type_arr = [type_vocab[c] for c in load('types').tolist()]
+    o_by_ps = {}
+    s_by_po = {}
+    for (k, pred) in enumerate(manifest['predicates']):
+        o_by_ps[pred] = (load('edges_{}_o_indptr'.format(k)), load('edges_{}_o_indices'.format(k)))
+        s_by_po[pred] = (load('edges_{}_s_indptr'.format(k)), load('edges_{}_s_indices'.format(k)))
+    cg = CompactGraph.from_arrays(id_arr, label_arr, type_arr, meta_arr, o_by_ps, s_by_po)
+
+    xref_graph = nx.MultiGraph()
+    for (x, y, d) in manifest['xref_edges']:
+        xref_graph.add_edge(x, y, **d)
+    ldefs = [LogicalDefinition(c, g, [tuple(r) for r in rs]) for (c, g, rs) in manifest['logical_definitions']]
+    pcas = [PropertyChainAxiom(a['predicateId'], a['chainPredicateIds']) for a in manifest['property_chain_axioms']]
+
+    if compact:
+        ont = CompactOntology(handle=handle,
+                              id=manifest['id'],
+                              cgraph=cg,
+                              xref_graph=xref_graph,
+                              meta=manifest['meta'],
+                              logical_definitions=ldefs,
+                              property_chain_axioms=pcas)
+    else:
+        g = nx.MultiDiGraph()
+        attrs = [{} for _ in id_arr]
+        for (j, k) in enumerate(manifest['node_attrs']):
+            table = _JsonTable(load('node_attr_{}'.format(j)), load('node_attr_{}_index'.format(j)))
+            (values, present) = table.tolist()
+            for i in np.flatnonzero(present).tolist():
+                attrs[i][k] = values[i]
+        (metas, present) = meta_arr.tolist()
+        for i in np.flatnonzero(present).tolist():
+            attrs[i]['meta'] = metas[i]
+        g.add_nodes_from(zip(id_arr, attrs))
+
+        edge_preds = manifest['edge_predicates']
+        (edge_attrs, present) = _JsonTable(load('edge_attrs'), load('edge_attrs_index')).tolist()
+        present = present.tolist()
+        # add_edge with an explicit key is much faster than add_edges_from
+        for (e, (u, v, p, key)) in enumerate(load('graph_edges').tolist()):
+            d = {'pred': edge_preds[p]}
+            if present[e]:
+                d.update(edge_attrs[e])
+            g.add_edge(id_arr[u], id_arr[v], key=key if key >= 0 else None, **d)
+        payload = {
+            'id': manifest['id'],
+            'meta': manifest['meta'],
+            'graph': g,
+            'xref_graph': xref_graph,
+            'graphdoc': None,
+            'logical_definitions': ldefs,
+            'property_chain_axioms': pcas
+        }
+        ont = Ontology(handle=handle, payload=payload)
+    logger.info("Loaded snapshot: {}".format(path))
+    return ont
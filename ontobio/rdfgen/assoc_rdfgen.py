@@ -2,7 +2,7 @@ from prefixcommons import curie_util
 from prefixcommons.curie_util import contract_uri, expand_uri, get_prefixes
 from ontobio.vocabulary.relations import OboRO, Evidence
 from ontobio.vocabulary.upper import UpperLevel
-from ontobio.ecomap import EcoMap
+from ontobio.ecomap import default_ecomap
 from ontobio.rdfgen import relations
 from rdflib import Namespace
 from rdflib import BNode
@@ -87,10 +87,9 @@ class RdfTransform(object):
 
         self.writer = writer
         self.include_subject_info = False
-        self.ecomap = EcoMap()
+        self.ecomap = default_ecomap()
         self._emit_header_done = False
         self.uribase = writer.base
-        self.ecomap.mappings()
         self.bad_chars_regex = re.compile("[^\.:_\-0-9a-zA-Z]")
         self.ro_lookup = dict(relations.label_relation_lookup())
 
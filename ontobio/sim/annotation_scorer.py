@@ -130,24 +130,29 @@ class AnnotationScorer:
             ic_map = self.ic_store.get_profile_ic(profile + negated_classes)
 
         scores = []
+        category_statistics = self.ic_store.category_statistics
 
         for cat in categories:
-            if cat not in self.ic_store.category_statistics:
+            if cat not in category_statistics:
                 raise ValueError("statistics for {} not indexed".format(cat))
+            stats = category_statistics[cat]
 
-            pos_profile = [cls for cls in profile
-                           if cls in self.ic_store.category_statistics[cat].descendants]
-            neg_profile = [cls for cls in negated_classes
-                           if cls in self.ic_store.category_statistics[cat].descendants]
+            pos_profile = [cls for cls in profile if cls in stats.descendants]
+            neg_profile = [cls for cls in negated_classes if cls in stats.descendants]
+
+            if len(pos_profile) == 0 and len(neg_profile) == 0:
+                # the simple score of an empty profile
+                scores.append(0.0)
+                continue
 
             # Note that we're deviating from the publication
             # to match the reference java implementation where
             # mean_max_ic is replaced by max_max_ic
             scores.append(self._get_simple_score(
                 pos_profile, neg_profile,
-                self.ic_store.category_statistics[cat].mean_mean_ic,
-                self.ic_store.category_statistics[cat].max_max_ic,
-                self.ic_store.category_statistics[cat].mean_sum_ic,
+                stats.mean_mean_ic,
+                stats.max_max_ic,
+                stats.mean_sum_ic,
                 negation_weight, ic_map
             ))
         return mean(scores)
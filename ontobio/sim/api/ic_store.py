@@ -0,0 +1,289 @@
+"""
+Local information content (IC) store, backed by an association set
+
+The IC of a class is -log2 of the fraction of subjects (e.g. diseases) that
+have the class as an inferred type. Classes in the ontology that are not an
+inferred type of any subject are treated as if annotated to a single subject,
+as in :class:`ontobio.sim.profile_index.ProfileIndex`, so that the store has
+an IC for every class in the ontology. Summary statistics are computed over the
+direct annotations of each subject, as in owlsim2:
+
+ - mean_mean_ic : average of the mean IC of each subject
+ - mean_sum_ic, max_sum_ic : average and maximum of the summed IC of each subject
+ - mean_max_ic, max_max_ic : average and maximum of the max IC of each subject
+ - mean_cls : average number of classes per subject
+ - individual_count : number of annotated subjects
+
+Statistics for a category (e.g. an upper level HPO class) are computed in
+the same way, over the annotations of each subject to descendants of the
+category, and over subjects with at least one such annotation.
+
+A store can be written to a directory, and loaded without the association
+set or the ontology, for scoring offline. The directory contains:
+
+ - `manifest.json` : format version, statistics, and categories
+ - `ids.npy` : newline-separated class ids, utf-8 encoded
+ - `ics.npy` : IC of each class; NaN for ids that are only category descendants
+ - `category_N.npy` : indexes into ids of the descendants of each category
+
+See also:
+
+ - annotation_scorer.py
+ - ontol_snapshot.py
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from typing import Iterable, Dict, List, Optional
+from ontobio.model.similarity import IcStatistic
+from ontobio.sim.api.interfaces import InformationContentStore
+from ontobio.vocabulary.upper import HpoUpperLevel
+
+logger = logging.getLogger(__name__)
+
+IC_STORE_FORMAT_VERSION = 1
+
+MANIFEST = 'manifest.json'
+
+
+class LocalICStore(InformationContentStore):
+    """
+    InformationContentStore held in memory
+
+    Typically created from an association set with :func:`create_ic_store`,
+    or loaded with :func:`load_ic_store`
+    """
+
+    def __init__(self,
+                 ic_map: Dict[str, float],
+                 statistics: IcStatistic,
+                 category_statistics: Optional[Dict[str, IcStatistic]] = None):
+        """
+        Arguments
+        ---------
+        ic_map : dict
+            class id to IC, for classes in the ontology or annotated to at least one subject
+        statistics : IcStatistic
+            statistics over all subjects
+        category_statistics : dict
+            category class id to statistics; descendants should be sets,
+            for fast membership tests
+        """
+        self.ic_map = ic_map
+        self._statistics = statistics
+        self._category_statistics = category_statistics if category_statistics is not None else {}
+
+    @property
+    def statistics(self) -> IcStatistic:
+        return self._statistics
+
+    @statistics.setter
+    def statistics(self, value: IcStatistic):
+        self._statistics = value
+
+    @property
+    def category_statistics(self) -> Dict[str, IcStatistic]:
+        return self._category_statistics
+
+    @category_statistics.setter
+    def category_statistics(self, value: Dict[str, IcStatistic]):
+        self._category_statistics = value
+
+    def get_profile_ic(self, profile: Iterable) -> Dict[str, float]:
+        """
+        Given a list of classes, return a dictionary with their information content
+
+        Classes that are neither in the ontology nor annotated are omitted
+        """
+        ic_map = self.ic_map
+        return {cls: ic_map[cls] for cls in profile if cls in ic_map}
+
+
+def _statistics(counts, sums, maxes, descendants=None) -> IcStatistic:
+    """
+    IcStatistic from the number of classes, summed IC and max IC of each subject
+    """
+    annotated = counts > 0
+    (counts, sums, maxes) = (counts[annotated], sums[annotated], maxes[annotated])
+    if len(counts) == 0:
+        return IcStatistic(0.0, 0.0, 0.0, 0.0, 0.0, 0, 0.0, descendants=descendants)
+    return IcStatistic(
+        mean_mean_ic=float((sums / counts).mean()),
+        mean_sum_ic=float(sums.mean()),
+        mean_cls=float(counts.mean()),
+        max_max_ic=float(maxes.max()),
+        max_sum_ic=float(sums.max()),
+        individual_count=int(len(counts)),
+        mean_max_ic=float(maxes.mean()),
+        descendants=descendants
+    )
+
+
+def _subject_statistics(indptr, ics):
+    """
+    Number of classes, summed IC and max IC of each subject, from the
+    row pointers and ICs of the annotations of the subjects, stored by row
+    """
+    counts = np.diff(indptr)
+    if len(ics) == 0:
+        return (counts, np.zeros(len(counts)), np.zeros(len(counts)))
+    # reduceat gives the value at the start of empty rows, which may be past the end
+    starts = np.minimum(indptr[:-1], len(ics) - 1)
+    sums = np.add.reduceat(ics, starts)
+    maxes = np.maximum.reduceat(ics, starts)
+    sums[counts == 0] = 0
+    maxes[counts == 0] = 0
+    return (counts, sums, maxes)
+
+
+def create_ic_store(assocmodel, categories: Optional[List[str]] = None,
+                    relations: Optional[List[str]] = None) -> LocalICStore:
+    """
+    Computes ICs and statistics from an association set
+
+    Arguments
+    ---------
+    assocmodel : AssociationSet
+        subjects and their annotations
+    categories : list
+        class ids to compute statistics for. Defaults to the upper level
+        HPO classes, where these are in the ontology
+    relations : list
+        relations used to find the descendants of categories; defaults to subClassOf
+
+    Returns
+    -------
+    LocalICStore
+    """
+    am = assocmodel
+    ont = am.ontology
+    if categories is None:
+        categories = [c.value for c in HpoUpperLevel if ont.has_node(c.value)]
+    if relations is None:
+        relations = ['subClassOf']
+    (matrix, _, class_ids, class_index) = am.incidence_matrix()
+    n_subjects = len(am.subjects)
+    freqs = np.asarray(matrix.sum(axis=0)).ravel()
+    ics = -np.log2(freqs / max(n_subjects, 1))
+    logger.info("Calculating IC statistics for {} subjects over {} classes".format(n_subjects, len(class_ids)))
+
+    # direct annotations of each subject, by row
+    indptr = np.zeros(n_subjects + 1, dtype=np.int64)
+    indices = []
+    for (i, s) in enumerate(am.subjects):
+        cols = sorted(set(class_index[c] for c in am.annotations(s)))
+        indices += cols
+        indptr[i+1] = indptr[i] + len(cols)
+    indices = np.array(indices, dtype=np.int64)
+    statistics = _statistics(*_subject_statistics(indptr, ics[indices]))
+
+    category_statistics = {}
+    for cat in categories:
+        descendants = frozenset(ont.descendants(cat, relations=relations))
+        in_category = np.zeros(len(class_ids), dtype=bool)
+        in_category[[class_index[c] for c in descendants if c in class_index]] = True
+        keep = in_category[indices]
+        cat_indptr = np.concatenate([[0], np.cumsum(keep)])[indptr]
+        category_statistics[cat] = _statistics(*_subject_statistics(cat_indptr, ics[indices[keep]]),
+                                               descendants=descendants)
+    ic_map = dict(zip(class_ids, ics.tolist()))
+    # unannotated classes have the IC of a class annotated to a single subject
+    default_ic = float(np.log2(max(n_subjects, 1)))
+    for n in ont.nodes():
+        if n not in ic_map and ont.node_type(n) in ('CLASS', None):
+            ic_map[n] = default_ic
+    return LocalICStore(ic_map, statistics, category_statistics)
+
+
+def _statistics_dict(stats: IcStatistic) -> Dict:
+    return {k: v for (k, v) in vars(stats).items() if k != 'descendants'}
+
+
+def write_ic_store(store: LocalICStore, path: str):
+    """
+    Writes a store as a directory of NumPy arrays plus a JSON manifest
+
+    The store is written to a temporary directory and moved into place,
+    so concurrent readers never see a partial store. An existing store
+    at path is replaced
+
+    Arguments
+    ---------
+    store : LocalICStore
+    path : str
+        directory to create
+    """
+    ids = list(store.ic_map.keys())
+    index = {c: i for (i, c) in enumerate(ids)}
+    cat_ids = []
+    for stats in store.category_statistics.values():
+        cat_ids.append(np.array([index.setdefault(c, len(index)) for c in sorted(stats.descendants)],
+                                dtype=np.int64))
+    ids = list(index.keys())
+    ics = np.full(len(ids), np.nan)
+    ics[0:len(store.ic_map)] = list(store.ic_map.values())
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        def save(name, arr):
+            np.save(os.path.join(tmp, name + '.npy'), arr, allow_pickle=False)
+
+        save('ids', np.frombuffer("\n".join(ids).encode('utf-8'), dtype=np.uint8))
+        save('ics', ics)
+        for (k, arr) in enumerate(cat_ids):
+            save('category_{}'.format(k), arr)
+        manifest = {
+            'version': IC_STORE_FORMAT_VERSION,
+            'statistics': _statistics_dict(store.statistics),
+            'categories': [{'id': cat, 'statistics': _statistics_dict(stats)}
+                           for (cat, stats) in store.category_statistics.items()],
+        }
+        with open(os.path.join(tmp, MANIFEST), 'w') as file:
+            json.dump(manifest, file)
+        if os.path.isdir(path):
+            old = tempfile.mkdtemp(dir=parent, prefix='.old-')
+            os.rename(path, os.path.join(old, 'store'))
+            os.rename(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.rename(tmp, path)
+        logger.info("Wrote IC store: {}".format(path))
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_ic_store(path: str) -> LocalICStore:
+    """
+    Loads a store written by :func:`write_ic_store`
+
+    Returns
+    -------
+    LocalICStore
+    """
+    with open(os.path.join(path, MANIFEST), 'r') as file:
+        manifest = json.load(file)
+    if manifest.get('version') != IC_STORE_FORMAT_VERSION:
+        raise ValueError("Unsupported IC store version {} in {}".format(manifest.get('version'), path))
+
+    def load(name):
+        return np.load(os.path.join(path, name + '.npy'), allow_pickle=False)
+
+    id_blob = load('ids')
+    ids = id_blob.tobytes().decode('utf-8').split('\n') if len(id_blob) > 0 else []
+    ics = load('ics')
+    annotated = ~np.isnan(ics)
+    ic_map = dict(zip([c for (c, a) in zip(ids, annotated.tolist()) if a], ics[annotated].tolist()))
+    category_statistics = {}
+    for (k, cat) in enumerate(manifest['categories']):
+        descendants = frozenset(ids[i] for i in load('category_{}'.format(k)).tolist())
+        category_statistics[cat['id']] = IcStatistic(descendants=descendants, **cat['statistics'])
+    logger.info("Loaded IC store: {}".format(path))
+    return LocalICStore(ic_map, IcStatistic(**manifest['statistics']), category_statistics)
@@ -3,14 +3,16 @@ Semantic Search (ALPHA)
 """
 from typing import Union, List, Dict, Set, Optional, Tuple
 from collections import defaultdict
-from ontobio.model.similarity import SimResult
+from ontobio.model.similarity import SimResult, SimMatch, SimQuery, PairwiseMatch, ICNode, Node, SimMetadata
+from ontobio.vocabulary.similarity import SimAlgorithm
 from ontobio.sim.api.interfaces import SimApi
+from ontobio.sim.mica import MicaMatrix, ancestor_matrix
+from ontobio.sim.profile_index import ProfileIndex
 import math
 import logging
 
 import pandas as pd
 import numpy as np
-from scipy.spatial.distance import cosine
 import networkx.algorithms.traversal.depth_first_search as dfs
 import networkx as nx
 
@@ -33,15 +35,29 @@ class SemSearchEngine(SimApi):
     
     def __init__(self, assocmodel=None):
         self.assocmodel = assocmodel # type: AssociationSet
-        self.assoc_df = assocmodel.as_dataframe()
+        # sparse subjects x inferred classes
+        (self.assoc_matrix, self.subject_index, self.class_ids, _) = assocmodel.incidence_matrix()
+        self._assoc_df = None
         # TODO: test for cyclicity
         self.G = assocmodel.ontology.get_graph()
         self.ics = None # Optional
+        self.mica_matrix = None # Optional[MicaMatrix]
+        self.mica_ic_df = None
+        self.profile_index = None # Optional[ProfileIndex]
         # TODO: class x class df
         self.ancmap = {}
         for c in self.G.nodes():
             self.ancmap[c] = nx.ancestors(self.G, c)
 
+    @property
+    def assoc_df(self) -> pd.DataFrame:
+        """
+        The association set as a sparse-backed DataFrame; see `AssociationSet.as_dataframe`
+        """
+        if self._assoc_df is None:
+            self._assoc_df = self.assocmodel.as_dataframe(sparse=True)
+        return self._assoc_df
+
     def pw_score_jaccard(self, s1 : ClassId, s2 : ClassId) -> SimScore:
         """
         Calculate jaccard index of inferred associations of two subjects
@@ -74,10 +90,13 @@ class SemSearchEngine(SimApi):
         number
             A number between 0 and 1
         """
-        df = self.assoc_df
-        slice1 = df.loc[s1].values
-        slice2 = df.loc[s2].values
-        return 1 - cosine(slice1, slice2)
+        m = self.assoc_matrix
+        v1 = m[self.subject_index[s1]]
+        v2 = m[self.subject_index[s2]]
+        norms = math.sqrt(v1.multiply(v1).sum() * v2.multiply(v2).sum())
+        if norms == 0:
+            return float('nan')
+        return v1.multiply(v2).sum() / norms
     
     def calculate_all_information_content(self) -> pd.Series:
         """
@@ -91,16 +110,16 @@ class SemSearchEngine(SimApi):
             a pandas Series indexed by class id and with IC as value
         """
         logger.info("Calculating all class ICs")
-        df = self.assoc_df
-        freqs = df.sum(axis=0)
-        n_subjects, _ = df.shape
-        ics = freqs.apply(lambda x: -math.log(x / n_subjects)/math.log(2))
+        m = self.assoc_matrix
+        freqs = np.asarray(m.sum(axis=0)).ravel()
+        n_subjects, _ = m.shape
+        ics = pd.Series(-np.log(freqs / n_subjects) / math.log(2), index=self.class_ids)
         self.ics = ics
         logger.info("DONE calculating all class ICs")
         return ics
 
     def _information_content_frame(self) -> pd.Series:
-        if self.ics == None:
+        if self.ics is None:
             self.calculate_all_information_content()
         return self.ics
 
@@ -125,52 +144,54 @@ class SemSearchEngine(SimApi):
     #    mrcas = self.calculate_mrcas(c1, c2)
         
     
-    def calculate_all_micas(self):
+    def calculate_all_micas(self, dtype=np.float64, triangular=False, path=None, block_size=256, include_micas=False):
         """
         Calculate the MICA (Most Informative Common Ancestor) of every class-pair
+
+        The IC of the MICA of each pair is stored in `mica_matrix`, see :class:`MicaMatrix`;
+        unless only the upper triangle is stored, it is also available as the
+        DataFrame `mica_ic_df`
+
+        Arguments
+        ---------
+        dtype : numpy dtype
+            e.g. numpy.float32 to halve storage
+        triangular : bool
+            if True, store only the upper triangle of the (symmetric) matrix
+        path : str
+            if set, store the matrix in a memory-mapped .npy file, so that
+            memory use is bounded by block_size
+        block_size : int
+            number of rows computed at once
+        include_micas : bool
+            if True, also store the set of MICAs of every pair in `mica_df`.
+            This requires memory and time quadratic in the number of classes
         """
         G = self.G
         ics = self._information_content_frame()
         classes = list(dfs.dfs_preorder_nodes(G))
-        #mica_df = pd.DataFrame(index=classes, columns=classes)
-        #mica_ic_df = pd.DataFrame(index=classes, columns=classes)
-        ncs = len(classes)
-        ic_grid = np.empty([ncs,ncs])
+        ancs = ancestor_matrix(G, classes, ancmap=self.ancmap)
+        self.mica_matrix = MicaMatrix(classes, ancs, ics.reindex(classes).values,
+                                      dtype=dtype, triangular=triangular, path=path, block_size=block_size).compute()
+        self.mica_ic_df = None if triangular else self.mica_matrix.frame()
+        if include_micas:
+            self.mica_df = self._mica_frame(classes, ics)
+
+    def _mica_frame(self, classes, ics):
+        """
+        DataFrame of the set of MICAs of every pair of classes
+        """
+        as_stored = self.mica_matrix.dtype.type
         mica_arrs = []
-        logger.info('Calculating ICs for {} x {} classes'.format(ncs, ncs))
-        for c1i in range(0,ncs):
-            c1 = classes[c1i]
-            logger.debug('Calculating ICs for {}'.format(c1))
+        for c1 in classes:
             ancs1r = self._ancestors(c1) | {c1}
-            c2i = 0
-            mica_arr = []            
-            for c2i in range(0,ncs):
-                c2 = classes[c2i]
-                # TODO: optimize; matrix is symmetrical
-                #if c1i > c2i:
-                #    continue
-                ancs2r = self._ancestors(c2) | {c2}
-                common_ancs = ancs1r & ancs2r
-                if len(common_ancs) > 0:
-                    ic_cas = ics.loc[common_ancs]
-                    max_ic = float(ic_cas.max())
-                    ic_micas = ic_cas[ic_cas >= max_ic]
-                    micas = set(ic_micas.index)
-                    mica_arr.append(micas)
-                    #mica_grid[c1i, c2i] = micas
-                    #mica_grid[c2i, c1i] = micas
-                    ic_grid[c1i, c2i] = max_ic
-                    #ic_grid[c2i, c1i] = max_ic
-                else:
-                    ic_grid[c1i, c2i] = 0
-                    mica_arr.append(set())
-                    #ic_grid[c2i, c1i] = 0
-                    # TODO: consider optimization step; blank out all anc pairs
+            mica_arr = []
+            for c2 in classes:
+                max_ic = self.mica_matrix.ic(c1, c2)
+                common_ancs = ancs1r & (self._ancestors(c2) | {c2})
+                mica_arr.append(set(a for a in common_ancs if a in ics.index and as_stored(ics[a]) >= max_ic))
             mica_arrs.append(mica_arr)
-        logger.info('DONE Calculating ICs for {} x {} classes'.format(ncs, ncs))
-        #self.mica_df = pd.DataFrame(mica_grid, index=classes, columns=classes)
-        self.mica_df = pd.DataFrame(mica_arrs, index=classes, columns=classes)
-        self.mica_ic_df = pd.DataFrame(ic_grid, index=classes, columns=classes)
+        return pd.DataFrame(mica_arrs, index=classes, columns=classes)
 
     def pw_score_resnik_bestmatches(self, s1: SubjectId, s2: SubjectId) -> Tuple[ICValue, ICValue, ICValue]:
         am = self.assocmodel
@@ -180,7 +201,7 @@ class SemSearchEngine(SimApi):
         """
         Compare two class profiles
         """
-        pairs = self.mica_ic_df.loc[cset1, cset2]
+        pairs = self.mica_matrix.frame(cset1, cset2)
         max0 = pairs.max(axis=0)
         max1 = pairs.max(axis=1)
         idxmax0 = pairs.idxmax(axis=0)
@@ -190,29 +211,143 @@ class SemSearchEngine(SimApi):
         return (mean0+mean1)/2, mean0, mean1
         #return (mean0+mean1)/2, mean0, mean1, idxmax0, idxmax1
 
+    def _profile_index(self) -> ProfileIndex:
+        if self.profile_index is None:
+            self.profile_index = ProfileIndex(self.assocmodel)
+        return self.profile_index
+
+    def _resolve(self, id_list, negated_classes=None):
+        """
+        Returns (resolved ids, unresolved ids); ids are resolved if they are in the ontology
+        """
+        if negated_classes is not None and len(negated_classes) > 0:
+            logger.warning("SemSearchEngine does not support negation, ignoring neg classes")
+        ont = self.assocmodel.ontology
+        ids = []
+        unresolved = []
+        for c in id_list:
+            if ont.has_node(c):
+                if c not in ids:
+                    ids.append(c)
+            else:
+                unresolved.append(c)
+        return (ids, unresolved)
+
+    def _pairwise_matches(self, matches) -> List[PairwiseMatch]:
+        """
+        PairwiseMatch objects from (query class, matching class, MICA) tuples
+        """
+        index = self._profile_index()
+        am = self.assocmodel
+
+        def icnode(c):
+            return ICNode(id=c, IC=index.ic(c), label=am.label(c))
+
+        return [PairwiseMatch(reference=icnode(q), match=icnode(t), lcs=icnode(lcs))
+                for (q, t, lcs) in matches]
+
+    def _query(self, ids, unresolved, target_ids=None) -> SimQuery:
+        am = self.assocmodel
+        return SimQuery(
+            ids=[Node(c, am.label(c)) for c in ids],
+            unresolved_ids=unresolved,
+            target_ids=target_ids
+        )
+
+    def _metadata(self) -> SimMetadata:
+        ics = self._profile_index().ics
+        return SimMetadata(max_max_ic=float(ics.max()) if len(ics) > 0 else 0.0)
+
     def search(self,
-               id_list: Set,
-               negated_classes: Set,
-               method: Optional) -> List[SimResult]:
+               id_list: List,
+               negated_classes: List,
+               limit: Optional[int] = 100,
+               method: Optional[SimAlgorithm] = SimAlgorithm.PHENODIGM) -> SimResult:
         """
-        def search(self, cset: Set[ClassId]):
-            slice = self.mica_ic_df.loc[cset]
-            am = self.assocmodel
-            for i in am.subjects:
-                pass # TODO
+        Ranks the subjects of the association set by the similarity of
+        their annotations to a list of classes
+
+        Only subjects with a score above zero are returned. See :class:`ProfileIndex`
+        for the scoring methods
+
+        Arguments
+        ---------
+        id_list : list
+            class ids; ids that are not in the ontology are returned as unresolved
+        negated_classes : list
+            not supported; ignored with a warning
+        limit : int
+            maximum number of matches; all if None
+        method : SimAlgorithm
+            one of :meth:`matchers`
         """
-        raise NotImplementedError
+        if method not in self.matchers():
+            raise NotImplementedError("Sim method not implemented: {}".format(method))
+        (ids, unresolved) = self._resolve(id_list, negated_classes)
+        index = self._profile_index()
+        am = self.assocmodel
+        results = index.search(ids, limit=limit, method=method)
+        best_matches = index.best_matches(ids, [row for (row, _) in results], method=method)
+
+        matches = []
+        rank = 0
+        previous_score = None
+        for ((row, score), pairs) in zip(results, best_matches):
+            # tied scores share a rank
+            if previous_score is None or previous_score > score:
+                rank += 1
+            previous_score = score
+            s = index.subjects[row]
+            matches.append(
+                SimMatch(
+                    id=s,
+                    label=am.label(s),
+                    rank=rank,
+                    score=score,
+                    significance="NaN",
+                    pairwise_match=self._pairwise_matches(pairs)
+                )
+            )
+
+        return SimResult(
+            query=self._query(ids, unresolved),
+            matches=matches,
+            metadata=self._metadata()
+        )
 
     def compare(self,
-                query_classes: Set,
-                reference_classes: Set,
-                method: Optional) -> SimResult:
+                query_classes: List,
+                reference_classes: List,
+                method: Optional[SimAlgorithm] = SimAlgorithm.PHENODIGM) -> SimResult:
         """
-        Given two lists of entites (classes, individual)
-        return their similarity
+        Given two lists of classes, return their similarity
+
+        The result has a single match, with no id or label
         """
-        raise NotImplementedError
+        if method not in self.matchers():
+            raise NotImplementedError("Sim method not implemented: {}".format(method))
+        (ids, unresolved) = self._resolve(query_classes)
+        (ref_ids, ref_unresolved) = self._resolve(reference_classes)
+        index = self._profile_index()
+        match = SimMatch(
+            id="",
+            label="",
+            rank="NaN",
+            score=index.compare(ids, ref_ids, method=method),
+            significance="NaN",
+            pairwise_match=self._pairwise_matches(index.compare_matches(ids, ref_ids, method=method))
+        )
+        am = self.assocmodel
+        return SimResult(
+            query=self._query(ids, unresolved + ref_unresolved,
+                              target_ids=[[Node(c, am.label(c)) for c in ref_ids]]),
+            matches=[match],
+            metadata=self._metadata()
+        )
 
     @staticmethod
-    def matchers() -> List:
-        raise NotImplementedError
+    def matchers() -> List[SimAlgorithm]:
+        """
+        Matchers in SemSearchEngine
+        """
+        return list(ProfileIndex.methods)
@@ -0,0 +1,201 @@
+"""
+Most Informative Common Ancestor (MICA) matrices
+
+The information content (IC) of the MICA of two classes is the highest IC
+of any class that is a reflexive ancestor of both. This module computes it
+for every pair of classes using a sparse boolean matrix of reflexive
+ancestors, without comparing ancestor sets pair by pair.
+
+See :class:`MicaMatrix`
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+import scipy as sp
+import scipy.sparse
+import networkx as nx
+
+logger = logging.getLogger(__name__)
+
+
+def ancestor_matrix(G, classes, ancmap=None):
+    """
+    Sparse boolean matrix of reflexive ancestors
+
+    Arguments
+    ---------
+    G : networkx graph
+        ontology graph, with edges from parent to child
+    classes : list
+        class ids; these index both the rows and the columns of the matrix,
+        and must include all ancestors of each class
+    ancmap : dict
+        optional precomputed map of class id to (non-reflexive) ancestors
+
+    Returns
+    -------
+    csr_matrix
+        n by n matrix, with True in row i, column k if class k is class i or an ancestor of it
+    """
+    index = {c: i for (i, c) in enumerate(classes)}
+    indptr = np.zeros(len(classes) + 1, dtype=np.int64)
+    indices = []
+    for (i, c) in enumerate(classes):
+        ancs = ancmap[c] if ancmap is not None else nx.ancestors(G, c)
+        cols = sorted([index[a] for a in ancs] + [i])
+        indices += cols
+        indptr[i+1] = indptr[i] + len(cols)
+    indices = np.array(indices, dtype=np.int32)
+    return sp.sparse.csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr),
+                                shape=(len(classes), len(classes)))
+
+
+class MicaMatrix():
+    """
+    IC of the MICA of every pair of classes
+
+    The matrix is symmetric. It is computed in blocks of rows; only the upper
+    triangle of each block is computed, and mirrored into the lower triangle
+    unless `triangular` is set, in which case only the upper triangle is stored,
+    packed row by row.
+
+    For each block of rows, each class that is an ancestor of a class in the block
+    is visited in order of increasing IC, and its IC is assigned to all pairs of its
+    descendants; the last assignment to a pair is the IC of its MICA. Pairs with
+    no common ancestor have an IC of 0.
+
+    Storage is either an in-memory array or, if a path is given, a memory-mapped
+    .npy file, in which case memory use is bounded by the size of a block
+    """
+
+    def __init__(self, classes, ancestors, ics, dtype=np.float64, triangular=False, path=None, block_size=256):
+        """
+        Arguments
+        ---------
+        classes : list
+            class ids
+        ancestors : csr_matrix
+            reflexive ancestor matrix of classes; see :func:`ancestor_matrix`
+        ics : array
+            IC of each class, in the same order as classes. NaN values
+            (e.g. for unannotated classes) are never MICAs
+        dtype : numpy dtype
+            e.g. numpy.float32 to halve storage
+        triangular : bool
+            if True, store only the upper triangle
+        path : str
+            if set, the matrix is stored in a memory-mapped .npy file at this location
+        block_size : int
+            number of rows computed at once
+        """
+        self.classes = list(classes)
+        self.class_index = {c: i for (i, c) in enumerate(self.classes)}
+        self.ancestors = ancestors.tocsr()
+        self.ics = np.asarray(ics, dtype=np.float64)
+        self.dtype = np.dtype(dtype)
+        self.triangular = triangular
+        self.path = path
+        self.block_size = block_size
+        n = len(self.classes)
+        shape = (n * (n + 1) // 2,) if triangular else (n, n)
+        if path is not None:
+            self.data = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=shape)
+        else:
+            self.data = np.zeros(shape, dtype=self.dtype)
+        self.computed = False
+
+    def __len__(self):
+        return len(self.classes)
+
+    def _row_offset(self, i):
+        # offset of row i in the packed upper triangle
+        n = len(self.classes)
+        return i * n - (i * (i - 1)) // 2
+
+    def compute(self):
+        """
+        Computes the matrix
+
+        Returns
+        -------
+        MicaMatrix
+            self
+        """
+        n = len(self.classes)
+        # descendants of each class, as sorted indices
+        descendants = self.ancestors.T.tocsr()
+        descendants.sort_indices()
+        ics = self.ics
+        logger.info('Calculating MICA ICs for {} x {} classes'.format(n, n))
+        for r0 in range(0, n, self.block_size):
+            r1 = min(r0 + self.block_size, n)
+            block = np.zeros((r1 - r0, n - r0), dtype=self.dtype)
+            cands = np.unique(self.ancestors[r0:r1].indices)
+            cands = cands[~np.isnan(ics[cands])]
+            for k in cands[np.argsort(ics[cands], kind='stable')]:
+                d = descendants.indices[descendants.indptr[k]:descendants.indptr[k+1]]
+                (lo, hi) = np.searchsorted(d, (r0, r1))
+                if lo == hi:
+                    continue
+                block[np.ix_(d[lo:hi] - r0, d[lo:] - r0)] = ics[k]
+            self._store_block(r0, r1, block)
+            logger.debug('Calculated MICA ICs for rows {}-{}'.format(r0, r1))
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+        self.computed = True
+        logger.info('DONE Calculating MICA ICs for {} x {} classes'.format(n, n))
+        return self
+
+    def _store_block(self, r0, r1, block):
+        if self.triangular:
+            for i in range(r0, r1):
+                o = self._row_offset(i)
+                self.data[o:o + len(self.classes) - i] = block[i - r0, i - r0:]
+        else:
+            self.data[r0:r1, r0:] = block
+            self.data[r0:, r0:r1] = block.T
+
+    def ic(self, c1, c2):
+        """
+        IC of the MICA of two classes
+        """
+        i = self.class_index[c1]
+        j = self.class_index[c2]
+        if not self.triangular:
+            return float(self.data[i, j])
+        if i > j:
+            (i, j) = (j, i)
+        return float(self.data[self._row_offset(i) + j - i])
+
+    def submatrix(self, rows, cols):
+        """
+        ICs of MICAs for all pairs in rows x cols, as an array
+
+        Arguments
+        ---------
+        rows : list
+            class ids
+        cols : list
+            class ids
+        """
+        ri = np.array([self.class_index[c] for c in rows], dtype=np.int64)
+        ci = np.array([self.class_index[c] for c in cols], dtype=np.int64)
+        if not self.triangular:
+            return np.asarray(self.data[np.ix_(ri, ci)])
+        (i, j) = np.broadcast_arrays(ri[:, np.newaxis], ci[np.newaxis, :])
+        (lo, hi) = (np.minimum(i, j), np.maximum(i, j))
+        n = len(self.classes)
+        return np.asarray(self.data[lo * n - (lo * (lo - 1)) // 2 + hi - lo])
+
+    def frame(self, rows=None, cols=None):
+        """
+        ICs of MICAs for all pairs in rows x cols, as a DataFrame indexed by class id
+
+        By default, all classes
+        """
+        if rows is None and cols is None and not self.triangular:
+            return pd.DataFrame(self.data, index=self.classes, columns=self.classes)
+        rows = list(rows) if rows is not None else self.classes
+        cols = list(cols) if cols is not None else self.classes
+        return pd.DataFrame(self.submatrix(rows, cols), index=rows, columns=cols)
@@ -0,0 +1,450 @@
+"""
+Index of the profiles of the subjects of an association set, for profile search
+
+A profile is a set of classes (e.g. the phenotypes of a disease). Searching
+compares a query profile with the profile of every subject. Rather than
+comparing profiles one at a time, the index holds sparse matrices over all
+subjects, and computes each score for all subjects at once:
+
+ - the subject by class matrix of inferred types, whose columns serve as an
+   inverted index from classes to subjects
+ - the subject by class matrix of direct annotations
+ - the reflexive ancestors of each annotated class
+
+Only subjects that share a class with the query are scored. For Phenodigm,
+which needs the best match of every pair of classes, candidates are scored in
+order of an upper bound on their score, stopping once no remaining candidate
+can enter the top k.
+
+See :class:`ProfileIndex`
+"""
+import logging
+
+import numpy as np
+import scipy as sp
+import scipy.sparse
+
+from ontobio.vocabulary.similarity import SimAlgorithm
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileIndex():
+    """
+    Sparse index of the profiles of the subjects of an association set
+
+    The IC of a class is -log2 of the fraction of subjects that have the class
+    as an inferred type. Classes that are not inferred types of any subject are
+    ignored when comparing profiles.
+
+    Scores, comparing a query profile Q with a subject profile T:
+
+     - RESNIK: for each class in Q, the IC of the MICA with the best matching
+       class in T, averaged over Q
+     - SYMMETRIC_RESNIK: the mean of RESNIK in both directions
+     - JACCARD: Jaccard index of the inferred types of Q and T
+     - SIM_GIC: as JACCARD, with each class weighted by its IC
+     - PHENODIGM: each pair of classes is scored as the geometric mean of the IC of
+       their MICA and the Jaccard index of their ancestors. The max, and the average
+       of the best matches in both directions, are each taken as a percentage of
+       the score of Q compared with itself; the score is the mean of the two
+    """
+
+    methods = [
+        SimAlgorithm.PHENODIGM,
+        SimAlgorithm.JACCARD,
+        SimAlgorithm.SIM_GIC,
+        SimAlgorithm.RESNIK,
+        SimAlgorithm.SYMMETRIC_RESNIK
+    ]
+
+    def __init__(self, assocmodel, batch_size=256):
+        """
+        Arguments
+        ---------
+        assocmodel : AssociationSet
+            subjects and their annotations
+        batch_size : int
+            number of candidates scored at once in a Phenodigm search
+        """
+        am = assocmodel
+        self.assocmodel = am
+        self.batch_size = batch_size
+        (matrix, subject_index, class_ids, class_index) = am.incidence_matrix()
+        self.subjects = list(am.subjects)
+        self.subject_index = subject_index
+        self.class_ids = class_ids
+        self.class_index = class_index
+        n_subjects = len(self.subjects)
+        freqs = np.asarray(matrix.sum(axis=0)).ravel()
+        self.ics = -np.log2(freqs / max(n_subjects, 1))
+        # IC of a class annotated to a single subject
+        self.default_ic = float(np.log2(max(n_subjects, 1)))
+
+        self.closures = matrix.tocsc()
+        self.closure_sizes = np.asarray(matrix.sum(axis=1)).ravel()
+        self.closure_ics = matrix @ self.ics
+
+        indptr = np.zeros(n_subjects + 1, dtype=np.int64)
+        indices = []
+        for (i, s) in enumerate(self.subjects):
+            cols = sorted(set(class_index[c] for c in am.annotations(s)))
+            indices += cols
+            indptr[i+1] = indptr[i] + len(cols)
+        indices = np.array(indices, dtype=np.int32)
+        self.direct = sp.sparse.csr_matrix((np.ones(len(indices)), indices, indptr),
+                                           shape=(n_subjects, len(class_ids)))
+        self.direct_sizes = np.diff(indptr)
+
+        # reflexive ancestors of each annotated class, by column
+        self._ancestor_cache = {}
+        n = len(class_ids)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indices = []
+        annotated = set(self.direct.indices.tolist())
+        for j in range(n):
+            if j in annotated:
+                indices += self.ancestors(class_ids[j]).tolist()
+            indptr[j+1] = len(indices)
+        indices = np.array(indices, dtype=np.int32)
+        anc = sp.sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n, n))
+        self.class_ancestors = anc.tocsc()
+        self.ancestor_counts = np.diff(indptr)
+        logger.info("Indexed profiles of {} subjects over {} classes".format(n_subjects, n))
+
+    def ic(self, c):
+        """
+        IC of a class; classes that are not inferred types of any subject are
+        treated as if annotated to a single subject
+        """
+        j = self.class_index.get(c)
+        return self.default_ic if j is None else float(self.ics[j])
+
+    def ancestors(self, c):
+        """
+        Reflexive ancestors of a class that are inferred types of some subject
+
+        Returns
+        -------
+        array
+            sorted column indexes
+        """
+        ancs = self._ancestor_cache.get(c)
+        if ancs is None:
+            index = self.class_index
+            ancs = np.array(sorted(index[a] for a in self.assocmodel.termset_ancestors([c]) if a in index),
+                            dtype=np.int64)
+            self._ancestor_cache[c] = ancs
+        return ancs
+
+    def _by_ic(self, cols):
+        return cols[np.argsort(self.ics[cols], kind='stable')]
+
+    def _closure(self, ancs):
+        return np.unique(np.concatenate(ancs)) if len(ancs) > 0 else np.zeros(0, dtype=np.int64)
+
+    def best_ics(self, ancs):
+        """
+        For each query class, the IC of its MICA with the best matching class of each subject
+
+        Arguments
+        ---------
+        ancs : list
+            reflexive ancestors of each query class; see :meth:`ancestors`
+
+        Returns
+        -------
+        array
+            query classes by subjects
+        """
+        m = self.closures
+        best = np.zeros((len(ancs), len(self.subjects)))
+        for (i, a) in enumerate(ancs):
+            # visit ancestors by increasing IC; the last assignment is the max
+            for k in self._by_ic(a):
+                best[i, m.indices[m.indptr[k]:m.indptr[k+1]]] = self.ics[k]
+        return best
+
+    def reverse_best_ics(self, closure):
+        """
+        For each annotated class, the IC of its MICA with the best matching class of a profile
+
+        Arguments
+        ---------
+        closure : array
+            column indexes of the inferred types of the profile
+        """
+        a = self.class_ancestors
+        best = np.zeros(len(self.class_ids))
+        for k in self._by_ic(closure):
+            best[a.indices[a.indptr[k]:a.indptr[k+1]]] = self.ics[k]
+        return best
+
+    def _intersections(self, m, closure):
+        """
+        Number and total IC of the classes in closure that each row of m has, where m is by column
+        """
+        if len(closure) == 0:
+            return (np.zeros(m.shape[0]), np.zeros(m.shape[0]))
+        rows = np.concatenate([m.indices[m.indptr[k]:m.indptr[k+1]] for k in closure])
+        lens = m.indptr[closure+1] - m.indptr[closure]
+        counts = np.bincount(rows, minlength=m.shape[0])
+        ics = np.bincount(rows, weights=np.repeat(self.ics[closure], lens), minlength=m.shape[0])
+        return (counts, ics)
+
+    def pair_matches(self, ancs):
+        """
+        Each query class paired with each annotated class
+
+        Arguments
+        ---------
+        ancs : list
+            reflexive ancestors of each query class; see :meth:`ancestors`
+
+        Returns
+        -------
+        (micas, scores)
+            arrays of query classes by all classes: the column index of the MICA of each
+            pair (-1 if none), and the Phenodigm score of each pair. Classes that are not
+            directly annotated have no MICA
+        """
+        a = self.class_ancestors
+        n = len(self.class_ids)
+        micas = np.full((len(ancs), n), -1, dtype=np.int64)
+        scores = np.zeros((len(ancs), n))
+        for (i, anc) in enumerate(ancs):
+            inter = np.zeros(n)
+            for k in self._by_ic(anc):
+                rows = a.indices[a.indptr[k]:a.indptr[k+1]]
+                micas[i, rows] = k
+                inter[rows] += 1
+            union = len(anc) + self.ancestor_counts - inter
+            jaccard = np.divide(inter, union, out=np.zeros(n), where=union > 0)
+            scores[i] = np.sqrt(np.where(micas[i] >= 0, self.ics[micas[i]], 0) * jaccard)
+        return (micas, scores)
+
+    def compare_ancestors(self, ancs1, ancs2):
+        """
+        Compares the classes of two profiles pairwise
+
+        Arguments
+        ---------
+        ancs1, ancs2 : list
+            reflexive ancestors of each class of each profile; see :meth:`ancestors`
+
+        Returns
+        -------
+        (micas, scores)
+            arrays of ancs1 by ancs2: the column index of the MICA of each pair (-1 if none),
+            and the Phenodigm score of each pair
+        """
+        micas = np.full((len(ancs1), len(ancs2)), -1, dtype=np.int64)
+        scores = np.zeros((len(ancs1), len(ancs2)))
+        for (i, a1) in enumerate(ancs1):
+            for (j, a2) in enumerate(ancs2):
+                common = np.intersect1d(a1, a2, assume_unique=True)
+                if len(common) == 0:
+                    continue
+                # of MICAs with equal IC, the last, as in pair_matches
+                k = common[len(common) - 1 - np.argmax(self.ics[common][::-1])]
+                micas[i, j] = k
+                scores[i, j] = np.sqrt(self.ics[k] * (len(common) / (len(a1) + len(a2) - len(common))))
+        return (micas, scores)
+
+    def _phenodigm_optimal(self, ancs):
+        (_, scores) = self.compare_ancestors(ancs, ancs)
+        if scores.size == 0:
+            return (0.0, 0.0)
+        return (scores.max(), scores.max(axis=1).mean())
+
+    @staticmethod
+    def _phenodigm(max_score, avg_score, optimal):
+        (max_opt, avg_opt) = optimal
+        if max_opt == 0 or avg_opt == 0:
+            return np.zeros(np.shape(max_score))
+        return 100 * (max_score / max_opt + avg_score / avg_opt) / 2
+
+    def _best_matches(self, micas, scores, method):
+        """
+        (query class, best match, MICA) for each query class with a common ancestor
+        with some class of a profile, as indexes into the columns of micas and scores
+        and into class_ids respectively. The best match is by the score of the pair
+        for Phenodigm, otherwise by the IC of its MICA
+        """
+        if scores.shape[1] == 0:
+            return []
+        if method != SimAlgorithm.PHENODIGM:
+            scores = np.where(micas >= 0, self.ics[micas], -1)
+        best = np.argmax(scores, axis=1)
+        micas = micas[np.arange(len(best)), best]
+        return [(i, j, m) for (i, (j, m)) in enumerate(zip(best.tolist(), micas.tolist())) if m >= 0]
+
+    def best_matches(self, classes, rows, method=SimAlgorithm.PHENODIGM):
+        """
+        Best match of each query class in the profiles of subjects
+
+        Arguments
+        ---------
+        classes : list
+            query class ids
+        rows : list
+            subject rows, e.g. from :meth:`search`
+        method : SimAlgorithm
+
+        Returns
+        -------
+        list
+            for each subject, a list of (query class id, matching class id, MICA id)
+        """
+        (micas, scores) = self.pair_matches([self.ancestors(c) for c in classes])
+        d = self.direct
+        results = []
+        for r in rows:
+            cols = d.indices[d.indptr[r]:d.indptr[r+1]]
+            matches = self._best_matches(micas[:, cols], scores[:, cols], method)
+            results.append([(classes[i], self.class_ids[cols[j]], self.class_ids[m]) for (i, j, m) in matches])
+        return results
+
+    def compare_matches(self, classes1, classes2, method=SimAlgorithm.PHENODIGM):
+        """
+        Best match of each query class in a profile
+
+        Returns
+        -------
+        list
+            (query class id, matching class id, MICA id) tuples
+        """
+        classes2 = sorted(classes2)
+        (micas, scores) = self.compare_ancestors([self.ancestors(c) for c in classes1],
+                                                 [self.ancestors(c) for c in classes2])
+        return [(classes1[i], classes2[j], self.class_ids[m])
+                for (i, j, m) in self._best_matches(micas, scores, method)]
+
+    def compare(self, classes1, classes2, method=SimAlgorithm.PHENODIGM):
+        """
+        Score of one profile compared with another
+
+        Arguments
+        ---------
+        classes1 : list
+            query class ids
+        classes2 : list
+            class ids of the profile compared with
+        method : SimAlgorithm
+        """
+        ancs1 = [self.ancestors(c) for c in classes1]
+        ancs2 = [self.ancestors(c) for c in classes2]
+        if len(ancs1) == 0 or len(ancs2) == 0:
+            return 0.0
+        (micas, scores) = self.compare_ancestors(ancs1, ancs2)
+        mica_ics = np.where(micas >= 0, self.ics[micas], 0)
+        if method == SimAlgorithm.RESNIK:
+            return float(mica_ics.max(axis=1).mean())
+        if method == SimAlgorithm.SYMMETRIC_RESNIK:
+            return float((mica_ics.max(axis=1).mean() + mica_ics.max(axis=0).mean()) / 2)
+        if method == SimAlgorithm.PHENODIGM:
+            avg = (scores.max(axis=1).sum() + scores.max(axis=0).sum()) / (len(ancs1) + len(ancs2))
+            return float(self._phenodigm(scores.max(), avg, self._phenodigm_optimal(ancs1)))
+        closure1 = self._closure(ancs1)
+        closure2 = self._closure(ancs2)
+        common = np.intersect1d(closure1, closure2, assume_unique=True)
+        union = np.union1d(closure1, closure2)
+        if method == SimAlgorithm.JACCARD:
+            return len(common) / len(union) if len(union) > 0 else 0.0
+        if method == SimAlgorithm.SIM_GIC:
+            total = self.ics[union].sum()
+            return float(self.ics[common].sum() / total) if total > 0 else 0.0
+        raise NotImplementedError("Sim method not implemented: {}".format(method))
+
+    def search(self, classes, limit=100, method=SimAlgorithm.PHENODIGM):
+        """
+        Subjects whose profiles best match a query profile
+
+        Arguments
+        ---------
+        classes : list
+            query class ids
+        limit : int
+            maximum number of results; all if None
+        method : SimAlgorithm
+
+        Returns
+        -------
+        list
+            (subject row, score) tuples for subjects with a score above zero,
+            in descending order of score
+        """
+        ancs = [self.ancestors(c) for c in classes]
+        n_subjects = len(self.subjects)
+        if len(ancs) == 0 or n_subjects == 0:
+            return []
+        if limit is None:
+            limit = n_subjects
+        closure = self._closure(ancs)
+        if method == SimAlgorithm.PHENODIGM:
+            return self._search_phenodigm(ancs, closure, limit)
+        if method in (SimAlgorithm.RESNIK, SimAlgorithm.SYMMETRIC_RESNIK):
+            scores = self.best_ics(ancs).mean(axis=0)
+            if method == SimAlgorithm.SYMMETRIC_RESNIK:
+                reverse = self.direct @ self.reverse_best_ics(closure)
+                reverse = np.divide(reverse, self.direct_sizes, out=np.zeros(n_subjects),
+                                    where=self.direct_sizes > 0)
+                scores = (scores + reverse) / 2
+        elif method in (SimAlgorithm.JACCARD, SimAlgorithm.SIM_GIC):
+            (counts, ics) = self._intersections(self.closures, closure)
+            if method == SimAlgorithm.JACCARD:
+                (inter, union) = (counts, len(closure) + self.closure_sizes - counts)
+            else:
+                (inter, union) = (ics, self.ics[closure].sum() + self.closure_ics - ics)
+            scores = np.divide(inter, union, out=np.zeros(n_subjects), where=union > 0)
+        else:
+            raise NotImplementedError("Sim method not implemented: {}".format(method))
+        return self._top(np.flatnonzero(scores > 0), scores, limit)
+
+    @staticmethod
+    def _top(rows, scores, limit):
+        """
+        (row, score) for the top rows by score; ties are broken by row
+        """
+        if len(rows) > limit:
+            rows = rows[np.argpartition(-scores[rows], limit - 1)[:limit]]
+        rows = rows[np.lexsort((rows, -scores[rows]))]
+        return [(int(r), float(scores[r])) for r in rows]
+
+    def _search_phenodigm(self, ancs, closure, limit):
+        optimal = self._phenodigm_optimal(ancs)
+        if optimal[0] == 0 or optimal[1] == 0:
+            return []
+        # each pair score is at most the square root of the IC of the MICA
+        best = np.sqrt(self.best_ics(ancs))
+        reverse = self.direct @ np.sqrt(self.reverse_best_ics(closure))
+        n_query = len(ancs)
+        bound = self._phenodigm(best.max(axis=0),
+                                (best.sum(axis=0) + reverse) / (n_query + self.direct_sizes),
+                                optimal)
+        cands = np.flatnonzero(bound > 0)
+        cands = cands[np.lexsort((cands, -bound[cands]))]
+        (_, pair_scores) = self.pair_matches(ancs)
+        scores = np.zeros(len(self.subjects))
+        threshold = None
+        n_done = 0
+        for b0 in range(0, len(cands), self.batch_size):
+            # candidates are in descending order of bound
+            if threshold is not None and bound[cands[b0]] < threshold * (1 - 1e-9):
+                break
+            rows = cands[b0:b0 + self.batch_size]
+            d = self.direct[rows]
+            values = pair_scores[:, d.indices]
+            starts = d.indptr[:-1]
+            row_max = np.maximum.reduceat(values, starts, axis=1)
+            col_sum = np.add.reduceat(values.max(axis=0), starts)
+            avg = (row_max.sum(axis=0) + col_sum) / (n_query + self.direct_sizes[rows])
+            scores[rows] = self._phenodigm(row_max.max(axis=0), avg, optimal)
+            n_done += len(rows)
+            done = cands[:n_done]
+            if n_done >= limit:
+                # score of the k-th best so far
+                threshold = -np.partition(-scores[done], limit - 1)[limit - 1]
+        done = cands[:n_done]
+        logger.debug("Scored {} of {} candidates".format(len(done), len(cands)))
+        return self._top(done[scores[done] > 0], scores, limit)
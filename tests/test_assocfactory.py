@@ -4,6 +4,7 @@ from ontobio.assocmodel import AssociationSet
 from ontobio.io.gafparser import GafParser
 import logging
 import random
+import numpy as np
 
 NUCLEUS = 'GO:0005634'
 CYTOPLASM = 'GO:0005737'
@@ -110,3 +111,87 @@ def test_remote_go_pombase():
     aset = f.create(ontology=ont, fmt='gaf', file=POMBASE)
     print("SUBJS: {}".format(aset.subjects))
     assert len(aset.subjects) > 100
+
+def test_index_closure_cache():
+    """
+    indexing computes ancestors once per term, optionally in parallel
+    """
+    ont = OntologyFactory().create('tests/resources/go-truncated-pombase.json')
+    aset = AssociationSetFactory().create_from_file(POMBASE, ontology=ont)
+    expected = {}
+    for (s, terms) in aset.association_map.items():
+        ancs = set(terms)
+        for t in terms:
+            ancs.update(ont.ancestors(t))
+        expected[s] = ancs
+    assert aset.subject_to_inferred_map == expected
+    assert set(aset._closure_cache.keys()) == set(t for ts in aset.association_map.values() for t in ts)
+
+    aset2 = AssociationSet(ontology=ont, association_map=aset.association_map, index_processes=2)
+    assert aset2.subject_to_inferred_map == expected
+    assert aset2.objects == aset.objects
+
+    ont.build_closure_index()
+    aset.index()
+    assert aset.subject_to_inferred_map == expected
+
+
+def test_as_dataframe():
+    """
+    dense and sparse-backed frames agree with inferred types
+    """
+    ont = OntologyFactory().create('tests/resources/go-truncated-pombase.json')
+    aset = AssociationSetFactory().create_from_file(POMBASE, ontology=ont)
+    (m, subjects, class_ids) = aset.as_sparse_matrix()
+    assert subjects == aset.subjects
+    assert class_ids == sorted(aset.objects)
+    for (i, s) in enumerate(subjects):
+        assert set(class_ids[j] for j in m[i].indices) == aset.inferred_types(s)
+
+    df = aset.as_dataframe()
+    sdf = aset.as_dataframe(sparse=True)
+    assert sdf.sparse.density < 0.5
+    assert (sdf.sparse.to_dense().values == df.values).all()
+    assert list(sdf.index) == list(df.index) == subjects
+
+    some = subjects[0:3] + ['unknown']
+    df = aset.as_dataframe(subjects=some, fillna=False)
+    assert list(df.index) == some
+    assert set(df.columns) == set.union(*[aset.inferred_types(s) for s in some])
+    assert df.loc['unknown'].isna().all()
+    assert (df.loc[some[0]] == 1).sum() == len(aset.inferred_types(some[0]))
+
+
+def test_intersection_matrix():
+    """
+    matrix intersections agree with set intersections, in full, triangular and chunked modes
+    """
+    ont = OntologyFactory().create('tests/resources/go-truncated-pombase.json')
+    aset = AssociationSetFactory().create_from_file(POMBASE, ontology=ont)
+    terms = sorted(aset.objects)[0:30] + ['GO:0000000']
+    subjects = aset.subjects[0:25] + ['unknown']
+    ilist = aset.query_intersections(terms, terms[5:], shared=True)
+    (counts, jaccard) = aset.intersection_matrix(terms, terms[5:])
+    assert len(ilist) == len(terms) * len(terms[5:])
+    for r in ilist:
+        xs = set(s for s in aset.subjects if r['x'] in aset.inferred_types(s))
+        ys = set(s for s in aset.subjects if r['y'] in aset.inferred_types(s))
+        assert r['shared'] == xs & ys
+        assert r['c'] == counts.loc[r['x'], r['y']] == len(xs & ys)
+        assert r['j'] == jaccard.loc[r['x'], r['y']] == (len(xs & ys) / len(xs | ys) if xs | ys else 0)
+    assert 'shared' not in aset.query_intersections(terms[0:2], terms[0:2])[0]
+
+    (z, _, _) = aset.similarity_matrix(subjects, subjects[3:])
+    for (i, y) in enumerate(subjects[3:]):
+        for (k, x) in enumerate(subjects):
+            assert z[i][k] == aset.jaccard_similarity(x, y)
+
+    for (items, method) in [(terms, aset.intersection_matrix), (subjects, aset.subject_similarity_matrix)]:
+        (counts, jaccard) = method(items, items)
+        (tcounts, tjaccard) = method(items, block_size=50)
+        assert (tcounts.values == counts.values).all()
+        assert (tjaccard.values == jaccard.values).all()
+        blocks = list(method(items, chunked=True, block_size=100))
+        assert len(blocks) > 1
+        upper = np.triu(jaccard.values)
+        assert (np.vstack([j.values for (_, j) in blocks]) == upper).all()
@@ -0,0 +1,66 @@
+from ontobio.ontol_factory import OntologyFactory
+from ontobio.cgraph import CompactGraph, CompactOntology
+import pytest
+
+NUCLEUS = 'GO:0005634'
+PART_OF = 'BFO:0000050'
+
+
+@pytest.mark.parametrize("handle", ["tests/resources/nucleus.json", "tests/resources/go-truncated-pombase.json"])
+def test_compact_matches_networkx(handle):
+    ont = OntologyFactory().create(handle)
+    cont = OntologyFactory().create(handle, compact=True)
+    assert isinstance(cont, CompactOntology)
+    assert cont.id == ont.id
+    assert set(cont.nodes()) == set(ont.nodes())
+    assert set(cont.relations_used()) == set(ont.relations_used())
+    for n in ont.nodes():
+        assert cont.label(n) == ont.label(n)
+        assert cont.node_type(n) == ont.node_type(n)
+        assert [s.val for s in cont.synonyms(n)] == [s.val for s in ont.synonyms(n)]
+        assert set(cont.xrefs(n)) == set(ont.xrefs(n))
+        for rels in [None, ['subClassOf'], ['subClassOf', PART_OF]]:
+            assert set(cont.parents(n, relations=rels)) == set(ont.parents(n, relations=rels))
+            assert set(cont.children(n, relations=rels)) == set(ont.children(n, relations=rels))
+            assert set(cont.ancestors(n, relations=rels)) == set(ont.ancestors(n, relations=rels))
+            assert set(cont.descendants(n, relations=rels, reflexive=True)) == \
+                set(ont.descendants(n, relations=rels, reflexive=True))
+    assert len(cont.all_logical_definitions) == len(ont.all_logical_definitions)
+
+
+def test_compact_graph_materialize():
+    cont = OntologyFactory().create("tests/resources/nucleus.json", compact=True)
+    ont = OntologyFactory().create("tests/resources/nucleus.json")
+    g = cont.get_graph()
+    assert set(g.nodes()) == set(ont.get_graph().nodes())
+    assert sorted(g.edges()) == sorted(ont.get_graph().edges())
+    assert cont.label('GO:0') is None
+    assert cont.label('GO:0', id_if_null=True) == 'GO:0'
+    assert cont.ancestors('GO:0', reflexive=True) == ['GO:0']
+    with pytest.raises(NotImplementedError):
+        cont.add_parent(NUCLEUS, 'GO:0005575')
+
+
+def test_compact_graph_arrays():
+    cg = CompactGraph(nodes=[{'id': 'X:1', 'lbl': 'one'}, {'id': 'X:2'}],
+                      edges=[{'sub': 'X:2', 'pred': 'subClassOf', 'obj': 'X:1'},
+                             {'sub': 'X:2', 'pred': 'subClassOf', 'obj': 'X:1'},
+                             {'sub': 'X:3', 'pred': 'part_of', 'obj': 'X:2'}])
+    assert len(cg) == 3
+    assert cg.number_of_edges() == 2
+    x3 = cg.id2index['X:3']
+    assert cg.closure(x3) == {cg.id2index['X:1'], cg.id2index['X:2']}
+    assert cg.closure(x3, relations=['part_of']) == {cg.id2index['X:2']}
+    assert cg.neighbors(cg.id2index['X:1'], reverse=True) == [cg.id2index['X:2']]
+
+
+@pytest.mark.parametrize("handle", ["tests/resources/nucleus.json", "tests/resources/go-truncated-pombase.json"])
+def test_compact_stream_matches(handle):
+    cont = CompactOntology.from_json_file(handle)
+    sont = CompactOntology.from_json_file(handle, stream=True)
+    assert sont.id == cont.id
+    assert sont.cgraph.id_arr == cont.cgraph.id_arr
+    assert sont.cgraph.label_arr == cont.cgraph.label_arr
+    assert sorted(sont.cgraph.edges()) == sorted(cont.cgraph.edges())
+    assert sorted(sont.xref_graph.edges()) == sorted(cont.xref_graph.edges())
+    assert len(sont.all_logical_definitions) == len(cont.all_logical_definitions)
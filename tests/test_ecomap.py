@@ -14,3 +14,24 @@ def test_ecomap():
     assert m.coderef_to_ecoclass('BADCODE','GO_REF:xxx') == None
     assert m.ecoclass_to_coderef('ECO:9999999999999999999') == (None,None)
     assert m.coderef_to_ecoclass('ISO',None) == 'ECO:0000266'
+
+def test_ecomap_index():
+    """
+    indexed lookups agree with scanning the mappings in order
+    """
+    m = EcoMap()
+    m._index([('IEA', None, 'ECO:1'), ('IEA', 'GO_REF:1', 'ECO:2'), ('IEA', 'GO_REF:1', 'ECO:3'),
+              ('IEA', None, 'ECO:4'), ('ISS', None, 'ECO:2')])
+    assert m.coderef_to_ecoclass('IEA') == 'ECO:1'
+    assert m.coderef_to_ecoclass('IEA', 'GO_REF:1') == 'ECO:2'
+    assert m.coderef_to_ecoclass('IEA', 'GO_REF:2') == 'ECO:4'
+    assert m.coderef_to_ecoclass('IDA') is None
+    assert m.ecoclass_to_coderef('ECO:2') == ('IEA', 'GO_REF:1')
+    assert m.ecoclass_to_coderef('ECO:4') == ('IEA', None)
+
+def test_default_ecomap():
+    from ontobio.ecomap import default_ecomap
+    from ontobio.io.assocparser import AssocParserConfig
+    assert default_ecomap() is default_ecomap()
+    assert AssocParserConfig().ecomap is default_ecomap()
+    assert default_ecomap().coderef_to_ecoclass('IEA') == 'ECO:0000501'
@@ -3,6 +3,7 @@ from ontobio.assoc_factory import AssociationSetFactory
 from ontobio.assocmodel import AssociationSet
 import logging
 import random
+import pytest
 
 CVP = 'MP:0004084' # cardiomyopathy
 MUS = 'NCBITaxon:10090'
@@ -47,3 +48,69 @@ def test_construct():
 
 
 #test_construct()
+
+
+def _reference_enrichment(aset, subjects, background=None, threshold=0.05, direction='greater'):
+    """
+    per-class fisher exact test, as enrichment_test was originally implemented
+    """
+    import scipy.stats
+    subjects = set(subjects)
+    background = set(aset.subjects) if background is None else set(background)
+    background.update(subjects)
+    hypotheses = set()
+    for s in subjects:
+        hypotheses.update(aset.inferred_types(s))
+    results = {}
+    for cls in hypotheses:
+        bg_count = len([s for s in background if cls in aset.inferred_types(s)])
+        if bg_count <= 1:
+            continue
+        a = len([s for s in subjects if cls in aset.inferred_types(s)])
+        b = len(subjects) - a
+        c = bg_count - a
+        d = (len(background) - bg_count) - b
+        _, p = scipy.stats.fisher_exact([[a, b], [c, d]], direction)
+        results[cls] = p
+    return {c: min(p * len(results), 1.0) for (c, p) in results.items() if min(p * len(results), 1.0) < threshold}
+
+
+def test_enrichment_local():
+    """
+    vectorized enrichment test matches per-class fisher exact tests
+    """
+    ont = OntologyFactory().create('tests/resources/go-truncated-pombase.json')
+    aset = AssociationSetFactory().create_from_file('tests/resources/truncated-pombase.gaf', ontology=ont)
+    rng = random.Random(42)
+    subjects = sorted(aset.subjects)
+    # genes annotated to a common class, plus noise
+    cls = 'GO:0005634'
+    sample = [s for s in subjects if cls in aset.inferred_types(s)][0:20] + rng.sample(subjects, 5) + ['unknown:1']
+    for direction in ['greater', 'less', 'two-sided']:
+        for background in [None, rng.sample(subjects, 100)]:
+            rs = aset.enrichment_test(sample, background=background, threshold=1.0, labels=True, direction=direction)
+            expected = _reference_enrichment(aset, sample, background=background, threshold=1.0, direction=direction)
+            assert sorted(r['c'] for r in rs) == sorted(expected.keys())
+            for r in rs:
+                assert r['p'] == pytest.approx(expected[r['c']], rel=1e-6, abs=1e-15)
+            assert [r['p'] for r in rs] == sorted(r['p'] for r in rs)
+    rs = aset.enrichment_test(sample, hypotheses=[cls, 'GO:0003674'], threshold=1.0)
+    assert set(r['c'] for r in rs) <= {cls, 'GO:0003674'}
+
+
+def test_hypergeom_pvalues():
+    """
+    bulk p-values agree with scipy fisher_exact
+    """
+    import scipy.stats
+    from ontobio.assocmodel import hypergeom_pvalues
+    rng = random.Random(1)
+    M = 5000
+    N = 300
+    n = [rng.randint(2, 2000) for _ in range(200)]
+    a = [rng.randint(max(0, N - (M - x)), min(x, N)) for x in n]
+    for direction in ['greater', 'less', 'two-sided']:
+        ps = hypergeom_pvalues(a, M, N, n, direction, block_size=1000)
+        for (ai, ni, p) in zip(a, n, ps):
+            _, expected = scipy.stats.fisher_exact([[ai, N - ai], [ni - ai, M - N - ni + ai]], direction)
+            assert p == pytest.approx(expected, rel=1e-6, abs=1e-15)
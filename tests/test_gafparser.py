@@ -351,5 +351,95 @@ def test_factory():
     assert len(aset.associations_by_subj) > 0
     assert found == 2
 
+@pytest.mark.parametrize("gaf,version", [(POMBASE, "2.1"), ("tests/resources/test-qualifiers-2.2.gaf", "2.2"), ("tests/resources/errors.gaf", "2.1")])
+def test_parallel_write(gaf, version):
+    """
+    Validating in a process pool writes the same output and report as a serial parse
+    """
+    ont = OntologyFactory().create(ONT)
+
+    def run(processes):
+        out = io.StringIO()
+        filtered = io.StringIO()
+        config = assocparser.AssocParserConfig(ontology=ont, filter_out_evidence=["IEA"], filtered_evidence_file=filtered)
+        p = GafParser(config=config)
+        writer = GafWriter(file=out, source="test", version=version)
+        sink = GafWriter(file=io.StringIO(), source="test", version=version)
+        if processes == 0:
+            for assoc in p.association_generator(file=gaf):
+                writer.write_assoc(assoc)
+        else:
+            n = sum(p.parallel_write(gaf, writer, processes=processes, chunk_size=7, sink=sink))
+            assert n == p.report.n_lines
+            # the sink sees every association written, in order
+            assert sink.file.getvalue() == out.getvalue()
+        return (out.getvalue(), filtered.getvalue(), p.report)
+
+    (out, filtered, report) = run(0)
+    for processes in [1, 3]:
+        (pout, pfiltered, preport) = run(processes)
+        assert pout == out
+        assert pfiltered == filtered
+        assert preport.to_report_json() == report.to_report_json()
+        assert preport.header == report.header
+        assert [m["line"] for m in preport.messages] == [m["line"] for m in report.messages]
+
+@pytest.mark.parametrize("parser_class,fn", [(GafParser, POMBASE), (GafParser, QGAF), (GpadParser, POMBASE_GPAD)])
+def test_skim_association_map(parser_class, fn):
+    """
+    columnar skim gives the same subject to class map as grouping skim tuples
+    """
+    for exclude_relations in [None, ["part_of"]]:
+        def make_parser():
+            p = parser_class()
+            p.config.exclude_relations = exclude_relations
+            return p
+        expected_map = {}
+        expected_labels = {}
+        for (s, n, t) in make_parser().skim(open(fn, "r")):
+            expected_map.setdefault(s, []).append(t)
+            expected_labels[s] = n
+        # small blocks exercise lines split across reads
+        p = make_parser()
+        p.skim_block_size = 100
+        assert p.skim_association_map(open(fn, "r")) == (expected_map, expected_labels)
+        assert make_parser().skim_association_map(fn) == (expected_map, expected_labels)
+
+def test_sampled_report():
+    """
+    A report with a sample size counts every message but keeps only a sample of them
+    """
+    ont = OntologyFactory().create(ONT)
+    reports = []
+    for sample_size in [None, 2]:
+        p = GafParser(config=assocparser.AssocParserConfig(ontology=ont, report_sample_size=sample_size))
+        for _ in p.association_generator(file="tests/resources/errors.gaf"):
+            pass
+        reports.append(p.report)
+
+    (full, sampled) = reports
+    assert len(sampled.messages) == 2
+    assert sampled.messages.seen == len(full.messages)
+    assert sampled.reporter.totals() == full.reporter.totals()
+    for (rule_id, messages) in sampled.to_report_json()["messages"].items():
+        assert len(messages) == min(2, len(full.reporter.messages[rule_id]))
+        for m in messages:
+            assert m in full.reporter.messages[rule_id]
+    assert "counts" in sampled.to_report_json()
+    totals = lambda report: [l for l in report.to_markdown().split("\n") if l.startswith("* total")]
+    assert totals(sampled) == totals(full)
+
+def test_reservoir_merge():
+    from ontobio.io.parsereport import Reservoir
+    (a, b) = (Reservoir(10), Reservoir(10))
+    for i in range(100):
+        a.offer(i)
+    for i in range(100, 130):
+        b.offer(i)
+    assert len(a) == 10 and a.seen == 100
+    a.merge(b)
+    assert len(a) == 10 and a.seen == 130
+    assert len(set(a)) == 10
+
 if __name__ == "__main__":
     pytest.main(args=["tests/test_gafparser.py::test_parse_gaf"])
@@ -68,3 +68,34 @@ def test_conjunctive_set_list_to_str():
             association.ConjunctiveSet(["GO:987"])
         ])
     assert c == "MGI:12345,DOI:333|GO:987"
+
+def test_replace_shares_unchanged_parts():
+    gaf = ["PomBase", "SPBC11B10.09", "cdc2", "", "GO:0007275", "PMID:21873635", "IBA", "PANTHER:PTN000623979", "P", "Cyclin-dependent kinase 1", "", "protein", "taxon:284812", "20170228", "GO_Central", "part_of(CL:0000001)", ""]
+    assoc = gafparser.to_association(gaf).associations[0]
+    replaced = assoc.replace(object=association.Term("GO:0008150", assoc.object.taxon), object_extensions=[])
+
+    assert replaced.object.id == "GO:0008150"
+    assert replaced.object_extensions == []
+    assert replaced.subject is assoc.subject
+    assert replaced.evidence is assoc.evidence
+    # The original is untouched
+    assert assoc.object.id == "GO:0007275"
+    assert len(assoc.object_extensions) == 1
+
+def test_association_interner():
+    gaf = ["PomBase", "SPBC11B10.09", "cdc2", "", "GO:0007275", "PMID:21873635", "IBA", "PANTHER:PTN000623979", "P", "Cyclin-dependent kinase 1", "", "protein", "taxon:284812", "20170228", "GO_Central", "", ""]
+    first = gafparser.to_association(gaf).associations[0]
+    gaf[4] = "GO:0008150"
+    second = gafparser.to_association(list(gaf)).associations[0]
+    expected = gafparser.to_association(list(gaf)).associations[0]
+
+    interner = association.AssociationInterner(source_lines=False)
+    first = interner.intern(first)
+    second = interner.intern(second)
+    assert second.subject is first.subject
+    assert second.object is not first.object
+    assert second.provided_by is first.provided_by
+    assert second.source_line is None
+    expected.source_line = None
+    assert second == expected
+    assert not hasattr(second, "__dict__")
@@ -0,0 +1,78 @@
+from ontobio.ontol_factory import OntologyFactory
+from ontobio.assoc_factory import AssociationSetFactory
+from ontobio.sim.api.ic_store import create_ic_store, write_ic_store, load_ic_store
+from ontobio.sim.annotation_scorer import AnnotationScorer
+
+import math
+import statistics
+
+HPOA = "tests/resources/truncated.hpoa"
+ONT = "tests/resources/hp-truncated-hpoa.json"
+
+ont = OntologyFactory().create(ONT)
+aset = AssociationSetFactory().create_from_file(HPOA, ontology=ont)
+
+
+def test_create_ic_store():
+    store = create_ic_store(aset)
+    n = len(aset.subjects)
+    ic = {c: -math.log2(sum(1 for s in aset.subjects if c in aset.inferred_types(s)) / n)
+          for c in aset.objects}
+    assert set(ic).issubset(store.ic_map)
+    for c in ic:
+        assert math.isclose(store.ic_map[c], ic[c])
+
+    per_subject = [[ic[c] for c in set(aset.annotations(s))] for s in aset.subjects]
+    per_subject = [p for p in per_subject if p]
+    stats = store.statistics
+    assert stats.individual_count == len(per_subject)
+    assert math.isclose(stats.mean_mean_ic, statistics.mean(statistics.mean(p) for p in per_subject))
+    assert math.isclose(stats.mean_sum_ic, statistics.mean(sum(p) for p in per_subject))
+    assert math.isclose(stats.max_sum_ic, max(sum(p) for p in per_subject))
+    assert math.isclose(stats.max_max_ic, max(max(p) for p in per_subject))
+
+    assert len(store.category_statistics) > 0
+    for (cat, cat_stats) in store.category_statistics.items():
+        per_subject = [[ic[c] for c in set(aset.annotations(s)) if c in cat_stats.descendants]
+                       for s in aset.subjects]
+        per_subject = [p for p in per_subject if p]
+        assert cat_stats.individual_count == len(per_subject)
+        if per_subject:
+            assert math.isclose(cat_stats.mean_max_ic, statistics.mean(max(p) for p in per_subject))
+
+
+def test_write_load_ic_store(tmpdir):
+    store = create_ic_store(aset)
+    path = str(tmpdir.join("ic_store"))
+    write_ic_store(store, path)
+    # overwriting replaces the existing store
+    write_ic_store(store, path)
+    loaded = load_ic_store(path)
+    assert loaded.ic_map == store.ic_map
+    assert vars(loaded.statistics) == vars(store.statistics)
+    assert loaded.category_statistics.keys() == store.category_statistics.keys()
+    for cat in store.category_statistics:
+        assert vars(loaded.category_statistics[cat]) == vars(store.category_statistics[cat])
+
+    profile = sorted(store.category_statistics['HP:0000707'].descendants & set(store.ic_map))[:3]
+    categories = list(store.category_statistics)
+    expected = AnnotationScorer(store).get_annotation_sufficiency(profile, [], categories=categories)
+    result = AnnotationScorer(loaded).get_annotation_sufficiency(profile, [], categories=categories)
+    assert 0 < result.simple_score <= 1
+    assert result.simple_score == expected.simple_score
+    assert result.scaled_score == expected.scaled_score
+    assert result.categorical_score == expected.categorical_score
+
+
+def test_unannotated_class():
+    ont2 = OntologyFactory().create(ONT, snapshot=False)
+    ont2.add_node('HP:9999999', 'unannotated abnormality')
+    ont2.add_parent('HP:9999999', 'HP:0000707')
+    aset2 = AssociationSetFactory().create_from_file(HPOA, ontology=ont2)
+    store = create_ic_store(aset2)
+    assert store.ic_map['HP:9999999'] == math.log2(len(aset2.subjects))
+    assert 'HP:9999999' in store.category_statistics['HP:0000707'].descendants
+    categories = list(store.category_statistics)
+    result = AnnotationScorer(store).get_annotation_sufficiency(['HP:9999999'], [], categories=categories)
+    assert 0 < result.simple_score <= 1
+    assert result.categorical_score > 0
@@ -352,3 +352,89 @@ def test_awe_xref_weights():
     assert P_YZ[0] > P_YZ[2]
     assert P_YZ[0] > P_YZ[3]
     
+
+
+def test_awe_batch():
+    """
+    Batched axiom weight estimation agrees with estimating each pair separately
+    """
+    ont = Ontology()
+    lexmap = LexicalMapEngine(config={'match_weights': [
+        {'prefix1':'X',
+         'prefix2':'Y',
+         'weights':[1.0, -1.0, 2.0, 0.0]
+         }
+        ],
+        'xref_weights':[
+            {'left':'Y:1',
+             'right':'X:1',
+             'weights':[0.0, 3.0, 0.0, 0.0]}
+        ]})
+    ont.add_node('X:1', 'foo 1')
+    ont.add_node('Y:1', 'foo 1')
+    ont.add_node('Y:2', 'bar')
+    ont.add_synonym(Synonym('Y:2', val='foo 1', pred='hasBroadSynonym'))
+    ont.add_node('Z:1', 'foo')
+    ont.add_synonym(Synonym('Z:1', val='foo 1', pred='hasNarrowSynonym'))
+    ont.add_parent('Y:2', 'Y:1')
+
+    lexmap.index_ontology(ont)
+    xg = lexmap.get_xref_graph()
+    pairs = [d['idpair'] for (_,_,d) in xg.edges(data=True)]
+    assert len(pairs) > 3
+    PS = lexmap.weighted_axioms_batch(pairs, xg)
+    assert PS.shape == (len(pairs), 4)
+    for ((x,y), P) in zip(pairs, PS):
+        assert list(P) == list(lexmap.weighted_axioms(x, y, xg))
+        assert abs(sum(P) - 1.0) < 1e-9
+    df = lexmap.as_dataframe(xg)
+    assert len(df) == len(pairs)
+
+
+def test_index_ontologies_parallel():
+    """
+    Indexing with a pool of processes gives the same index as indexing serially
+    """
+    factory = OntologyFactory()
+    onts = [factory.create('tests/resources/autopod-{}.json'.format(f)) for f in ['x','m']]
+    config = dict(synsets=[dict(word="", synonym="ignoreme")],
+                  ontology_configurations=[dict(prefix='XAO', normalized_form_confidence=0.5)])
+
+    def index(processes):
+        lexmap = LexicalMapEngine(config=config)
+        lexmap.index_ontologies(onts, processes=processes)
+        return sorted((v, s.class_id, s.pred, s.confidence, s.is_abbreviation())
+                      for (v, syns) in lexmap.lmap.items() for s in syns)
+
+    serial = index(1)
+    assert len(serial) > 0
+    assert index(2) == serial
+
+
+def test_lexmap_incremental():
+    """
+    Rescoring after adding ontologies, or changing ontology pairs, agrees with scoring from scratch
+    """
+    factory = OntologyFactory()
+    onts = [factory.create('tests/resources/autopod-{}.json'.format(f)) for f in ['x','m','h','bto']]
+
+    def scores(xg):
+        return sorted((d['idpair'], d['score'], d['simscores'], d['reciprocal_score'], d['cpr'])
+                      for (_,_,d) in xg.edges(data=True))
+
+    full = LexicalMapEngine()
+    full.index_ontologies(onts)
+    expected = scores(full.get_xref_graph())
+
+    lexmap = LexicalMapEngine()
+    lexmap.index_ontologies(onts[0:2])
+    lexmap.get_xref_graph()
+    lexmap.index_ontologies(onts[2:])
+    assert scores(lexmap.get_xref_graph()) == expected
+
+    pairs = [(onts[0].id, onts[1].id), (onts[1].id, onts[0].id)]
+    lexmap.ontology_pairs = pairs
+    full = LexicalMapEngine()
+    full.index_ontologies(onts)
+    full.ontology_pairs = pairs
+    assert scores(lexmap.get_xref_graph()) == scores(full.get_xref_graph())
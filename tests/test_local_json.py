@@ -255,3 +255,52 @@ def test_obsolete():
     assert ont.replaced_by('GO:1') == ['GO:2']
     assert ont.replaced_by('GO:4') == ['GO:3']
     assert n_obs == 2
+
+def test_contract_uri():
+    """
+    Trie-based contraction agrees with prefixcommons
+    """
+    import json
+    from prefixcommons.curie_util import contract_uri
+    from ontobio.obograph_util import OboJsonMapper
+    with open('tests/resources/pato.json') as file:
+        doc = json.load(file)
+    mapper = OboJsonMapper(context={'FOO': 'http://purl.obolibrary.org/obo/PATO_00000'})
+    uris = set()
+    for og in doc['graphs']:
+        uris.update(n['id'] for n in og['nodes'])
+        for e in og['edges']:
+            uris.update([e['sub'], e['pred'], e['obj']])
+    uris.add('http://example.org/unknown')
+    for uri in uris:
+        curies = contract_uri(uri, cmaps=[mapper.context])
+        if len(curies) == 0:
+            curies = contract_uri(uri)
+        expected = sorted(curies, key=len)[0] if len(curies) > 0 else uri
+        assert mapper.contract_uri(uri) == expected
+    assert mapper.contract_uri('http://purl.obolibrary.org/obo/PATO_0000001') == 'FOO:01'
+
+def test_stream_json():
+    """
+    Streaming parse gives the same graph as parsing the whole document
+    """
+    from ontobio import obograph_util
+    for fn in ['tests/resources/pato.json', 'tests/resources/lexmap_test.json', 'tests/resources/nucleus.json']:
+        g = obograph_util.convert_json_file(fn)
+        # small chunks exercise values split across reads
+        with open(fn) as file:
+            events = list(obograph_util.iter_obograph_json(file, chunk_size=7))
+            file.seek(0)
+            gs = obograph_util.convert_json_stream(file)
+        assert ('graph_start', None) in events
+        assert gs['graphdoc'] is None
+        assert g['id'] == gs['id']
+        assert g['meta'] == gs['meta']
+        assert list(g['graph'].nodes(data=True)) == list(gs['graph'].nodes(data=True))
+        assert sorted(g['graph'].edges(data='pred')) == sorted(gs['graph'].edges(data='pred'))
+        assert sorted(g['xref_graph'].edges()) == sorted(gs['xref_graph'].edges())
+        assert len(g['logical_definitions']) == len(gs['logical_definitions'])
+
+    ont = OntologyFactory().create('tests/resources/pato.json', stream=True, snapshot=False)
+    assert ont.graphdoc is None
+    assert ont.label(PLOIDY) == 'ploidy'
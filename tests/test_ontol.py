@@ -7,3 +7,111 @@ def test_missing_node_is_none():
     ontology = ontol_factory.OntologyFactory().create("tests/resources/goslim_generic.json")
     
     assert ontology.node("GO:0") == None
+
+
+def test_closure_index_matches_traversal():
+    ontology = ontol_factory.OntologyFactory().create("tests/resources/go-truncated-pombase.json")
+    relation_sets = [None, ['subClassOf'], ['subClassOf', 'BFO:0000050']]
+    expected = {}
+    for rels in relation_sets:
+        for n in ontology.nodes():
+            for reflexive in [True, False]:
+                expected[(str(rels), n, reflexive)] = (set(ontology.ancestors(n, relations=rels, reflexive=reflexive)),
+                                                       set(ontology.descendants(n, relations=rels, reflexive=reflexive)))
+
+    for rels in relation_sets:
+        assert ontology.closure_index(rels) is None
+        ontology.build_closure_index(rels)
+        assert ontology.closure_index(rels) is not None
+        for n in ontology.nodes():
+            for reflexive in [True, False]:
+                ancs, descs = expected[(str(rels), n, reflexive)]
+                assert set(ontology.ancestors(n, relations=rels, reflexive=reflexive)) == ancs
+                assert set(ontology.descendants(n, relations=rels, reflexive=reflexive)) == descs
+
+    assert ontology.ancestors("GO:0", reflexive=True) == ["GO:0"]
+    assert ontology.descendants("GO:0") == []
+
+def test_closure_index_invalidated_on_add_parent():
+    ontology = ontol.Ontology()
+    ontology.add_node("X:1")
+    ontology.add_node("X:2")
+    ontology.add_parent("X:2", "X:1")
+    ontology.build_closure_index()
+    assert ontology.ancestors("X:2") == ["X:1"]
+
+    ontology.add_node("X:3")
+    ontology.add_parent("X:1", "X:3")
+    assert ontology.closure_index() is None
+    assert set(ontology.ancestors("X:2")) == {"X:1", "X:3"}
+
+def test_closure_index_cycles():
+    ontology = ontol.Ontology()
+    for n in ["X:1", "X:2", "X:3", "X:4"]:
+        ontology.add_node(n)
+    ontology.add_parent("X:2", "X:1")
+    ontology.add_parent("X:3", "X:2", relation="equivalentTo")
+    ontology.add_parent("X:2", "X:3", relation="equivalentTo")
+    ontology.add_parent("X:4", "X:3")
+    ix = ontology.build_closure_index()
+    assert set(ix.ancestors("X:4")) == {"X:1", "X:2", "X:3"}
+    assert set(ix.ancestors("X:2")) == {"X:1", "X:3"}
+    assert set(ix.descendants("X:1", reflexive=True)) == {"X:1", "X:2", "X:3", "X:4"}
+
+def test_adjacency_index_matches_edge_scan():
+    ontology = ontol_factory.OntologyFactory().create("tests/resources/go-truncated-pombase.json")
+    relation_sets = [['subClassOf'], ['BFO:0000050'], ['subClassOf', 'BFO:0000050'], []]
+    ontology.use_adjacency_index = False
+    expected = {(str(rels), n): (set(ontology.parents(n, relations=rels)), set(ontology.children(n, relations=rels)))
+                for rels in relation_sets for n in ontology.nodes()}
+    ontology.use_adjacency_index = True
+    for rels in relation_sets:
+        for n in ontology.nodes():
+            parents = ontology.parents(n, relations=rels)
+            children = ontology.children(n, relations=rels)
+            assert len(parents) == len(set(parents))
+            assert (set(parents), set(children)) == expected[(str(rels), n)]
+
+def test_adjacency_index_invalidated_on_add_parent():
+    ontology = ontol.Ontology()
+    ontology.use_adjacency_index = True
+    for n in ["X:1", "X:2", "X:3"]:
+        ontology.add_node(n)
+    ontology.add_parent("X:2", "X:1")
+    assert ontology.parents("X:2", relations=["subClassOf"]) == ["X:1"]
+    ontology.add_parent("X:2", "X:3", relation="BFO:0000050")
+    assert ontology.parents("X:2", relations=["BFO:0000050"]) == ["X:3"]
+    assert ontology.children("X:3", relations=["subClassOf", "BFO:0000050"]) == ["X:2"]
+
+def test_parents_see_direct_graph_edits():
+    ontology = ontol.Ontology()
+    for n in ["X:1", "X:2", "X:3"]:
+        ontology.add_node(n)
+    ontology.add_parent("X:2", "X:1")
+    assert ontology.parents("X:2", relations=["subClassOf"]) == ["X:1"]
+    ontology.get_graph().add_edge("X:3", "X:2", pred="subClassOf")
+    assert set(ontology.parents("X:2", relations=["subClassOf"])) == {"X:1", "X:3"}
+    ontology.get_graph().remove_edge("X:1", "X:2")
+    assert ontology.children("X:1", relations=["subClassOf"]) == []
+
+def test_filtered_graph_cached_view():
+    ontology = ontol_factory.OntologyFactory().create("tests/resources/go-truncated-pombase.json")
+    g = ontology.get_graph()
+    fg = ontology.get_filtered_graph(relations=['subClassOf'])
+    assert ontology.get_filtered_graph(relations=['subClassOf']) is fg
+    assert set(fg.nodes()) == set(g.nodes())
+    expected_edges = [(x, y) for (x, y, d) in g.edges(data=True) if d['pred'] == 'subClassOf']
+    assert sorted(fg.edges()) == sorted(expected_edges)
+
+    pg = ontology.get_filtered_graph(relations=['subClassOf'], prefix='GO')
+    assert pg is not fg
+    assert all(n.startswith('GO:') for n in pg.nodes())
+
+    # a mutable copy is returned for subontologies
+    subont = ontology.subontology(relations=['subClassOf'])
+    subont.add_parent('GO:0005634', 'GO:0008150')
+
+    ontology.add_parent('GO:0005634', 'GO:0008150')
+    fg2 = ontology.get_filtered_graph(relations=['subClassOf'])
+    assert fg2 is not fg
+    assert fg2.has_edge('GO:0008150', 'GO:0005634')
@@ -0,0 +1,165 @@
+from ontobio.ontol_factory import OntologyFactory
+from ontobio import ontol_snapshot
+from ontobio.cgraph import CompactOntology
+import os
+import pytest
+
+NUCLEUS = "tests/resources/nucleus.json"
+GO = "tests/resources/go-truncated-pombase.json"
+
+NUCLEUS_ID = 'GO:0005634'
+
+
+@pytest.fixture
+def snapshot_dir(tmpdir, monkeypatch):
+    d = str(tmpdir.join('snapshots'))
+    monkeypatch.setenv('ONTOBIO_SNAPSHOT_DIR', d)
+    return d
+
+
+def _compare(ont, ont2):
+    assert ont.id == ont2.id
+    assert sorted(ont.nodes()) == sorted(ont2.nodes())
+    for n in ont.nodes():
+        assert ont.label(n) == ont2.label(n)
+        assert set(ont.parents(n)) == set(ont2.parents(n))
+        assert sorted(map(str, ont.synonyms(n))) == sorted(map(str, ont2.synonyms(n)))
+        assert str(ont.text_definition(n)) == str(ont2.text_definition(n))
+        assert ont.xrefs(n) == ont2.xrefs(n)
+    assert set(ont.ancestors(NUCLEUS_ID, relations=['subClassOf'])) == \
+        set(ont2.ancestors(NUCLEUS_ID, relations=['subClassOf']))
+    ldefs = sorted([(ld.class_id, ld.genus_ids, ld.restrictions) for ld in ont.all_logical_definitions])
+    ldefs2 = sorted([(ld.class_id, ld.genus_ids, ld.restrictions) for ld in ont2.all_logical_definitions])
+    assert ldefs == ldefs2
+
+
+@pytest.mark.parametrize("fn", [NUCLEUS, GO])
+def test_snapshot_roundtrip(fn, snapshot_dir):
+    """
+    networkx ontology survives a snapshot write/load
+    """
+    ont = OntologyFactory().create(fn, snapshot=False)
+    path = ontol_snapshot.snapshot_path(fn)
+    ontol_snapshot.write_snapshot(ont, path)
+    assert os.path.isfile(os.path.join(path, ontol_snapshot.MANIFEST))
+
+    ont2 = ontol_snapshot.load_snapshot(path, handle=fn)
+    _compare(ont, ont2)
+    assert ont.get_graph().number_of_edges() == ont2.get_graph().number_of_edges()
+
+    cont = ontol_snapshot.load_snapshot(path, handle=fn, compact=True)
+    assert isinstance(cont, CompactOntology)
+    _compare(ont, cont)
+
+
+def test_snapshot_from_compact(snapshot_dir):
+    """
+    CompactOntology can be written to a snapshot and reloaded as either implementation
+    """
+    cont = OntologyFactory().create(NUCLEUS, compact=True, snapshot=False)
+    path = ontol_snapshot.snapshot_path(NUCLEUS)
+    ontol_snapshot.write_snapshot(cont, path)
+    _compare(cont, ontol_snapshot.load_snapshot(path, compact=True))
+    _compare(cont, ontol_snapshot.load_snapshot(path, mmap=False))
+
+
+def test_factory_uses_snapshot(snapshot_dir):
+    """
+    factory writes a snapshot on first load and reads it subsequently
+    """
+    factory = OntologyFactory()
+    ont = factory.create(NUCLEUS, snapshot=True)
+    path = ontol_snapshot.snapshot_path(NUCLEUS)
+    assert os.path.isdir(path)
+    assert ont.graphdoc is not None
+
+    ont2 = factory.create(NUCLEUS, snapshot=True)
+    # the graphdoc is loaded from the snapshot on first access; both loads agree
+    assert ont2.graphdoc_loader is not None
+    assert ont2.graphdoc == ont.graphdoc
+    _compare(ont, ont2)
+    assert list(ont2.get_graph().edges(keys=True, data=True)) == list(ont.get_graph().edges(keys=True, data=True))
+
+    ont3 = factory.create(NUCLEUS, snapshot=True, retain_graphdoc=False)
+    assert ont3.graphdoc is None
+    _compare(ont, ont3)
+
+
+def test_factory_snapshot_default(snapshot_dir):
+    """
+    snapshots are only used by default for compact ontologies
+    """
+    factory = OntologyFactory()
+    factory.create(NUCLEUS)
+    assert not os.path.exists(snapshot_dir)
+    factory.create(NUCLEUS, compact=True)
+    assert os.path.isdir(ontol_snapshot.snapshot_path(NUCLEUS))
+
+
+def test_snapshot_edges(snapshot_dir):
+    """
+    duplicate edges, edge order and edge attributes survive a snapshot
+    """
+    ont = OntologyFactory().create(NUCLEUS, snapshot=False)
+    g = ont.get_graph()
+    (p, c) = next((p, c) for (p, c, d) in g.edges(data=True) if d['pred'] == 'subClassOf')
+    g.add_edge(p, c, pred='subClassOf')
+    g.add_edge(p, c, pred='subClassOf', source='test')
+    g.add_edge(c, p, pred='BFO:0000050', source='test2')
+    path = ontol_snapshot.snapshot_path(NUCLEUS)
+    ontol_snapshot.write_snapshot(ont, path)
+    g2 = ontol_snapshot.load_snapshot(path).get_graph()
+    assert list(g2.edges(keys=True, data=True)) == list(g.edges(keys=True, data=True))
+    assert list(g2.nodes(data=True)) == list(g.nodes(data=True))
+    assert g2.number_of_edges(p, c) == 3
+
+
+def test_snapshot_prunes_stale(snapshot_dir, tmpdir):
+    """
+    writing a snapshot for a modified file removes the snapshot of the earlier version
+    """
+    fn = str(tmpdir.join('copy.json'))
+    with open(NUCLEUS) as src, open(fn, 'w') as dest:
+        # not identical to NUCLEUS, which would share its snapshot
+        dest.write(src.read() + " ")
+    factory = OntologyFactory()
+    factory.create(fn, snapshot=True)
+    factory.create(fn, compact=True, parse_meta=False)
+    old_paths = [ontol_snapshot.snapshot_path(fn), ontol_snapshot.snapshot_path(fn, parse_meta=False)]
+    assert all(os.path.isdir(p) for p in old_paths)
+    factory.create(NUCLEUS, snapshot=True)
+
+    with open(fn, 'a') as dest:
+        dest.write("\n")
+    factory.create(fn, snapshot=True)
+    assert os.path.isdir(ontol_snapshot.snapshot_path(fn))
+    assert not any(os.path.isdir(p) for p in old_paths)
+    # snapshots of other files are kept
+    assert os.path.isdir(ontol_snapshot.snapshot_path(NUCLEUS))
+
+
+def test_snapshot_many_types(snapshot_dir):
+    """
+    node types are not limited to a single byte
+    """
+    ont = OntologyFactory().create(NUCLEUS, snapshot=False)
+    for (i, n) in enumerate(ont.nodes()):
+        ont.node(n)['type'] = 'TYPE{}'.format(i % 300)
+    path = ontol_snapshot.snapshot_path(NUCLEUS)
+    ontol_snapshot.write_snapshot(ont, path)
+    cont = ontol_snapshot.load_snapshot(path, compact=True)
+    for n in ont.nodes():
+        assert cont.node_type(n) == ont.node_type(n)
+
+
+def test_snapshot_key(snapshot_dir, tmpdir):
+    """
+    snapshot key changes with file contents
+    """
+    fn = str(tmpdir.join('copy.json'))
+    with open(NUCLEUS) as src, open(fn, 'w') as dest:
+        dest.write(src.read())
+    path = ontol_snapshot.snapshot_path(fn)
+    with open(fn, 'a') as dest:
+        dest.write("\n")
+    assert ontol_snapshot.snapshot_path(fn) != path
@@ -732,6 +732,51 @@ def test_all_rules():
     assert test_results[qc.GoRules.GoRule26.value].result_type == qc.ResultType.PASS
     assert test_results[qc.GoRules.GoRule29.value].result_type == qc.ResultType.PASS
 
+def test_compiled_rules():
+    config = assocparser.AssocParserConfig(ontology=ontology)
+    plan = qc.compile_rules(config)
+    assert qc.compile_rules(config) is plan
+    # No inferences, GO_REF metadata, or import context: these rules can never fire
+    for rule in [qc.GoRules.GoRule13, qc.GoRules.GoRule43, qc.GoRules.GoRule57, qc.GoRules.GoRule58]:
+        assert rule.value not in plan.rules
+    assert len(plan.rule_numbers) == len(qc.GoRules)
+
+    config.rule_contexts = ["import"]
+    config.group_metadata = {"filter_out": {"evidence": ["ECO:0000305"]}}
+    plan = qc.compile_rules(config)
+    assert qc.GoRules.GoRule57.value in plan.rules
+    assert qc.GoRules.GoRule58.value not in plan.rules
+
+    a = ["PomBase", "SPAC1", "blah", "", "GO:0006397", "PMID:1", "IC", "", "P", "", "", "protein", "taxon:4896", "20180330", "PomBase"]
+    rules = plan.rules_for(gafparser.to_association(a).associations[0])
+    assert qc.GoRules.GoRule16.value in rules
+    assert qc.GoRules.GoRule17.value not in rules
+    assert qc.GoRules.GoRule39.value not in rules
+
+    # Compiled rules find the same violations as running every rule
+    for (evidence, goid, withfrom) in [("IC", "GO:0006397", ""), ("IDA", "GO:0005575", "PomBase:SPAC1"), ("IPI", "GO:0003824", ""), ("IEA", "GO:0006397", ""), ("ISS", "GO:0006397", "PomBase:SPAC1")]:
+        a[4] = goid
+        a[6] = evidence
+        a[7] = withfrom
+        expected = qc.test_go_rules(gafparser.to_association(a).associations[0], config)
+        compiled = qc.run_go_rules(gafparser.to_association(a).associations[0], config)
+        expected_failures = {rule.id: result.result_type for (rule, result) in expected.all_results.items() if result.result_type != qc.ResultType.PASS}
+        assert {rule.id: result.result_type for (rule, result) in compiled.all_results.items()} == expected_failures
+        assert compiled.annotation == expected.annotation
+
+def test_compiled_rules_report():
+    gaf = ["PomBase", "SPAC1", "blah", "", "GO:0006397", "PMID:1", "IDA", "PomBase:SPAC2", "P", "", "", "protein", "taxon:4896", "20180330", "PomBase"]
+    reports = []
+    for report_rule_passes in [True, False]:
+        p = gafparser.GafParser(config=assocparser.AssocParserConfig(ontology=ontology, report_rule_passes=report_rule_passes))
+        p.parse_line("\t".join(gaf))
+        reports.append(p.report.to_report_json())
+
+    # The report lists every rule whether or not passes are reported
+    assert reports[0] == reports[1]
+    assert "gorule-0000013" in reports[1]["messages"]
+    assert len(reports[1]["messages"]["gorule-0000017"]) == 1
+
 
 if __name__ == "__main__":
     pytest.main(args=["tests/test_qc.py"])
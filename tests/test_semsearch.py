@@ -5,7 +5,11 @@ from ontobio.io.gafparser import GafParser
 from ontobio.assoc_factory import AssociationSetFactory
 from ontobio.ontol_factory import OntologyFactory
 from ontobio.sim.api.semsearch import SemSearchEngine
+from ontobio.sim.profile_index import ProfileIndex
+from ontobio.vocabulary.similarity import SimAlgorithm
+import numpy as np
 import logging
+import math
 
 POMBASE = "tests/resources/truncated-pombase.gaf"
 ONT = "tests/resources/go-truncated-pombase.json"
@@ -51,3 +55,146 @@ def test_semsearch():
             tups = sse.pw_score_resnik_bestmatches(i,j)
             print('{} x {} = {} // {}'.format(i,j,sim, tups))
     
+
+
+def _semsearch_engine():
+    ont = OntologyFactory().create(ONT)
+    assocs = GafParser().parse(POMBASE, skipheader=True)
+    assocs = [a for a in assocs if a['subject']['label'] in GENES]
+    aset = AssociationSetFactory().create_from_assocs(assocs, ontology=ont)
+    aset.ontology = aset.subontology()
+    return SemSearchEngine(assocmodel=aset)
+
+
+def test_mica_matrix(tmpdir):
+    """
+    MICA ICs agree with comparing ancestor sets pairwise, in each storage mode
+    """
+    sse = _semsearch_engine()
+    sse.calculate_all_micas(include_micas=True)
+    ics = sse.ics
+    classes = list(sse.mica_ic_df.index)
+    for c1 in classes:
+        for c2 in classes:
+            common = (sse._ancestors(c1) | {c1}) & (sse._ancestors(c2) | {c2})
+            expected = max([ics[a] for a in common], default=0)
+            assert sse.mica_ic_df.loc[c1, c2] == expected
+            assert sse.mica_df.loc[c1, c2] == set(a for a in common if ics[a] == expected)
+
+    path = str(tmpdir.join('mica.npy'))
+    for kwargs in [dict(triangular=True),
+                   dict(triangular=True, dtype=np.float32, path=path, block_size=5)]:
+        sse2 = _semsearch_engine()
+        sse2.calculate_all_micas(**kwargs)
+        m = sse2.mica_matrix
+        assert np.allclose(m.frame().values, sse.mica_ic_df.values)
+        assert np.allclose(m.submatrix(classes[3:9], classes[0:4]), sse.mica_ic_df.loc[classes[3:9], classes[0:4]].values)
+        assert abs(m.ic(classes[7], classes[2]) - sse.mica_ic_df.loc[classes[7], classes[2]]) < 1e-5
+    assert np.allclose(np.load(path), sse2.mica_matrix.data)
+
+
+def test_search():
+    """
+    search ranks every subject by its score as compared with the query
+    """
+    sse = _semsearch_engine()
+    aset = sse.assocmodel
+    query = ['GO:0005737', 'GO:0030864', 'GO:0044430']
+    assert set(sse.matchers()) == {SimAlgorithm.PHENODIGM, SimAlgorithm.JACCARD, SimAlgorithm.SIM_GIC,
+                                   SimAlgorithm.RESNIK, SimAlgorithm.SYMMETRIC_RESNIK}
+    for method in sse.matchers():
+        result = sse.search(query + ['FOO:1'], [], limit=None, method=method)
+        assert [n.id for n in result.query.ids] == query
+        assert result.query.unresolved_ids == ['FOO:1']
+        scores = {m.id: m.score for m in result.matches}
+        for s in aset.subjects:
+            expected = sse.compare(query, aset.annotations(s), method=method).matches[0].score
+            assert abs(scores.get(s, 0) - expected) < 1e-9
+        for (m1, m2) in zip(result.matches, result.matches[1:]):
+            assert m1.score >= m2.score
+            assert m2.rank == m1.rank + (1 if m1.score > m2.score else 0)
+        top = sse.search(query, [], limit=1, method=method)
+        assert [m.id for m in top.matches] == [m.id for m in result.matches[0:1]]
+        for m in top.matches:
+            assert {p.reference.id for p in m.pairwise_match} <= set(query)
+            for p in m.pairwise_match:
+                assert p.match.id in aset.annotations(m.id)
+                assert p.lcs.IC <= min(p.reference.IC, p.match.IC)
+
+
+def test_compare_resnik():
+    """
+    symmetric resnik agrees with the best match average of MICA ICs
+    """
+    sse = _semsearch_engine()
+    sse.calculate_all_micas()
+    aset = sse.assocmodel
+    for s1 in aset.subjects:
+        for s2 in aset.subjects:
+            (bma, _, _) = sse.pw_score_resnik_bestmatches(s1, s2)
+            result = sse.compare(aset.annotations(s1), aset.annotations(s2), method=SimAlgorithm.SYMMETRIC_RESNIK)
+            assert abs(result.matches[0].score - bma) < 1e-9
+            assert result.matches[0].rank == "NaN"
+    result = sse.compare(aset.annotations(s1), aset.annotations(s1))
+    assert abs(result.matches[0].score - 100) < 1e-9
+
+
+def _phenodigm(aset, query, profile):
+    """
+    Phenodigm score of a subject profile compared with a query, computed directly from ancestor sets
+    """
+    n = len(aset.subjects)
+    counts = {}
+    for s in aset.subjects:
+        for c in aset.inferred_types(s):
+            counts[c] = counts.get(c, 0) + 1
+    ics = {c: -math.log2(k / n) for (c, k) in counts.items()}
+
+    def ancestors(c):
+        return set(a for a in aset.termset_ancestors([c]) if a in ics)
+
+    def pair_scores(q, t):
+        scores = []
+        for c1 in q:
+            row = []
+            for c2 in t:
+                (a1, a2) = (ancestors(c1), ancestors(c2))
+                common = a1 & a2
+                mica_ic = max([ics[a] for a in common], default=0)
+                row.append(math.sqrt(mica_ic * len(common) / len(a1 | a2)))
+            scores.append(row)
+        return scores
+
+    def max_avg(scores):
+        row_max = [max(r) for r in scores]
+        col_max = [max(col) for col in zip(*scores)]
+        return (max(row_max), (sum(row_max) + sum(col_max)) / (len(row_max) + len(col_max)))
+
+    (max_opt, avg_opt) = max_avg(pair_scores(query, query))
+    (max_score, avg_score) = max_avg(pair_scores(query, profile))
+    return 100 * (max_score / max_opt + avg_score / avg_opt) / 2
+
+
+def test_search_phenodigm_top_k(caplog):
+    """
+    Phenodigm search, pruned to the top k in small batches, agrees with scoring every subject
+    """
+    ont = OntologyFactory().create(ONT)
+    assocs = GafParser().parse(POMBASE, skipheader=True)
+    aset = AssociationSetFactory().create_from_assocs(assocs, ontology=ont)
+    index = ProfileIndex(aset, batch_size=2)
+    for query in [['GO:0005737', 'GO:0030864', 'GO:0044430'],
+                  ['GO:0051286', 'GO:0003690', 'GO:0000775', 'GO:0051403']]:
+        ranking = index.search(query, limit=None)
+        assert len(ranking) > 3
+        for (row, score) in ranking:
+            s = index.subjects[row]
+            assert abs(score - _phenodigm(aset, query, list(set(aset.annotations(s))))) < 1e-9
+        for k in (1, 3):
+            caplog.clear()
+            with caplog.at_level(logging.DEBUG, logger='ontobio.sim.profile_index'):
+                top = index.search(query, limit=k)
+            assert top == ranking[0:k]
+            # candidates are pruned
+            (scored, total) = [int(w) for w in caplog.messages[-1].split() if w.isdigit()]
+            assert scored < total